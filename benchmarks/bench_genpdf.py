@@ -0,0 +1,125 @@
+"""Throughput benchmark for discovery, patching and rendering.
+
+Generates synthetic corpora (see corpus.py), puts the fake chordpro from
+fake_chordpro.py first on PATH and times each stage of a genpdf run, with
+serial and parallel rendering. No real chordpro installation is needed.
+
+    python -m benchmarks.bench_genpdf --sizes 100,1000 --jobs 1,8
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks import fake_chordpro
+from benchmarks.corpus import generateCorpus
+from genpdf_butler import Discovery, GenPDF, PatchTextColor
+
+
+def _timed(fn, *args, **kwargs):
+    # genpdf reports through logging, which the benchmark leaves
+    # unconfigured, so only warnings reach the terminal during a timing
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchCorpus(root, jobsList):
+    results = {}
+    songs, results["discovery"] = _timed(
+        lambda: list(Discovery.findSongs(root))
+    )
+    results["songs"] = len(songs)
+    # Staged rendering re-patches every song into a temp dir; in-place
+    # patching is timed separately (and left in place for the renders)
+    for jobs in jobsList:
+        _, results[f"render_staged_jobs{jobs}"] = _timed(
+            GenPDF.createPDFs,
+            root,
+            "a6",
+            "false",
+            jobs=jobs,
+            staged=True,
+            songs=songs,
+        )
+    _, results["patch"] = _timed(PatchTextColor.PatchColors, root, songs=songs)
+    for jobs in jobsList:
+        _, results[f"render_jobs{jobs}"] = _timed(
+            GenPDF.createPDFs, root, "a6", "false", jobs=jobs, songs=songs
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default="100,1000,10000",
+        help="comma-separated corpus sizes (default: 100,1000,10000)",
+    )
+    parser.add_argument(
+        "--jobs",
+        default=f"1,{os.cpu_count() or 1}",
+        help="comma-separated worker counts to compare",
+    )
+    parser.add_argument(
+        "--blue-density",
+        type=float,
+        default=0.2,
+        help="fraction of lyric lines marked with &blue",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="seconds each fake chordpro render takes",
+    )
+    parser.add_argument("--json", metavar="PATH", help="also write results")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    jobsList = [int(jobs) for jobs in args.jobs.split(",")]
+
+    allResults = []
+    with tempfile.TemporaryDirectory(prefix="genpdf-bench-") as tmp:
+        fake_chordpro.install(os.path.join(tmp, "bin"))
+        os.environ["PATH"] = (
+            os.path.join(tmp, "bin")
+            + os.pathsep
+            + (os.environ.get("PATH", ""))
+        )
+        os.environ["GENPDF_FAKE_CHORDPRO_LATENCY"] = str(args.latency)
+
+        for size in sizes:
+            root = os.path.join(tmp, f"corpus{size}")
+            generateCorpus(root, size, args.blue_density)
+            results = {"size": size, **benchCorpus(root, jobsList)}
+            allResults.append(results)
+            print(
+                " ".join(
+                    (
+                        f"{name}={value:.3f}s"
+                        if isinstance(value, float)
+                        else f"{name}={value}"
+                    )
+                    for name, value in results.items()
+                )
+            )
+
+    if args.json:
+        with open(args.json, mode="w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "latency": args.latency,
+                    "blueDensity": args.blue_density,
+                    "results": allResults,
+                },
+                f,
+                indent=1,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Start-up benchmark for the genpdf entry point.
+
+Times `genpdf --help` in fresh interpreters and lists the slowest imports
+reported by `python -X importtime`, so start-up regressions (such as
+GenPDF or GitPython being imported eagerly again) are easy to spot. With
+--max-ms the script exits non-zero when the median exceeds the budget.
+
+    python -m benchmarks.bench_import --runs 20 --max-ms 150
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+HELP = [sys.executable, "-m", "genpdf_butler", "--help"]
+
+
+def helpTimes(runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(HELP, check=True, stdout=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def slowestImports(count):
+    # -X importtime writes "import time: self | cumulative | name" to stderr
+    result = subprocess.run(
+        HELP[:1] + ["-X", "importtime"] + HELP[1:],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split(":", 1)[1].split("|")
+        rows.append((int(cumulative) / 1000, name.rstrip()))
+    return sorted(rows, reverse=True)[:count], {
+        name.strip() for _, name in rows
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        help="fail if the median `genpdf --help` time exceeds this",
+    )
+    args = parser.parse_args()
+
+    times = helpTimes(args.runs)
+    median = statistics.median(times)
+    print(
+        f"genpdf --help: median {median:.1f} ms, "
+        f"min {min(times):.1f} ms over {args.runs} runs"
+    )
+
+    slowest, modules = slowestImports(args.top)
+    print("slowest imports (cumulative ms):")
+    for ms, name in slowest:
+        print(f"  {ms:8.1f}  {name}")
+    for heavy in ("git", "genpdf_butler.GenPDF", "concurrent.futures"):
+        if heavy in modules:
+            print(f"warning: {heavy} is imported by `genpdf --help`")
+
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"median exceeds the {args.max_ms:.1f} ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Synthetic song corpora for benchmarking genpdf without real songs."""
+
+import argparse
+import random
+from pathlib import Path
+
+CHORDS = ["C", "G", "Am", "F", "D", "Em", "A7", "G7", "Dm", "E7"]
+WORDS = (
+    "down by the river where the willows grow i met my darling long ago "
+    "sing me a song of the mountain high and the lonesome wind in the sky"
+).split()
+
+
+def _lyric(rng, chorded):
+    words = rng.sample(WORDS, rng.randint(5, 9))
+    if chorded:
+        for i in sorted(rng.sample(range(len(words)), 2), reverse=True):
+            words[i] = f"[{rng.choice(CHORDS)}]{words[i]}"
+    return " ".join(words)
+
+
+def songText(rng, index, blueDensity):
+    lines = [
+        f"{{title: Song {index}}}",
+        f"{{artist: Artist {index % 37}}}",
+        f"{{key: {rng.choice(CHORDS[:6])}}}",
+        "",
+    ]
+    for verse in range(rng.randint(3, 6)):
+        lines.append(f"{{comment: Verse {verse + 1}}}")
+        for _ in range(4):
+            line = _lyric(rng, chorded=True)
+            # OnSong highlight markup, as PatchTextColor expects to find it
+            if rng.random() < blueDensity:
+                line = "&blue: " + line
+            lines.append(line)
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def generateCorpus(root, count, blueDensity=0.2, folders=10, seed=0):
+    """Write count songs below root, spread over folders.
+
+    Roughly one song in four is a .cho file; the rest are .chopro. The same
+    arguments always produce the same corpus.
+
+    Returns:
+        List of Path objects for the generated songs
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    songs = []
+    for index in range(count):
+        folder = root / f"folder{index % max(folders, 1):03d}"
+        folder.mkdir(parents=True, exist_ok=True)
+        suffix = ".cho" if index % 4 == 3 else ".chopro"
+        song = folder / f"song{index:05d}{suffix}"
+        song.write_text(songText(rng, index, blueDensity), encoding="utf-8")
+        songs.append(song)
+    return songs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=generateCorpus.__doc__)
+    parser.add_argument("root", help="directory to create the songs in")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument(
+        "--blue-density",
+        type=float,
+        default=0.2,
+        help="fraction of lyric lines marked with &blue",
+    )
+    parser.add_argument("--folders", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    songs = generateCorpus(
+        args.root, args.count, args.blue_density, args.folders, args.seed
+    )
+    print(f"wrote {len(songs)} songs to {args.root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Stand-in for the chordpro CLI, for benchmarks and integration tests.
+
+Accepts chordpro's command line, sleeps for GENPDF_FAKE_CHORDPRO_LATENCY
+seconds (default 0.05) to imitate Perl start-up and layout, then writes a
+small PDF listing its input files to the --output path. Like chordpro's,
+the PDF carries the time it was made and a random document ID. Set
+GENPDF_FAKE_CHORDPRO_FAIL to a substring of a song path to make renders of
+matching songs fail, or GENPDF_FAKE_CHORDPRO_HANG to make them write half a
+PDF and then hang.
+"""
+
+import hashlib
+import os
+import sys
+import time
+
+VERSION = "ChordPro fake 0.0"
+
+
+def pdfBytes(lines):
+    # A minimal single-page PDF with one text line per input file
+    stamp = time.strftime("%Y%m%d%H%M%S").encode()
+    fileId = os.urandom(16).hex().encode()
+    escaped = [
+        line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        for line in lines
+    ]
+    text = " ".join(f"({line}) Tj T*" for line in escaped)
+    content = f"BT /F1 8 Tf 10 TL 20 400 Td {text} ET".encode(
+        "latin-1", errors="replace"
+    )
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 298 420] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content),
+        b"<< /Producer (ChordPro fake) /CreationDate (D:%s) "
+        b"/ModDate (D:%s) >>" % (stamp, stamp),
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += (
+        b"trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R /ID [<%s> <%s>] >>\n"
+        b"startxref\n%d\n%%%%EOF\n"
+        % (len(objects) + 1, len(objects), fileId, fileId, xref)
+    )
+    return bytes(out)
+
+
+def main(argv):
+    if "--version" in argv:
+        print(VERSION)
+        return 0
+
+    output = None
+    songs = []
+    for arg in argv:
+        if arg.startswith("--output="):
+            output = arg.split("=", 1)[1]
+        elif not arg.startswith("-"):
+            songs.append(arg)
+
+    hang = os.environ.get("GENPDF_FAKE_CHORDPRO_HANG")
+    if hang and output and any(hang in song for song in songs):
+        with open(output, mode="wb") as f:
+            f.write(pdfBytes(songs)[:64])
+        time.sleep(3600)
+
+    time.sleep(float(os.environ.get("GENPDF_FAKE_CHORDPRO_LATENCY", "0.05")))
+
+    fail = os.environ.get("GENPDF_FAKE_CHORDPRO_FAIL")
+    if fail and any(fail in song for song in songs):
+        print(f"fake chordpro: refusing to render {songs}", file=sys.stderr)
+        return 1
+    if output is None or not songs:
+        print("fake chordpro: need --output and songs", file=sys.stderr)
+        return 2
+
+    lines = []
+    for song in songs:
+        with open(song, mode="rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:16]
+        lines.append(f"{os.path.basename(song)} {digest}")
+    with open(output, mode="wb") as f:
+        f.write(pdfBytes(lines))
+    return 0
+
+
+def install(binDir):
+    """Put an executable called chordpro into binDir that runs this stub.
+
+    Returns:
+        Path of the installed executable
+    """
+    os.makedirs(binDir, exist_ok=True)
+    target = os.path.join(binDir, "chordpro")
+    with open(target, mode="w", encoding="utf-8") as f:
+        f.write(
+            f"#!/bin/sh\nexec '{sys.executable}' "
+            f"'{os.path.abspath(__file__)}' \"$@\"\n"
+        )
+    os.chmod(target, 0o755)
+    return target
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from genpdf_butler import Output
+
+# Default bound on the total size of cached PDFs
+DEFAULT_SIZE = 1 << 30
+
+# Temp files older than this were left behind by a crashed writer
+STALE_TMP_SECONDS = 3600
+
+
+def defaultCacheDir():
+    # Shared by every checkout on the host, following the XDG layout
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "genpdf_butler")
+
+
+def cacheKey(fingerprint):
+    # The fingerprint already covers the patched source, the chordpro
+    # settings and the chordpro version
+    text = json.dumps(fingerprint, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def entryPath(cacheDir, key):
+    return os.path.join(cacheDir, "pdf", key[:2], key + ".pdf")
+
+
+def _publish(path, write):
+    # Build the file beside its destination and rename it into place, so
+    # readers only ever see complete files and concurrent writers of the
+    # same key simply replace each other's identical copy
+    directory = os.path.dirname(path) or os.curdir
+    os.makedirs(directory, exist_ok=True)
+    fd, tmpPath = tempfile.mkstemp(
+        prefix=".genpdf-", suffix=".tmp", dir=directory
+    )
+    os.close(fd)
+    try:
+        write(tmpPath)
+        os.replace(tmpPath, path)
+    except BaseException:
+        try:
+            os.unlink(tmpPath)
+        except OSError:
+            pass
+        raise
+
+
+def fetch(cacheDir, key, output):
+    entry = entryPath(cacheDir, key)
+    if not os.path.exists(entry):
+        return False
+    if os.path.exists(output) and os.path.samefile(entry, output):
+        # Hardlinked by an earlier version: refreshing the entry would touch
+        # the output too
+        return True
+    if not Output.samePDF(entry, output):
+        # Handed out as a copy, so that refreshing the entry below never
+        # changes the mtime of outputs in other checkouts; an output with
+        # the same content keeps its mtime
+        try:
+            _publish(output, lambda tmpPath: shutil.copyfile(entry, tmpPath))
+        except OSError:
+            return False
+    try:
+        # Hits refresh the entry for LRU eviction
+        os.utime(entry)
+    except OSError:
+        pass
+    return True
+
+
+def store(cacheDir, key, pdf):
+    # Stored as a copy: other tools may still rewrite the output in place
+    try:
+        _publish(
+            entryPath(cacheDir, key),
+            lambda tmpPath: shutil.copyfile(pdf, tmpPath),
+        )
+    except OSError:
+        return False
+    return True
+
+
+def evict(cacheDir, maxBytes=DEFAULT_SIZE):
+    entries = []
+    total = 0
+    now = time.time()
+    for dirpath, dirnames, filenames in os.walk(os.path.join(cacheDir, "pdf")):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if name.endswith(".tmp"):
+                if now - st.st_mtime > STALE_TMP_SECONDS:
+                    _remove(path)
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+    # Least recently used first; another process may be evicting the same
+    # entries, so missing files are not an error
+    entries.sort()
+    removed = 0
+    for mtime, size, path in entries:
+        if total <= maxBytes:
+            break
+        if _remove(path):
+            removed += 1
+        total -= size
+    return removed
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        return False
+    return True
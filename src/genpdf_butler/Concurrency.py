@@ -0,0 +1,151 @@
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Seconds between looks at memory and load when scaling renders
+ADJUST_INTERVAL = 2.0
+
+# What one render is assumed to need before any has been measured; chordpro
+# loads Perl, its fonts and its config for every song
+DEFAULT_RENDER_BYTES = 300 << 20
+
+# Another render is only started with this many renders' worth of memory
+# still available, and one is shed once less than one is left
+MEMORY_HEADROOM = 2.0
+
+# Load average per CPU above which renders are shed, and below which more
+# may be started
+LOAD_HIGH = 1.25
+LOAD_LOW = 0.9
+
+
+def parseJobs(text):
+    # "N" for a fixed number of renders, "MIN:MAX" to adapt between bounds,
+    # or "auto" to adapt between one and the number of CPUs
+    if text == "auto":
+        return 1, os.cpu_count() or 1
+    try:
+        low, sep, high = text.partition(":")
+        bounds = (int(low), int(high)) if sep else (int(low), int(low))
+    except ValueError:
+        raise ValueError(f"--jobs must be N, MIN:MAX or auto, not '{text}'")
+    if bounds[0] < 1 or bounds[1] < bounds[0]:
+        raise ValueError(f"--jobs {text}: need 1 <= MIN <= MAX")
+    return bounds
+
+
+def newGovernor(minJobs, maxJobs):
+    # Renders start cautiously at the lower bound and are scaled from there
+    now = time.monotonic()
+    return {
+        "min": minJobs,
+        "max": maxJobs,
+        "limit": minJobs,
+        "active": 0,
+        "condition": threading.Condition(),
+        "checked": now,
+        "renderBytes": None,
+    }
+
+
+def acquire(governor, cancelled):
+    # Block a worker until the current limit allows another render; False
+    # once the build is cancelled
+    with governor["condition"]:
+        while governor["active"] >= governor["limit"]:
+            if cancelled.is_set():
+                return False
+            governor["condition"].wait(0.5)
+        if cancelled.is_set():
+            return False
+        governor["active"] += 1
+    return True
+
+
+def release(governor):
+    with governor["condition"]:
+        governor["active"] -= 1
+        governor["condition"].notify()
+
+
+def adjust(governor, processes, now=None):
+    # Move the limit one step towards what memory and load allow
+    now = now or time.monotonic()
+    if now - governor["checked"] < ADJUST_INTERVAL:
+        return
+    governor["checked"] = now
+
+    sizes = [_treeRss(process.pid) for process in processes]
+    sizes = [size for size in sizes if size]
+    if sizes:
+        governor["renderBytes"] = max(governor["renderBytes"] or 0, max(sizes))
+    need = governor["renderBytes"] or DEFAULT_RENDER_BYTES
+    available = _memAvailable()
+    load = _loadPerCpu()
+
+    limit = governor["limit"]
+    if (available is not None and available < need) or (
+        load is not None and load > LOAD_HIGH
+    ):
+        limit = max(governor["min"], limit - 1)
+    elif (
+        governor["active"] >= limit
+        and (available is None or available > need * MEMORY_HEADROOM)
+        and (load is None or load < LOAD_LOW)
+    ):
+        limit = min(governor["max"], limit + 1)
+    if limit == governor["limit"]:
+        return
+    log.debug(
+        f"Render concurrency {governor['limit']} -> {limit} "
+        f"(available memory {_megabytes(available)}, "
+        f"per render {_megabytes(need)}, load per CPU "
+        f"{'unknown' if load is None else f'{load:.2f}'})"
+    )
+    with governor["condition"]:
+        governor["limit"] = limit
+        governor["condition"].notify_all()
+
+
+def _megabytes(size):
+    return "unknown" if size is None else f"{size >> 20} MB"
+
+
+def _memAvailable():
+    # Linux only; elsewhere memory is not considered
+    try:
+        with open("/proc/meminfo", mode="r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) << 10
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _loadPerCpu():
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+
+def _treeRss(pid):
+    # Resident memory of a render: chordpro and anything it started
+    total = 0
+    pending = [pid]
+    while pending:
+        pid = pending.pop()
+        try:
+            with open(f"/proc/{pid}/statm", mode="r", encoding="ascii") as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            with open(
+                f"/proc/{pid}/task/{pid}/children", mode="r", encoding="ascii"
+            ) as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError, IndexError):
+            continue
+    return total
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import logging
+import os
+import re
+
+from genpdf_butler import Cache
+
+log = logging.getLogger(__name__)
+
+INTEGER = re.compile(r"-?[0-9]+")
+
+
+def configDir():
+    # Beside the shared PDF cache, following the XDG layout
+    return os.path.join(Cache.defaultCacheDir(), "config")
+
+
+def compileSettings(settings):
+    # The --define options of a chordpro command line folded into one
+    # config file, so that chordpro reads a single file instead of parsing
+    # every definition for every song. Files are named after their content
+    # and shared by every run with the same settings. Falls back to the
+    # settings as given when the file cannot be written.
+    cmd = []
+    config = {}
+    for arg in settings:
+        name, _, definition = arg.partition("=")
+        if name != "--define":
+            cmd.append(arg)
+            continue
+        path, _, value = definition.partition("=")
+        node = config
+        *parents, leaf = path.split(":")
+        for key in parents:
+            node = node.setdefault(key, {})
+        node[leaf] = _value(value)
+    if not config:
+        return list(settings)
+    text = json.dumps(config, indent=1, sort_keys=True) + "\n"
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(configDir(), f"genpdf-{digest}.json")
+    if not os.path.isfile(path):
+        try:
+            _write(path, text)
+        except OSError as e:
+            log.debug(f"Could not write chordpro config {path}: {e}")
+            return list(settings)
+    # Given last, so it overrides the presets as --define did
+    return cmd + [f"--config={path}"]
+
+
+def _value(text):
+    # Booleans and numbers are written the way chordpro's own config files
+    # write them
+    if text in ("true", "false"):
+        return text == "true"
+    if INTEGER.fullmatch(text):
+        return int(text)
+    return text
+
+
+def readProbe(identity):
+    # The chordpro version last seen for this exact binary
+    try:
+        with open(_probePath(), mode="r", encoding="utf-8") as f:
+            probe = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(probe, dict) or probe.get("binary") != identity:
+        return None
+    return probe.get("version")
+
+
+def writeProbe(identity, version):
+    try:
+        _write(
+            _probePath(),
+            json.dumps({"binary": identity, "version": version}) + "\n",
+        )
+    except OSError as e:
+        log.debug(f"Could not record the chordpro version: {e}")
+
+
+def _probePath():
+    return os.path.join(configDir(), "chordpro-probe.json")
+
+
+def _write(path, text):
+    # Concurrent runs (e.g. shards) may write the same file; each renames
+    # its own complete copy into place
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmpPath = f"{path}.{os.getpid()}.tmp"
+    with open(tmpPath, mode="w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmpPath, path)
@@ -0,0 +1,121 @@
+import fnmatch
+import os
+from pathlib import Path
+
+extensions = [".chopro", ".cho"]
+
+# Per-library ignore rules, read from the root of a directory target
+IGNORE_FILE = ".genpdfignore"
+
+# Version control metadata that is not already hidden behind a leading dot
+# (.git, .hg and .svn are pruned as hidden directories)
+VCS_DIRS = {"CVS", "_darcs"}
+
+
+# Function to get file extension
+def ext(p):
+    return str(os.path.splitext(os.path.basename(p))[1]).lower()
+
+
+def isSong(p):
+    return ext(p) in extensions
+
+
+def loadIgnore(root):
+    patterns = []
+    try:
+        with open(
+            os.path.join(root, IGNORE_FILE), mode="r", encoding="utf-8"
+        ) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    patterns.append(line)
+    except OSError:
+        pass
+    return patterns
+
+
+def ignored(relPath, isDir, patterns):
+    # .gitignore-style matching: a pattern containing a slash matches the
+    # path below the root, any other pattern matches a file or directory
+    # name anywhere, and a trailing slash restricts it to directories
+    name = relPath.rsplit("/", 1)[-1]
+    for pattern in patterns:
+        if pattern.endswith("/"):
+            if not isDir:
+                continue
+            pattern = pattern.rstrip("/")
+        if "/" in pattern:
+            if fnmatch.fnmatchcase(relPath, pattern.lstrip("/")):
+                return True
+        elif fnmatch.fnmatchcase(name, pattern):
+            return True
+    return False
+
+
+def wanted(root, path, patterns):
+    # Whether the walk below root would yield path, for callers that learn
+    # about songs one at a time (e.g. from file system events)
+    relPath = os.path.relpath(path, root).replace(os.sep, "/")
+    if relPath.startswith("../") or not isSong(relPath):
+        return False
+    parts = relPath.split("/")
+    for depth, part in enumerate(parts[:-1], start=1):
+        if part.startswith(".") or part in VCS_DIRS:
+            return False
+        if ignored("/".join(parts[:depth]), True, patterns):
+            return False
+    return not ignored(relPath, False, patterns)
+
+
+def findSongs(musicTarget):
+    # Lazily yield every song below musicTarget (or musicTarget itself when
+    # it is a song), in a stable order
+    if os.path.isdir(musicTarget):
+        yield from _walk(musicTarget, "", loadIgnore(musicTarget))
+    elif isSong(musicTarget):
+        yield Path(musicTarget)
+
+
+def _walk(root, relDir, patterns):
+    # os.scandir hands back the entry type with the listing, so no file in
+    # the tree needs a separate stat call
+    try:
+        with os.scandir(os.path.join(root, relDir)) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+    except OSError:
+        return
+
+    subDirs = []
+    for entry in entries:
+        relPath = relDir + entry.name
+        if entry.is_dir(follow_symlinks=False):
+            if entry.name.startswith(".") or entry.name in VCS_DIRS:
+                continue
+            if not ignored(relPath, True, patterns):
+                subDirs.append(relPath + "/")
+        elif isSong(entry.name) and not ignored(relPath, False, patterns):
+            yield Path(root) / relPath
+
+    for subDir in subDirs:
+        yield from _walk(root, subDir, patterns)
+
+
+def withFolderSongs(musicTarget, songs):
+    # A songbook is rebuilt from every song in its folder, not just the
+    # songs that changed
+    root = musicTarget if os.path.isdir(musicTarget) else os.curdir
+    patterns = loadIgnore(root)
+    books = []
+    for folder in sorted({Path(song).parent for song in songs}):
+        try:
+            names = sorted(os.listdir(folder))
+        except OSError:
+            continue
+        books.extend(
+            folder / name
+            for name in names
+            if wanted(root, folder / name, patterns)
+        )
+    return books
@@ -1,10 +1,360 @@
+import logging
 import os
+import shutil
 import subprocess
+import threading
+import time
+from contextlib import closing
+from functools import lru_cache
+from itertools import chain, groupby, islice
 from pathlib import Path
 
+from genpdf_butler import (
+    Concurrency,
+    Config,
+    Discovery,
+    Output,
+    PatchTextColor,
+    Progress,
+    Report,
+    Schedule,
+)
 
-def createPDFs(musicTarget, pagesize, showchords):
-    chordproSettings = [
+log = logging.getLogger(__name__)
+
+# A chordpro still running after this many seconds is killed (and retried)
+DEFAULT_TIMEOUT = 300
+
+# Exit code recorded for renders killed by the timeout, as timeout(1) does
+TIMEOUT_RETURNCODE = 124
+
+# Exit code recorded for renders chordpro could not be started for
+SPAWN_RETURNCODE = 126
+
+# Seconds to wait before the first retry; later retries wait longer
+RETRY_DELAY = 1.0
+
+# Songs planned (and patched) ahead of the renderers, per worker
+WINDOW_PER_JOB = 2
+
+# Renders held for in-order reporting, finished or not, per worker: a long
+# render stops the build from running further ahead than this
+HELD_PER_JOB = 4
+
+
+@lru_cache(maxsize=None)
+def probeChordpro():
+    # Where chordpro is and which version it is, looked up once per process.
+    # `chordpro --version` starts Perl and loads all of chordpro, so its
+    # answer is kept on disk for as long as the binary is the same file.
+    path = shutil.which("chordpro")
+    if path is None:
+        raise FileNotFoundError("chordpro not found on PATH")
+    st = os.stat(path)
+    identity = [os.path.realpath(path), st.st_size, st.st_mtime_ns]
+    version = Config.readProbe(identity)
+    if version is None:
+        result = _run([path, "--version"], timeout=DEFAULT_TIMEOUT)
+        if result.returncode != 0:
+            raise OSError(
+                f"chordpro --version failed (exit code {result.returncode}): "
+                f"{result.stderr.strip()}"
+            )
+        version = result.stdout.strip() or "unknown"
+        Config.writeProbe(identity, version)
+    return path, version
+
+
+@lru_cache(maxsize=None)
+def chordproVersion():
+    try:
+        return probeChordpro()[1]
+    except (OSError, subprocess.TimeoutExpired):
+        return "unknown"
+
+
+def _stagingArea():
+    import tempfile
+
+    # Patched copies are short-lived, so keep them in memory when the
+    # platform offers a tmpfs
+    shm = "/dev/shm"
+    if os.path.isdir(shm) and os.access(shm, os.W_OK):
+        return tempfile.TemporaryDirectory(prefix="genpdf-", dir=shm)
+    return tempfile.TemporaryDirectory(prefix="genpdf-")
+
+
+def _run(cmd, timeout=None, running=None):
+    # Like subprocess.run, but the child is registered in `running` so that
+    # a cancelled build can kill it from another thread
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    if running is not None:
+        running.add(process)
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except BaseException:
+        # Timed out, or the build is being cancelled: never leave the child
+        # behind
+        process.kill()
+        process.communicate()
+        raise
+    finally:
+        if running is not None:
+            running.discard(process)
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+def _attempt(cmd, timeout, running):
+    # One chordpro run, and whether its failure is worth retrying: hangs,
+    # children killed by a signal (e.g. the OOM killer) and resource
+    # errors are; a song chordpro rejects is not
+    try:
+        result = _run(cmd, timeout=timeout, running=running)
+    except subprocess.TimeoutExpired:
+        message = f"chordpro timed out after {timeout:g} seconds\n"
+        return (
+            subprocess.CompletedProcess(cmd, TIMEOUT_RETURNCODE, "", message),
+            True,
+        )
+    except (FileNotFoundError, PermissionError):
+        raise
+    except OSError as e:
+        return (
+            subprocess.CompletedProcess(cmd, SPAWN_RETURNCODE, "", f"{e}\n"),
+            True,
+        )
+    return result, result.returncode < 0
+
+
+def _render(render, timeout, retries, running, cancelled, governor=None):
+    # Output is captured so that parallel renders are reported one at a
+    # time (and with the same text) as in a serial run
+    if governor is not None:
+        if not Concurrency.acquire(governor, cancelled):
+            return None
+        try:
+            return _render(render, timeout, retries, running, cancelled)
+        finally:
+            Concurrency.release(governor)
+    if cancelled.is_set():
+        return None
+    render["state"] = "running"
+    render["worker"] = threading.current_thread()
+    start = render["started"] = time.perf_counter()
+    for attempt in range(retries + 1):
+        if attempt:
+            log.warning(f"Retrying ({attempt}/{retries}): {render['output']}")
+            if cancelled.wait(RETRY_DELAY * attempt):
+                break
+        result, transient = _attempt(render["cmd"], timeout, running)
+        if not transient or cancelled.is_set():
+            break
+    # chordpro writes to a temporary file, so a render that fails, times
+    # out or is cancelled leaves the previous PDF as it was
+    if result.returncode == 0:
+        if render.get("optimize"):
+            from genpdf_butler import Optimize
+
+            # In the worker, so optimizing overlaps with the other renders
+            render["sizes"] = Optimize.optimizePDF(render["tmp"])
+        render["replaced"] = Output.publish(render["tmp"], render["output"])
+    else:
+        _removePartial(render)
+    render["state"] = "done"
+    if cancelled.is_set() and result.returncode != 0:
+        render["state"] = "cancelled"
+    return result, time.perf_counter() - start
+
+
+def _removePartial(render):
+    if Output.discard(render["tmp"]):
+        log.debug(f"Removed partial output of {render['output']}")
+
+
+def _renderAll(
+    renders, jobs, timeout=DEFAULT_TIMEOUT, retries=0, governor=None
+):
+    # Renders are consumed lazily, so planning (and patching) the next songs
+    # overlaps with rendering and only a bounded window of songs is ever
+    # being rendered. Results are yielded in the "order" each render was
+    # planned in, however they finish, so a parallel run reports like a
+    # serial one.
+    # With a governor, jobs is the most renders that may run at once and
+    # the window follows its current limit, so discovery and patching slow
+    # down with the renderers.
+    running = set()
+    cancelled = threading.Event()
+    inFlight = {}
+
+    def render(render):
+        return _render(render, timeout, retries, running, cancelled, governor)
+
+    def limit():
+        return governor["limit"] if governor is not None else jobs
+
+    def window():
+        return limit() * WINDOW_PER_JOB
+
+    def full():
+        # Finished renders waiting for their turn to be reported do not
+        # hold up the workers, but only so many of them are kept
+        return len(busy()) >= window() or len(inFlight) >= (
+            limit() * HELD_PER_JOB
+        )
+
+    def waitForAny():
+        # A governor looks at memory and load while renders are running
+        interval = None
+        if governor is not None:
+            interval = Concurrency.ADJUST_INTERVAL
+        wait(busy(), timeout=interval, return_when=FIRST_COMPLETED)
+        if governor is not None:
+            Concurrency.adjust(governor, list(running))
+
+    pool = None
+    try:
+        renders = iter(renders)
+        if jobs > 1:
+            first = list(islice(renders, 2))
+            renders = chain(first, renders)
+            # Only runs with more than one render pay for importing the
+            # thread pool
+            if len(first) > 1:
+                from concurrent.futures import ThreadPoolExecutor
+
+                pool = ThreadPoolExecutor(max_workers=jobs)
+        if pool is None:
+            for r in renders:
+                inFlight[id(r)] = r
+                yield _emit(r, render(r))
+                del inFlight[id(r)]
+            return
+        from concurrent.futures import FIRST_COMPLETED, wait
+
+        nextOrder = 0
+
+        def ready():
+            nonlocal nextOrder
+            byOrder = {r["order"]: future for future, r in inFlight.items()}
+            future = byOrder.get(nextOrder)
+            while future is not None and future.done():
+                yield _emit(inFlight.pop(future), future.result())
+                nextOrder += 1
+                future = byOrder.get(nextOrder)
+
+        def busy():
+            return [future for future in inFlight if not future.done()]
+
+        for r in renders:
+            inFlight[pool.submit(render, r)] = r
+            yield from ready()
+            while full():
+                waitForAny()
+                yield from ready()
+        while inFlight:
+            if busy():
+                waitForAny()
+            else:
+                nextOrder = min(r["order"] for r in inFlight.values())
+            yield from ready()
+        pool.shutdown()
+    except BaseException:
+        # Ctrl-C (or SIGTERM, see __main__): start nothing new, kill what is
+        # running, and remove the files those renders were half way through
+        cancelled.set()
+        for process in list(running):
+            process.kill()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        for r in inFlight.values():
+            if r.get("state") in ("running", "cancelled"):
+                _removePartial(r)
+        raise
+
+
+def _emit(render, rendered):
+    # Per-song detail is only shown at debug level; failures always are
+    result, seconds = rendered
+    log.debug(render["status"])
+    if result.stdout:
+        log.debug(result.stdout.rstrip())
+    if result.returncode != 0:
+        log.warning(
+            f"chordpro failed on {render['song']} "
+            f"(exit code {result.returncode})"
+        )
+    if result.stderr:
+        level = logging.WARNING if result.returncode else logging.INFO
+        log.log(level, result.stderr.rstrip())
+    return render, result, seconds
+
+
+def createPDFs(
+    musicTarget,
+    pagesize,
+    showchords,
+    jobs=1,
+    incremental=False,
+    staged=False,
+    songs=None,
+    songbook=False,
+    report=None,
+    cache=None,
+    cacheSize=None,
+    timeout=DEFAULT_TIMEOUT,
+    retries=0,
+    progress=False,
+    manifestFile=None,
+    minJobs=None,
+    optimize=False,
+    patched=None,
+):
+    options = dict(
+        jobs=jobs,
+        optimize=optimize,
+        minJobs=minJobs,
+        incremental=incremental,
+        songs=songs,
+        songbook=songbook,
+        report=report,
+        cache=cache,
+        cacheSize=cacheSize,
+        timeout=timeout,
+        retries=retries,
+        progress=Progress.newProgress() if progress else None,
+        manifestFile=manifestFile,
+    )
+    if staged and os.path.exists(musicTarget):
+        # Render patched copies from a staging area instead of songs that
+        # PatchColors rewrote in place; the sources are never modified
+        stageRoot = musicTarget
+        if not os.path.isdir(musicTarget):
+            stageRoot = os.path.dirname(musicTarget) or os.curdir
+        with _stagingArea() as stageDir:
+            return _createPDFs(
+                musicTarget,
+                pagesize,
+                showchords,
+                stage=(stageDir, stageRoot),
+                patched=None,
+                **options,
+            )
+    # Otherwise songs are patched in place as they are planned, and those
+    # whose text changed are appended to `patched` for the caller to restore
+    return _createPDFs(
+        musicTarget,
+        pagesize,
+        showchords,
+        stage=None,
+        patched=patched,
+        **options,
+    )
+
+
+def chordproSettings(pagesize, showchords):
+    return [
         "chordpro",
         "--config=ukulele",
         "--config=ukulele-ly",
@@ -24,33 +374,371 @@ def createPDFs(musicTarget, pagesize, showchords):
         "--chord-font=helvetica",
     ]
 
-    # Function to get file extension
-    def ext(p):
-        return str(os.path.splitext(os.path.basename(p))[1]).lower()
 
-    extensions = [".chopro", ".cho"]
-    if os.path.exists(musicTarget):
-        if os.path.isdir(musicTarget):
-            print(
-                f"Processing all .chopro and .cho files in directory "
-                f"'{musicTarget}'"
-            )
-            for p in Path(musicTarget).rglob("*"):
-                print(f"Checking file: {p}")
-                if ext(p) in (extension.lower() for extension in extensions):
-                    print(f"Processing file: {p}")
-                    pdf_output = str(p).replace(ext(p), ".pdf")
-                    subprocess.run(
-                        chordproSettings + [f"--output={pdf_output}", str(p)]
+def variants(pagesize, showchords):
+    # Comma separated lists are paired up by position; a single value
+    # applies to every variant
+    pagesizes = _splitList(pagesize)
+    chords = _splitList(showchords)
+    if len(pagesizes) == 1:
+        pagesizes = pagesizes * len(chords)
+    if len(chords) == 1:
+        chords = chords * len(pagesizes)
+    if len(pagesizes) != len(chords):
+        raise ValueError(
+            f"{len(pagesizes)} page sizes but {len(chords)} chord settings"
+        )
+    return list(dict.fromkeys(zip(pagesizes, chords)))
+
+
+def _splitList(value):
+    if isinstance(value, str):
+        value = value.split(",")
+    return [item.strip() for item in value if item.strip()] or [""]
+
+
+def variantName(pagesize, showchords):
+    if showchords == "true":
+        return f"{pagesize}-diagrams"
+    return pagesize
+
+
+def outputName(path, variant=None):
+    # song.chopro -> song.pdf, or song.a4-diagrams.pdf for one of several
+    # variants
+    base = os.path.splitext(str(path))[0]
+    if variant:
+        return f"{base}.{variant}.pdf"
+    return base + ".pdf"
+
+
+def bookOutput(folder):
+    # A folder's songbook is named after the folder
+    name = os.path.basename(os.path.abspath(folder))
+    return str(Path(folder) / (name + ".pdf"))
+
+
+def removeOutputs(songs, pagesize, showchords, songbook=False):
+    # Delete the PDFs of songs that were deleted or renamed away; a songbook
+    # only goes once its folder has no songs left
+    names = [
+        variantName(*variant) for variant in variants(pagesize, showchords)
+    ]
+    if len(names) == 1:
+        names = [None]
+    bases = songs
+    if songbook:
+        bases = []
+        for folder in sorted({Path(song).parent for song in songs}):
+            try:
+                remaining = [
+                    n for n in os.listdir(folder) if Discovery.isSong(n)
+                ]
+            except OSError:
+                remaining = []
+            if not remaining:
+                bases.append(bookOutput(folder))
+    removed = []
+    for base in bases:
+        for name in names:
+            pdf = outputName(base, name)
+            try:
+                os.unlink(pdf)
+            except FileNotFoundError:
+                continue
+            log.info(f"Removed stale PDF: {pdf}")
+            removed.append(pdf)
+    return removed
+
+
+def _createPDFs(
+    musicTarget,
+    pagesize,
+    showchords,
+    jobs,
+    minJobs,
+    optimize,
+    incremental,
+    stage,
+    patched,
+    songs,
+    songbook,
+    report,
+    cache,
+    cacheSize,
+    timeout,
+    retries,
+    progress,
+    manifestFile,
+):
+    # Fingerprints cover the settings themselves; chordpro gets them as one
+    # config file
+    builds = []
+    for variant in variants(pagesize, showchords):
+        settings = chordproSettings(*variant)
+        builds.append(
+            (variantName(*variant), settings, Config.compileSettings(settings))
+        )
+    if len(builds) == 1:
+        # A single variant keeps the plain song.pdf name
+        builds = [(None, *builds[0][1:])]
+    # Optimized outputs differ from plain ones for incremental builds and
+    # the cache; pikepdf is only loaded when asked for
+    extraSettings = []
+    if optimize:
+        from genpdf_butler import Optimize
+
+        extraSettings = Optimize.settings()
+
+    # The manifest also keeps what each song took to render last time,
+    # which parallel builds use to start the longest renders first. It is
+    # only kept for incremental builds or when a manifest file is given.
+    manifest = None
+    if os.path.exists(musicTarget) and (incremental or manifestFile):
+        from genpdf_butler import Manifest
+
+        # Keys are always relative to the target, wherever the manifest
+        # itself is kept (e.g. one manifest per shard)
+        keyFile = Manifest.manifestPath(musicTarget)
+        manifestFile = manifestFile or keyFile
+        manifest = Manifest.loadManifest(manifestFile)
+    if cache is not None:
+        from genpdf_butler import Cache, Manifest
+    if (incremental and manifest is not None) or cache is not None:
+        version = chordproVersion()
+
+    def planRenders(status, sources, base, keyPath):
+        # Each song is staged once and shared by all of its variants
+        inputs = []
+        for song in sources:
+            if stage:
+                try:
+                    with Report.phase(report, "patch"):
+                        song = PatchTextColor.stageSong(song, *stage)
+                except Exception as e:
+                    log.warning(f"failed on file {str(song)}: {e}")
+            elif patched is not None:
+                try:
+                    with Report.phase(report, "patch"):
+                        if PatchTextColor.patchFile(song):
+                            patched.append(song)
+                except Exception as e:
+                    log.warning(f"failed on file {str(song)}: {e}")
+            inputs.append(song)
+
+        for variant, settings, command in builds:
+            pdf_output = outputName(base, variant)
+            key = fp = None
+            if (incremental and manifest is not None) or cache is not None:
+                # The songs have already been patched at this point, so the
+                # hash covers exactly the text chordpro is going to see
+                with Report.phase(report, "manifest"):
+                    fp = Manifest.fingerprint(
+                        inputs, settings + extraSettings, version
+                    )
+            if manifest is not None:
+                key = Manifest.variantKey(
+                    Manifest.songKey(keyPath, keyFile), variant
+                )
+            if incremental and manifest is not None:
+                if manifest["songs"].get(key) == fp and os.path.exists(
+                    pdf_output
+                ):
+                    log.debug(f"Up to date: {pdf_output}")
+                    Report.recordSong(
+                        report, keyPath, pdf_output, 0.0, cache="hit"
                     )
+                    Progress.planned(progress)
+                    Progress.advance(progress, cached=True)
+                    continue
+            if cache is not None:
+                start = time.perf_counter()
+                with Report.phase(report, "cache"):
+                    hit = Cache.fetch(cache, Cache.cacheKey(fp), pdf_output)
+                if hit:
+                    log.debug(f"From cache: {pdf_output}")
+                    Report.recordSong(
+                        report,
+                        keyPath,
+                        pdf_output,
+                        time.perf_counter() - start,
+                        cache="shared",
+                    )
+                    if incremental and manifest is not None:
+                        manifest["songs"][key] = fp
+                    Progress.planned(progress)
+                    Progress.advance(progress, cached=True)
+                    continue
+            Progress.planned(progress)
+            tmp = Output.tempPath(pdf_output)
+            yield {
+                "status": f"{status} [{variant}]" if variant else status,
+                "song": keyPath,
+                "output": pdf_output,
+                "tmp": tmp,
+                "cmd": command
+                + [f"--output={tmp}"]
+                + [str(song) for song in inputs],
+                "key": key,
+                "fingerprint": fp,
+                "optimize": optimize,
+                "size": Schedule.inputSize(inputs),
+            }
+
+    def units(songs):
+        # What each PDF is built from, in discovery order, as (status,
+        # sources, output base, key path)
+        if not os.path.isdir(musicTarget):
+            if songs is None:
+                songs = [musicTarget]
+            for p in songs:
+                if Discovery.isSong(p):
+                    yield f"Processing single file '{musicTarget}'", [p], p, p
+            return
+        log.info(
+            f"Processing all .chopro and .cho files in directory "
+            f"'{musicTarget}'"
+        )
+        # Songs may already have been discovered by the caller
+        if songs is None:
+            songs = Discovery.findSongs(musicTarget)
+        if songbook:
+            # One combined PDF per folder, named after the folder, from a
+            # single chordpro process; discovery yields each folder's songs
+            # together
+            for folder, book in groupby(songs, key=lambda p: Path(p).parent):
+                book = list(book)
+                pdf_output = bookOutput(folder)
+                yield (
+                    f"Processing songbook: {pdf_output} ({len(book)} songs)",
+                    book,
+                    pdf_output,
+                    pdf_output,
+                )
         else:
-            if ext(musicTarget) in (
-                extension.lower() for extension in extensions
+            for p in songs:
+                yield f"Processing file: {p}", [p], p, p
+
+    def plan(songs):
+        # Every PDF that needs rendering, planned (patched, staged and
+        # fingerprinted) only as the renderers catch up
+        if not os.path.exists(musicTarget):
+            log.error(f"no such file or folder '{musicTarget}'")
+            return
+        found = enumerate(units(songs))
+        costs = Manifest.unitCosts(manifest) if manifest is not None else {}
+        if jobs > 1 and costs:
+            # Ordering needs the whole song list, but no more than the names
+            # and sizes of the songs; with no recorded costs, songs stream
+            # in discovery order
+            found = [
+                {
+                    "key": Manifest.songKey(unit[3], keyFile),
+                    "size": Schedule.inputSize(unit[1]),
+                    "unit": (position, unit),
+                }
+                for position, unit in found
+            ]
+            found = [u["unit"] for u in Schedule.longestFirst(found, costs)]
+        for position, unit in found:
+            for render in planRenders(*unit):
+                # Where the song was discovered, to compare the schedule with
+                render["position"] = position
+                yield render
+
+    def planAll():
+        for order, render in enumerate(plan(songs)):
+            render["order"] = order
+            yield render
+        Progress.planComplete(progress)
+
+    # Between minJobs and jobs renders, as memory and load allow
+    governor = None
+    if minJobs is not None and minJobs < jobs:
+        governor = Concurrency.newGovernor(minJobs, jobs)
+
+    failed = []
+    rendered = 0
+    durations = []
+    tracks = {threading.current_thread(): None}
+    with (
+        Report.phase(report, "render"),
+        closing(
+            _renderAll(planAll(), jobs, timeout, retries, governor)
+        ) as results,
+    ):
+        for render, result, seconds in results:
+            rendered += 1
+            durations.append((render["position"], render["started"], seconds))
+            if result.returncode != 0:
+                failed.append(render["output"])
+            Progress.advance(progress, failed=result.returncode != 0)
+            Report.recordSong(
+                report,
+                render["song"],
+                render["output"],
+                seconds,
+                result.returncode,
+                result.stderr,
+                sizeBefore=(render.get("sizes") or (None,))[0],
+                replaced=render.get("replaced"),
+            )
+            if render["worker"] not in tracks:
+                tracks[render["worker"]] = f"render worker {len(tracks)}"
+            Report.recordSpan(
+                report,
+                os.path.basename(render["output"]),
+                "render",
+                render["started"],
+                seconds,
+                tracks[render["worker"]],
+                {"song": str(render["song"]), "exit": result.returncode},
+            )
+            if manifest is not None and result.returncode == 0:
+                # What each song costs to render, for scheduling and for
+                # balancing shards
+                manifest["timings"][render["key"]] = round(seconds, 3)
+            if incremental and manifest is not None:
+                if result.returncode == 0:
+                    manifest["songs"][render["key"]] = render["fingerprint"]
+                else:
+                    manifest["songs"].pop(render["key"], None)
+            if (
+                cache is not None
+                and result.returncode == 0
+                and os.path.exists(render["output"])
             ):
-                print(f"Processing single file '{musicTarget}'")
-                pdf_output = musicTarget.replace(ext(musicTarget), ".pdf")
-                subprocess.run(
-                    chordproSettings + [f"--output={pdf_output}", musicTarget]
-                )
-    else:
-        print(f"no such file or folder '{musicTarget}'")
+                with Report.phase(report, "cache"):
+                    Cache.store(
+                        cache,
+                        Cache.cacheKey(render["fingerprint"]),
+                        render["output"],
+                    )
+
+    Progress.finish(progress)
+
+    if jobs > 1 and durations:
+        # What the same renders would have taken in discovery order
+        planned = [seconds for position, started, seconds in sorted(durations)]
+        durations.sort(key=lambda entry: entry[1])
+        dispatched = [seconds for position, started, seconds in durations]
+        Report.recordSchedule(
+            report,
+            jobs,
+            Schedule.makespan(planned, jobs),
+            Schedule.makespan(dispatched, jobs),
+        )
+
+    if cache is not None and rendered:
+        with Report.phase(report, "cache"):
+            Cache.evict(cache, cacheSize or Cache.DEFAULT_SIZE)
+
+    if manifest is not None:
+        with Report.phase(report, "manifest"):
+            # Runs may cover only part of the library (a single song, or the
+            # songs a watcher saw change), so entries are only dropped once
+            # their song is gone
+            Manifest.pruneMissing(manifest, keyFile)
+            Manifest.saveManifest(manifestFile, manifest)
+
+    return failed
@@ -0,0 +1,245 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+from pathlib import Path
+
+from genpdf_butler import Discovery
+
+log = logging.getLogger(__name__)
+
+INDEX_NAME = ".genpdf-index.sqlite"
+
+# Metadata a song can be selected by with --where
+FIELDS = ("path", "title", "artist", "key", "tag")
+
+# {title: ...}, {t: ...} and the ChordPro 6 {meta: title ...} form
+DIRECTIVE = re.compile(r"^\s*\{\s*([A-Za-z_]+)\s*(?::\s*(.*?))?\s*\}\s*$")
+ALIASES = {"t": "title", "tags": "tag"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    path TEXT PRIMARY KEY,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    title TEXT,
+    artist TEXT,
+    key TEXT
+);
+CREATE TABLE IF NOT EXISTS tags (
+    path TEXT NOT NULL REFERENCES songs (path) ON DELETE CASCADE,
+    tag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tags_path ON tags (path);
+"""
+
+
+def indexPath(musicTarget):
+    return os.path.join(musicTarget, INDEX_NAME)
+
+
+def openIndex(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def readMeta(data):
+    # The first title, artist and key a song declares, and all of its tags
+    meta = {"title": None, "artist": None, "key": None, "tag": []}
+    for line in data.decode("utf-8", errors="replace").splitlines():
+        match = DIRECTIVE.match(line)
+        if not match:
+            continue
+        name, value = match.group(1).lower(), match.group(2) or ""
+        if name == "meta":
+            name, _, value = value.partition(" ")
+            name = name.lower()
+            value = value.strip()
+        name = ALIASES.get(name, name)
+        if not value or name not in meta:
+            continue
+        if name == "tag":
+            meta["tag"].extend(
+                tag.strip() for tag in value.split(",") if tag.strip()
+            )
+        elif meta[name] is None:
+            meta[name] = value
+    return meta
+
+
+def indexing(conn, root, songs, rebuild=False):
+    # Pass songs through while keeping the index up to date: only songs
+    # whose size or mtime changed (or every song, when rebuilding) are read
+    # again, and songs no longer found are dropped once the stream is
+    # exhausted. In-place builds patch and restore songs, which moves their
+    # mtime but not their content, so those are only hashed, not re-parsed.
+    known = {} if rebuild else _known(conn)
+    if rebuild:
+        conn.execute("DELETE FROM songs")
+    seen = set()
+    for song in songs:
+        relPath = os.path.relpath(song, root).replace(os.sep, "/")
+        seen.add(relPath)
+        try:
+            st = os.stat(song)
+        except OSError:
+            yield song
+            continue
+        if known.get(relPath, ())[:2] != (st.st_mtime_ns, st.st_size):
+            _update(conn, relPath, song, st, known.get(relPath))
+        yield song
+    stale = [(path,) for path in known if path not in seen]
+    # Until here the changes are one uncommitted transaction, so a build
+    # that is interrupted leaves the previous index intact
+    conn.executemany("DELETE FROM songs WHERE path = ?", stale)
+    conn.commit()
+    if stale:
+        log.debug(f"Dropped {len(stale)} songs from the index")
+
+
+def _known(conn):
+    return {
+        path: (mtime, size, digest)
+        for path, mtime, size, digest in conn.execute(
+            "SELECT path, mtime, size, hash FROM songs"
+        )
+    }
+
+
+def _refresh(conn, root, paths):
+    # Re-read just the given songs if they changed since they were indexed
+    known = _known(conn)
+    changed = False
+    for relPath in paths:
+        song = os.path.join(root, relPath)
+        try:
+            st = os.stat(song)
+        except OSError:
+            conn.execute("DELETE FROM songs WHERE path = ?", (relPath,))
+            changed = True
+            continue
+        if known.get(relPath, ())[:2] != (st.st_mtime_ns, st.st_size):
+            changed |= _update(conn, relPath, song, st, known.get(relPath))
+    conn.commit()
+    return changed
+
+
+def _update(conn, relPath, song, st, entry):
+    # Re-index a song whose stat changed; returns whether its metadata may
+    # have changed
+    try:
+        with open(song, mode="rb") as f:
+            data = f.read()
+    except OSError:
+        return False
+    digest = hashlib.sha256(data).hexdigest()
+    if entry is not None and entry[2] == digest:
+        conn.execute(
+            "UPDATE songs SET mtime = ?, size = ? WHERE path = ?",
+            (st.st_mtime_ns, st.st_size, relPath),
+        )
+        return False
+    _store(conn, relPath, data, digest, st)
+    return True
+
+
+def _store(conn, relPath, data, digest, st):
+    meta = readMeta(data)
+    log.debug(f"Indexing {relPath}")
+    conn.execute(
+        "INSERT OR REPLACE INTO songs VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            relPath,
+            st.st_mtime_ns,
+            st.st_size,
+            digest,
+            meta["title"],
+            meta["artist"],
+            meta["key"],
+        ),
+    )
+    conn.execute("DELETE FROM tags WHERE path = ?", (relPath,))
+    conn.executemany(
+        "INSERT INTO tags VALUES (?, ?)",
+        [(relPath, tag) for tag in meta["tag"]],
+    )
+
+
+def updateIndex(conn, root, rebuild=False):
+    # One streaming pass over the library
+    for _ in indexing(conn, root, Discovery.findSongs(root), rebuild):
+        pass
+
+
+def parseWhere(text):
+    # FIELD=PATTERN, matched case-insensitively with * and ? wildcards
+    field, sep, pattern = text.partition("=")
+    field = field.strip().lower()
+    if not sep or field not in FIELDS:
+        raise ValueError(
+            f"--where must look like FIELD=PATTERN with FIELD one of "
+            f"{', '.join(FIELDS)}, not '{text}'"
+        )
+    return field, pattern.strip()
+
+
+def select(conn, root, where=(), setlist=None):
+    # The songs matching every --where condition, in path order, or in
+    # setlist order when a setlist is given. Only the matches are checked
+    # against the tree; songs added since the index was last updated need
+    # a full build or --reindex to be found.
+    rows = _query(conn, where)
+    if _refresh(conn, root, [path for path, title in rows]):
+        rows = _query(conn, where)
+    if setlist is not None:
+        rows = _inSetlist(rows, setlist)
+    return [Path(root) / path for path, title in rows]
+
+
+def _query(conn, where):
+    clauses = []
+    params = []
+    for field, pattern in where:
+        if field == "tag":
+            clauses.append(
+                "path IN (SELECT path FROM tags WHERE lower(tag) GLOB ?)"
+            )
+        else:
+            clauses.append(f"lower({field}) GLOB ?")
+        params.append(pattern.lower())
+    query = "SELECT path, title FROM songs"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    return conn.execute(query + " ORDER BY path", params).fetchall()
+
+
+def readSetlist(path):
+    # One song per line, by path below the target or by title
+    entries = []
+    with open(path, mode="r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                entries.append(line)
+    return entries
+
+
+def _inSetlist(rows, setlist):
+    byPath = {path: path for path, title in rows}
+    byTitle = {}
+    for path, title in rows:
+        if title:
+            byTitle.setdefault(title.lower(), path)
+    selected = []
+    for entry in setlist:
+        path = byPath.get(entry.replace(os.sep, "/").removeprefix("./"))
+        path = path or byTitle.get(entry.lower())
+        if path is None:
+            log.warning(f"Setlist entry '{entry}' matches no indexed song")
+        elif path not in selected:
+            selected.append(path)
+    return [(path, None) for path in selected]
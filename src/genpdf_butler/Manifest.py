@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import tempfile
+
+MANIFEST_NAME = ".genpdf-manifest.json"
+
+
+def manifestPath(musicTarget):
+    # The manifest lives next to the outputs: inside the target directory,
+    # or beside the song when rendering a single file
+    if os.path.isdir(musicTarget):
+        return os.path.join(musicTarget, MANIFEST_NAME)
+    return os.path.join(os.path.dirname(musicTarget), MANIFEST_NAME)
+
+
+def shardManifestPath(musicTarget, index, count):
+    # Shards of one build run side by side, so each keeps its own manifest
+    # rather than overwriting the others' entries in the shared one
+    root, ext = os.path.splitext(manifestPath(musicTarget))
+    return f"{root}.shard-{index}of{count}{ext}"
+
+
+def loadManifest(path):
+    try:
+        with open(path, mode="r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {"songs": {}, "timings": {}}
+    for section in ("songs", "timings"):
+        if not isinstance(manifest.get(section), dict):
+            manifest[section] = {}
+    return manifest
+
+
+def saveManifest(path, manifest):
+    # Write to a uniquely named sibling file and swap it in, so an
+    # interrupted run never leaves a truncated manifest behind and concurrent
+    # writers never share a temporary file
+    fd, tmpPath = tempfile.mkstemp(
+        prefix=".genpdf-",
+        suffix=".tmp",
+        dir=os.path.dirname(path) or os.curdir,
+    )
+    try:
+        with os.fdopen(fd, mode="w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmpPath, path)
+    except BaseException:
+        try:
+            os.unlink(tmpPath)
+        except OSError:
+            pass
+        raise
+
+
+def songKey(path, manifestFile):
+    root = os.path.dirname(os.path.abspath(manifestFile))
+    return os.path.relpath(os.path.abspath(path), root).replace(os.sep, "/")
+
+
+def lastBuild(manifest, buildKey):
+    # The commit the previous complete build was made from, as long as it
+    # was built with the same settings
+    build = manifest.get("build")
+    if isinstance(build, dict) and build.get("settings") == buildKey:
+        return build.get("commit")
+    return None
+
+
+def recordBuild(path, commit, buildKey):
+    manifest = loadManifest(path)
+    manifest["build"] = {"commit": commit, "settings": buildKey}
+    saveManifest(path, manifest)
+
+
+def variantKey(key, variant):
+    # Each build variant of a song gets its own entry
+    if variant:
+        return f"{key}#{variant}"
+    return key
+
+
+def pruneMissing(manifest, manifestFile):
+    root = os.path.dirname(os.path.abspath(manifestFile))
+    for section in ("songs", "timings"):
+        manifest[section] = {
+            key: entry
+            for key, entry in manifest.get(section, {}).items()
+            if os.path.exists(os.path.join(root, key))
+            or ("#" in key and os.path.exists(os.path.join(root, _song(key))))
+        }
+
+
+def unitCosts(manifest):
+    # Recorded render seconds per song (or songbook), summed over variants
+    costs = {}
+    for key, seconds in manifest.get("timings", {}).items():
+        unit = _song(key) if "#" in key else key
+        costs[unit] = costs.get(unit, 0.0) + seconds
+    return costs
+
+
+def mergeManifests(manifests):
+    # Shards render disjoint songs, so their entries simply add up; a build
+    # commit is only kept if every shard recorded the same one
+    merged = {"songs": {}, "timings": {}}
+    builds = []
+    for manifest in manifests:
+        merged["songs"].update(manifest.get("songs", {}))
+        merged["timings"].update(manifest.get("timings", {}))
+        builds.append(manifest.get("build"))
+    if (
+        builds
+        and builds[0] is not None
+        and builds.count(builds[0]) == len(builds)
+    ):
+        merged["build"] = builds[0]
+    return merged
+
+
+def _song(key):
+    return key.rpartition("#")[0]
+
+
+def sourceHash(path):
+    digest = hashlib.sha256()
+    with open(path, mode="rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def settingsHash(settings):
+    return hashlib.sha256("\0".join(settings).encode("utf-8")).hexdigest()
+
+
+def sourcesHash(paths):
+    # A single song keeps its plain content hash; a songbook hashes the
+    # ordered list of its songs' hashes
+    hashes = [sourceHash(path) for path in paths]
+    if len(hashes) == 1:
+        return hashes[0]
+    return hashlib.sha256("\n".join(hashes).encode("utf-8")).hexdigest()
+
+
+def fingerprint(sources, settings, chordproVersion):
+    return {
+        "source": sourcesHash(sources),
+        "settings": settingsHash(settings),
+        "chordpro": chordproVersion,
+    }
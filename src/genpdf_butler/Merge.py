@@ -0,0 +1,55 @@
+import argparse
+
+from genpdf_butler import Manifest, Report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="genpdf-merge",
+        description="combine the manifests and run reports written by "
+        "'genpdf --shard i/N' on each build node",
+    )
+    parser.add_argument(
+        "--manifests",
+        nargs="+",
+        metavar="PATH",
+        default=[],
+        help="per-shard manifests to merge",
+    )
+    parser.add_argument(
+        "--reports",
+        nargs="+",
+        metavar="PATH",
+        default=[],
+        help="per-shard run reports (JSON or JSON Lines) to merge",
+    )
+    parser.add_argument(
+        "--manifest-out", metavar="PATH", help="write the merged manifest here"
+    )
+    parser.add_argument(
+        "--report-out",
+        metavar="PATH",
+        help="write the merged report here (JSON Lines if PATH ends in "
+        ".jsonl)",
+    )
+    args = parser.parse_args(argv)
+    if bool(args.manifests) != bool(args.manifest_out):
+        parser.error("--manifests and --manifest-out go together")
+    if bool(args.reports) != bool(args.report_out):
+        parser.error("--reports and --report-out go together")
+    if not args.manifests and not args.reports:
+        parser.error("nothing to merge")
+
+    if args.manifests:
+        Manifest.saveManifest(
+            args.manifest_out,
+            Manifest.mergeManifests(
+                Manifest.loadManifest(path) for path in args.manifests
+            ),
+        )
+    if args.reports:
+        Report.writeMerged(args.reports, args.report_out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+try:
+    import pikepdf
+except ImportError:  # optional: pip install genpdf_butler[optimize]
+    pikepdf = None
+
+log = logging.getLogger(__name__)
+
+# Resource categories whose objects are shared between pages when equal
+SHARED_RESOURCES = ("/Font", "/XObject")
+
+
+def available():
+    return pikepdf is not None
+
+
+def settings():
+    # Part of the fingerprint of optimized outputs, so that incremental
+    # builds and the cache tell them apart from plain ones (and from those
+    # of another pikepdf)
+    return [f"--genpdf-optimize=pikepdf-{pikepdf.__version__}"]
+
+
+def optimizePDF(path):
+    # Rewrite path in place, smaller; returns its size before and after
+    # (None when there is no such file). The same input always gives the
+    # same bytes: object order follows the input and the document /ID is
+    # derived from the content.
+    try:
+        before = os.path.getsize(path)
+    except OSError:
+        return None
+    directory = os.path.dirname(path) or os.curdir
+    fd, tmpPath = tempfile.mkstemp(
+        prefix=".genpdf-", suffix=".tmp", dir=directory
+    )
+    os.close(fd)
+    try:
+        with pikepdf.open(path) as pdf:
+            _shareResources(pdf)
+            pdf.remove_unreferenced_resources()
+            pdf.save(
+                tmpPath,
+                compress_streams=True,
+                recompress_flate=True,
+                # Object streams would compress the Info dictionary, whose
+                # timestamps Output.samePDF has to see to tell that a
+                # render did not change
+                object_stream_mode=pikepdf.ObjectStreamMode.preserve,
+                deterministic_id=True,
+            )
+        after = os.path.getsize(tmpPath)
+        if after < before:
+            os.replace(tmpPath, path)
+            return before, after
+    except Exception as e:
+        log.warning(f"Could not optimize {path}: {e}")
+    finally:
+        try:
+            os.unlink(tmpPath)
+        except OSError:
+            pass
+    return before, before
+
+
+def _shareResources(pdf):
+    # Point every page at a single copy of each distinct font and image
+    # (chordpro embeds them again for every song of a songbook); the copies
+    # left unreferenced are not written out
+    seen = {}
+    memo = {}
+    for page in pdf.pages:
+        resources = page.obj.get("/Resources")
+        if resources is None:
+            continue
+        for category in SHARED_RESOURCES:
+            entries = resources.get(category)
+            if entries is None:
+                continue
+            for name in list(entries.keys()):
+                obj = entries[name]
+                if not obj.is_indirect:
+                    continue
+                shared = seen.setdefault(_digest(obj, memo), obj)
+                if shared.objgen != obj.objgen:
+                    entries[name] = shared
+
+
+def _digest(obj, memo, active=None):
+    # A hash of an object's content, following references, so that equal
+    # fonts and images written as separate objects compare equal
+    if not isinstance(obj, pikepdf.Object):
+        # Numbers and booleans come back as Python values
+        return hashlib.sha256(repr(obj).encode()).hexdigest()
+    active = active if active is not None else set()
+    if obj.is_indirect:
+        key = obj.objgen
+        if key in memo:
+            return memo[key]
+        if key in active:
+            # A cycle (e.g. a /Parent link): identify it by position
+            return f"cycle{key}"
+        active.add(key)
+    h = hashlib.sha256()
+    if isinstance(obj, pikepdf.Stream):
+        h.update(b"stream")
+        h.update(_digest(obj.stream_dict, memo, active).encode())
+        h.update(obj.read_raw_bytes())
+    elif isinstance(obj, pikepdf.Dictionary):
+        h.update(b"dict")
+        for name in sorted(obj.keys()):
+            h.update(name.encode())
+            h.update(_digest(obj[name], memo, active).encode())
+    elif isinstance(obj, pikepdf.Array):
+        h.update(b"array")
+        for item in obj:
+            h.update(_digest(item, memo, active).encode())
+    else:
+        h.update(obj.unparse())
+    digest = h.hexdigest()
+    if obj.is_indirect:
+        active.discard(obj.objgen)
+        memo[obj.objgen] = digest
+    return digest
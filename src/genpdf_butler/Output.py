@@ -0,0 +1,63 @@
+import os
+import re
+
+# Parts of a PDF that change on every render of the same song: the
+# timestamps in its Info dictionary and the document /ID in its trailer
+_STRING = rb"(?:\((?:\\.|[^\\)])*\)|<[0-9A-Fa-f\s]*>)"
+VOLATILE = re.compile(
+    rb"(/CreationDate|/ModDate)\s*" + _STRING + rb"|"
+    rb"(/ID)\s*\[\s*" + _STRING + rb"\s*" + _STRING + rb"\s*\]",
+    re.DOTALL,
+)
+
+
+def tempPath(output):
+    # Hidden, beside the output so that it can be renamed into place, and
+    # still ending in .pdf since chordpro picks its backend by extension
+    directory, name = os.path.split(output)
+    return os.path.join(directory, f".genpdf-{os.getpid()}-{name}")
+
+
+def _normalized(data):
+    return VOLATILE.sub(lambda m: (m.group(1) or m.group(2)) + b"()", data)
+
+
+def samePDF(a, b):
+    # Whether two PDFs differ in nothing but their timestamps and /ID; a
+    # missing file is never the same
+    try:
+        if os.path.getsize(a) != os.path.getsize(b):
+            # The volatile fields have fixed widths, so outputs of different
+            # sizes differ elsewhere too
+            return False
+        with open(a, mode="rb") as f:
+            first = f.read()
+        with open(b, mode="rb") as f:
+            second = f.read()
+    except OSError:
+        return False
+    return first == second or _normalized(first) == _normalized(second)
+
+
+def publish(tmp, output):
+    # Move a finished render into place with a single rename, so readers
+    # never see a half-written PDF. An output with the same content is left
+    # alone, keeping its mtime, and sync tools skip it. Returns whether the
+    # output was replaced, or None when nothing was rendered.
+    if samePDF(tmp, output):
+        discard(tmp)
+        return False
+    try:
+        os.replace(tmp, output)
+    except FileNotFoundError:
+        # chordpro reported success without writing anything
+        return None
+    return True
+
+
+def discard(tmp):
+    try:
+        os.unlink(tmp)
+    except OSError:
+        return False
+    return True
@@ -1,61 +1,140 @@
+import logging
 import os
 import re
+import shutil
+import tempfile
 from pathlib import Path
 
+from genpdf_butler import Discovery
 
-def PatchColors(musicTarget):
-    # Function to get file extension (same as in GenPDF.py)
-    def ext(p):
-        return str(os.path.splitext(os.path.basename(p))[1]).lower()
+log = logging.getLogger(__name__)
 
-    extensions = [".chopro", ".cho"]
-    allFiles = []
+# OnSong color names that may follow "&" to color a line
+onsongColors = [
+    "blue",
+    "red",
+    "green",
+    "orange",
+    "purple",
+    "magenta",
+    "pink",
+    "brown",
+    "yellow",
+    "cyan",
+    "gray",
+    "grey",
+    "black",
+]
 
-    if os.path.exists(musicTarget):
-        if os.path.isdir(musicTarget):
-            print(
-                f"PatchColors: Processing all .chopro and .cho files "
-                f"in directory '{musicTarget}'"
-            )
-            for p in Path(musicTarget).rglob("*"):
-                if ext(p) in (extension.lower() for extension in extensions):
-                    allFiles.append(p)
-                    print(f"PatchColors: Found file to process: {p}")
+# One precompiled rule for every color: the tag (with the character before
+# it, an optional ":" or "/" and trailing spaces) is removed from the line
+onsongColor = re.compile(r".?&(" + "|".join(onsongColors) + r"):?/? *")
+
+
+def patchLines(lines):
+    # Translate OnSong "&color" markup into chordpro textcolour directives
+    # in a single streaming pass. Returns (as the generator's value) whether
+    # any markup was found, i.e. whether the output differs from the input
+    color = None
+    changed = False
+    for line in lines:
+        # Most lines carry no markup, and a substring test is much cheaper
+        # than running the regex over them
+        match = onsongColor.search(line) if "&" in line else None
+        if match:
+            if match.group(1) != color:
+                color = match.group(1)
+                yield f"{{textcolour: {color}}}\n"
+            changed = True
+            yield onsongColor.sub("", line)
         else:
-            if ext(musicTarget) in (
-                extension.lower() for extension in extensions
-            ):
-                allFiles.append(Path(musicTarget))
-                print(f"PatchColors: Processing single file '{musicTarget}'")
-    else:
-        print(f"PatchColors: no such file or folder '{musicTarget}'")
-        return
+            if color:
+                color = None
+                yield "{textcolour}\n"
+            yield line
 
-    onsongColor = re.compile(r"&blue:?")
+    if color:
+        yield "{textcolour}\n"
+    return changed
 
-    for p in allFiles:
+
+def patchStream(src, dst):
+    # Write the patched lines of src to dst without holding the song in
+    # memory; returns whether anything was changed
+    lines = patchLines(src)
+    while True:
         try:
-            with open(p, mode="r", encoding="utf-8") as f:
-                srcLines = f.readlines()
-
-            addColor = False
-            with open(p, mode="w", encoding="utf-8") as f:
-                for line in srcLines:
-                    if not addColor and onsongColor.search(line):
-                        addColor = True
-                        f.write("{textcolour: blue}\n")
-                    elif addColor and not onsongColor.search(line):
-                        addColor = False
-                        f.write("{textcolour}\n")
-
-                    if addColor:
-                        newL = re.sub(".?&blue:?/? *", "", line)
-                        f.write(newL)
-                    else:
-                        f.write(line)
-
-                if addColor:
-                    f.write("{textcolour}\n")
+            dst.write(next(lines))
+        except StopIteration as done:
+            return done.value
+
+
+def patchFile(p):
+    # Patch a song in place through a temporary sibling file, replacing the
+    # song only when its text actually changes; returns whether it did
+    fd, tmpPath = tempfile.mkstemp(
+        prefix=".genpdf-", suffix=".tmp", dir=os.path.dirname(p) or os.curdir
+    )
+    try:
+        with open(p, mode="r", encoding="utf-8") as src:
+            with open(fd, mode="w", encoding="utf-8") as dst:
+                changed = patchStream(src, dst)
+        if changed:
+            shutil.copymode(p, tmpPath)
+            os.replace(tmpPath, p)
+        return changed
+    finally:
+        if os.path.exists(tmpPath):
+            os.unlink(tmpPath)
+
 
+def stageSong(p, stageDir, root):
+    # Write the patched text of a song into the staging area, mirroring its
+    # path below root, and leave the song itself untouched
+    staged = Path(stageDir) / os.path.relpath(p, root)
+    staged.parent.mkdir(parents=True, exist_ok=True)
+    with open(p, mode="r", encoding="utf-8") as src:
+        with open(staged, mode="w", encoding="utf-8") as dst:
+            patchStream(src, dst)
+    return staged
+
+
+def patchSongs(musicTarget, songs, patched):
+    # Patch songs one at a time, as the consumer asks for them; every song
+    # whose text actually changes is appended to `patched` (so the caller
+    # knows exactly what to restore). Kept, with PatchColors, as library
+    # API: genpdf itself patches each song in createPDFs with patchFile,
+    # after the songs have been scheduled.
+    if not os.path.exists(musicTarget):
+        log.debug(f"PatchColors: no such file or folder '{musicTarget}'")
+        return
+    if os.path.isdir(musicTarget):
+        log.debug(
+            f"PatchColors: Processing all .chopro and .cho files "
+            f"in directory '{musicTarget}'"
+        )
+        # Songs may already have been discovered by the caller
+        if songs is None:
+            songs = Discovery.findSongs(musicTarget)
+    else:
+        if not Discovery.isSong(musicTarget):
+            return
+        log.debug(f"PatchColors: Processing single file '{musicTarget}'")
+        if songs is None:
+            songs = [Path(musicTarget)]
+    for p in songs:
+        if os.path.isdir(musicTarget):
+            log.debug(f"PatchColors: Found file to process: {p}")
+        try:
+            if patchFile(p):
+                patched.append(p)
         except Exception as e:
-            print(f"failed on file {str(p)}: {e}")
+            log.warning(f"failed on file {str(p)}: {e}")
+        yield p
+
+
+def PatchColors(musicTarget, songs=None):
+    patchedFiles = []
+    for p in patchSongs(musicTarget, songs, patchedFiles):
+        pass
+    return patchedFiles
@@ -0,0 +1,94 @@
+import logging
+import sys
+import time
+
+log = logging.getLogger(__name__)
+
+# Seconds between redraws of the progress line on a terminal, and between
+# progress lines in a log (CI) where every line is kept
+TTY_INTERVAL = 0.1
+LOG_INTERVAL = 10.0
+
+
+def newProgress(stream=None):
+    stream = stream or sys.stderr
+    try:
+        tty = stream.isatty()
+    except (AttributeError, ValueError):
+        tty = False
+    now = time.monotonic()
+    return {
+        "stream": stream,
+        "tty": tty,
+        "interval": TTY_INTERVAL if tty else LOG_INTERVAL,
+        "started": now,
+        "shown": now,
+        "planned": 0,
+        "total": None,
+        "done": 0,
+        "failed": 0,
+        "cached": 0,
+    }
+
+
+def planned(progress, count=1):
+    if progress is not None:
+        progress["planned"] += count
+
+
+def planComplete(progress):
+    # The total is only known once discovery has finished, which streaming
+    # builds reach some way into rendering
+    if progress is not None:
+        progress["total"] = progress["planned"]
+
+
+def advance(progress, failed=False, cached=False):
+    if progress is None:
+        return
+    progress["done"] += 1
+    progress["failed"] += failed
+    progress["cached"] += cached
+    now = time.monotonic()
+    if now - progress["shown"] >= progress["interval"]:
+        progress["shown"] = now
+        _show(progress, final=False)
+
+
+def finish(progress):
+    if progress is not None and progress["done"]:
+        _show(progress, final=True)
+
+
+def describe(progress, now=None):
+    elapsed = (now or time.monotonic()) - progress["started"]
+    done = progress["done"]
+    total = progress["total"]
+    parts = [f"{done}/{total} songs" if total is not None else f"{done} songs"]
+    if progress["failed"]:
+        parts.append(f"{progress['failed']} failed")
+    if progress["cached"]:
+        parts.append(f"{progress['cached']} cached")
+    rate = done / elapsed if elapsed > 0 else 0.0
+    parts.append(f"{rate:.1f}/s")
+    if total is not None and rate and done < total:
+        parts.append(f"ETA {_duration((total - done) / rate)}")
+    return ", ".join(parts)
+
+
+def _duration(seconds):
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    if minutes:
+        return f"{minutes}m{seconds:02}s"
+    return f"{seconds}s"
+
+
+def _show(progress, final):
+    line = describe(progress)
+    if progress["tty"]:
+        # Redraw a single line in place
+        stream = progress["stream"]
+        stream.write(f"\r\x1b[K{line}" + ("\n" if final else ""))
+        stream.flush()
+    else:
+        log.info(line)
@@ -0,0 +1,251 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# How much of a failing render's stderr is kept in the report
+STDERR_EXCERPT = 500
+
+
+def newReport(trace=False):
+    # openPhases holds the seconds spent in nested phases of each phase
+    # still running
+    report = {
+        "started": time.time(),
+        "phases": {},
+        "songs": [],
+        "openPhases": [],
+    }
+    if trace:
+        # Spans for a timeline (see Trace), relative to this instant
+        report["origin"] = time.perf_counter()
+        report["trace"] = []
+    return report
+
+
+@contextmanager
+def phase(report, name):
+    # Accumulate wall time per phase; a no-op when no report is wanted.
+    # Streaming runs discovery, patching and the like inside the render
+    # phase, so a phase is only charged the time not spent in the phases
+    # nested in it, and the totals add up to the run's wall time.
+    if report is None:
+        yield
+        return
+    openPhases = report["openPhases"]
+    openPhases.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        nested = openPhases.pop()
+        if openPhases:
+            openPhases[-1] += seconds
+        phases = report["phases"]
+        phases[name] = phases.get(name, 0.0) + seconds - nested
+        recordSpan(report, name, "phase", start, seconds)
+
+
+def recordSpan(report, name, category, start, seconds, track=None, args=None):
+    # A timed span for the trace: start is a time.perf_counter() value and
+    # track names the thread it ran on (the main thread when None)
+    if report is None or "trace" not in report:
+        return
+    report["trace"].append(
+        {
+            "name": name,
+            "category": category,
+            "start": start - report["origin"],
+            "seconds": seconds,
+            "track": track,
+            "args": args or {},
+        }
+    )
+
+
+def timed(report, name, iterable):
+    # Like phase, for the work a lazy producer (discovery, patching) does
+    # between the items it hands to a streaming consumer
+    if report is None:
+        return iterable
+    return _timed(report, name, iter(iterable))
+
+
+def _timed(report, name, iterator):
+    while True:
+        with phase(report, name):
+            item = next(iterator, _END)
+        if item is _END:
+            return
+        yield item
+
+
+_END = object()
+
+
+def recordSong(
+    report,
+    song,
+    output,
+    seconds,
+    returncode=None,
+    stderr="",
+    cache="miss",
+    sizeBefore=None,
+    replaced=None,
+):
+    if report is None:
+        return
+    try:
+        size = os.path.getsize(output)
+    except OSError:
+        size = None
+    report["songs"].append(
+        {
+            "song": str(song),
+            "output": str(output),
+            "seconds": round(seconds, 6),
+            "returncode": returncode,
+            "stderr": (stderr or "")[-STDERR_EXCERPT:],
+            "size": size,
+            # What chordpro wrote, when the PDF was optimized afterwards
+            "sizeBefore": sizeBefore,
+            "cache": cache,
+            # False when the render came out the same as the existing PDF,
+            # which was then left untouched
+            "replaced": replaced,
+        }
+    )
+
+
+def recordSchedule(report, jobs, discoveryMakespan, makespan):
+    # The render phase's makespan as dispatched, against the same renders
+    # dispatched in discovery order; the difference is what longest-first
+    # scheduling saved (or cost)
+    if report is None:
+        return
+    report["schedule"] = {
+        "jobs": jobs,
+        "makespan": round(makespan, 6),
+        "discoveryMakespan": round(discoveryMakespan, 6),
+        "savedSeconds": round(discoveryMakespan - makespan, 6),
+    }
+
+
+def summary(report):
+    songs = report["songs"]
+    rendered = [song for song in songs if song["cache"] == "miss"]
+    renderSeconds = report["phases"].get("render", 0.0)
+    return {
+        "started": report["started"],
+        "seconds": round(time.time() - report["started"], 6),
+        "phases": {
+            name: round(seconds, 6)
+            for name, seconds in report["phases"].items()
+        },
+        "songs": len(songs),
+        "rendered": len(rendered),
+        "cached": len(songs) - len(rendered),
+        "failed": sum(1 for song in rendered if song["returncode"] != 0),
+        "unchanged": _unchanged(songs),
+        "renderedPerSecond": (
+            round(len(rendered) / renderSeconds, 3) if renderSeconds else None
+        ),
+        "schedule": report.get("schedule"),
+        "optimized": _optimized(songs),
+    }
+
+
+def _unchanged(songs):
+    # Rendered songs whose PDF was kept as it was
+    return sum(1 for song in songs if song.get("replaced") is False)
+
+
+def _optimized(songs):
+    # Bytes chordpro wrote for the optimized songs, and what is left of them
+    optimized = [song for song in songs if song.get("sizeBefore") is not None]
+    if not optimized:
+        return None
+    return {
+        "songs": len(optimized),
+        "sizeBefore": sum(song["sizeBefore"] for song in optimized),
+        "size": sum(song["size"] or 0 for song in optimized),
+    }
+
+
+def writeReport(report, path):
+    _write(path, summary(report), report["songs"])
+
+
+def _write(path, summary, songs):
+    # .jsonl gets one line per song followed by a summary line (handy for
+    # appending to a history); anything else gets a single JSON document
+    with open(path, mode="w", encoding="utf-8") as f:
+        if str(path).endswith(".jsonl"):
+            for song in songs:
+                f.write(json.dumps({"type": "song", **song}) + "\n")
+            f.write(json.dumps({"type": "summary", **summary}) + "\n")
+        else:
+            json.dump({"summary": summary, "songs": songs}, f, indent=1)
+
+
+def readReport(path):
+    # Either format writeReport produces, as (summary, songs)
+    with open(path, mode="r", encoding="utf-8") as f:
+        if not str(path).endswith(".jsonl"):
+            data = json.load(f)
+            return data["summary"], data["songs"]
+        summary = None
+        songs = []
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            kind = entry.pop("type", None)
+            if kind == "summary":
+                summary = entry
+            elif kind == "song":
+                songs.append(entry)
+        return summary or {}, songs
+
+
+def mergeReports(paths):
+    # Shards run side by side: counts and phase totals add up, while the
+    # wall time of the whole build is that of the slowest shard
+    summaries = []
+    songs = []
+    for path in paths:
+        shardSummary, shardSongs = readReport(path)
+        summaries.append(shardSummary)
+        songs.extend(shardSongs)
+    songs.sort(key=lambda song: (song["song"], song["output"]))
+
+    phases = {}
+    for shardSummary in summaries:
+        for name, seconds in shardSummary.get("phases", {}).items():
+            phases[name] = round(phases.get(name, 0.0) + seconds, 6)
+    rendered = [song for song in songs if song["cache"] == "miss"]
+    seconds = max((s.get("seconds", 0.0) for s in summaries), default=0.0)
+    merged = {
+        "started": min(
+            (s["started"] for s in summaries if "started" in s), default=None
+        ),
+        "seconds": seconds,
+        "shards": len(summaries),
+        "phases": phases,
+        "songs": len(songs),
+        "rendered": len(rendered),
+        "cached": len(songs) - len(rendered),
+        "failed": sum(1 for song in rendered if song["returncode"] != 0),
+        "unchanged": _unchanged(songs),
+        "renderedPerSecond": (
+            round(len(rendered) / seconds, 3) if seconds else None
+        ),
+        "optimized": _optimized(songs),
+    }
+    return merged, songs
+
+
+def writeMerged(paths, path):
+    _write(path, *mergeReports(paths))
@@ -0,0 +1,119 @@
+import os
+import tempfile
+from pathlib import Path
+
+from genpdf_butler import Discovery
+
+
+def openRepo():
+    # GitPython is slow to import, so it is only loaded by runs that
+    # actually patch songs in place
+    from git import Repo
+
+    return Repo(path=".", search_parent_directories=True)
+
+
+def _repoPath(repo, path):
+    # git reports the working tree with symlinks resolved, so the path must
+    # be resolved too (e.g. a target reached through a link to the repo)
+    rel = os.path.relpath(
+        os.path.realpath(path), os.path.realpath(repo.working_tree_dir)
+    )
+    return rel.replace(os.sep, "/")
+
+
+def songPathspecs(repo, musicTarget):
+    # Limit git to the songs below the target instead of the whole repo
+    rel = _repoPath(repo, musicTarget)
+    if not os.path.isdir(musicTarget):
+        return [f":(literal){rel}"]
+    prefix = "" if rel == "." else rel + "/"
+    return [
+        f":(glob,icase){prefix}**/*{extension}"
+        for extension in Discovery.extensions
+    ]
+
+
+def dirtySongs(repo, pathspecs):
+    # One `git status` call reports both modified and untracked songs
+    status = repo.git.status(
+        "--porcelain=v1", "-z", "--untracked-files=all", "--", *pathspecs
+    )
+    modified = []
+    untracked = []
+    entries = iter(status.split("\0"))
+    for entry in entries:
+        if len(entry) < 4:
+            continue
+        code, path = entry[:2], entry[3:]
+        if code[0] in "RC":
+            # Renames and copies are followed by their source path
+            next(entries, None)
+        if not Discovery.isSong(path):
+            continue
+        if code == "??":
+            untracked.append(path)
+        elif code[1] != " ":
+            modified.append(path)
+    return modified, untracked
+
+
+def headCommit(repo):
+    return repo.head.commit.hexsha
+
+
+def changedSongs(repo, since, pathspecs):
+    # One `git diff` between the last built commit and HEAD lists the songs
+    # to render and the songs whose PDFs are now stale, without touching
+    # the rest of the library; None if git no longer knows the commit
+    from git import GitCommandError
+
+    try:
+        diff = repo.git.diff(
+            "--name-status", "-z", "-M", since, "HEAD", "--", *pathspecs
+        )
+    except GitCommandError:
+        return None
+    changed = []
+    removed = []
+    entries = iter(diff.split("\0"))
+    for code in entries:
+        if not code:
+            continue
+        path = next(entries, "")
+        if code[0] in "RC":
+            # Renames and copies list their source path first
+            if code[0] == "R":
+                removed.append(path)
+            path = next(entries, "")
+        if code[0] == "D":
+            removed.append(path)
+        else:
+            changed.append(path)
+    return _workingPaths(repo, changed), _workingPaths(repo, removed)
+
+
+def _workingPaths(repo, paths):
+    return [
+        Path(os.path.relpath(os.path.join(repo.working_tree_dir, path)))
+        for path in paths
+        if Discovery.isSong(path)
+    ]
+
+
+def restoreSongs(repo, paths):
+    # Hand git every patched song in a single `git restore`, reading the
+    # pathspecs from a file so the command line stays short
+    if not paths:
+        return
+    with tempfile.TemporaryFile() as pathspecFile:
+        for path in paths:
+            pathspecFile.write(
+                f":(literal){_repoPath(repo, path)}\0".encode("utf-8")
+            )
+        pathspecFile.seek(0)
+        repo.git.restore(
+            "--pathspec-from-file=-",
+            "--pathspec-file-nul",
+            istream=pathspecFile,
+        )
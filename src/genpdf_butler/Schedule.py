@@ -0,0 +1,41 @@
+import heapq
+import os
+
+
+def inputSize(paths):
+    size = 0
+    for path in paths:
+        try:
+            size += os.path.getsize(path)
+        except OSError:
+            pass
+    return size
+
+
+def expectedCosts(renders, timings):
+    # Seconds each render (or song) is expected to take: what it took last
+    # time, or for new songs an estimate from their size at the seconds per
+    # byte the known songs of this run took (with none known, only the
+    # relative size matters)
+    known = [r for r in renders if r["key"] in timings]
+    sizes = sum(r["size"] for r in known)
+    rate = sum(timings[r["key"]] for r in known) / sizes if sizes else 1.0
+    return [timings.get(r["key"], r["size"] * rate) for r in renders]
+
+
+def longestFirst(renders, timings):
+    # Start the longest renders first, so that the build does not end with
+    # one worker still busy on a long song while the others sit idle; ties
+    # keep discovery order
+    costs = expectedCosts(renders, timings)
+    order = sorted(range(len(renders)), key=lambda i: -costs[i])
+    return [renders[i] for i in order]
+
+
+def makespan(durations, workers):
+    # Wall time of dispatching the durations in order, each to the first
+    # worker that is free
+    free = [0.0] * max(workers, 1)
+    for duration in durations:
+        heapq.heappush(free, heapq.heappop(free) + duration)
+    return max(free)
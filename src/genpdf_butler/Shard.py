@@ -0,0 +1,66 @@
+import heapq
+import os
+import statistics
+
+from genpdf_butler import Manifest
+
+
+def parseShard(text):
+    # "i/N" with 1 <= i <= N, as in --shard 2/4
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError(f"--shard must look like i/N, not '{text}'")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"--shard {text}: need 1 <= i <= N")
+    return index, count
+
+
+def assignUnits(units, count, costs=None):
+    # Longest processing time first: the most expensive unit goes to the
+    # least loaded shard. Units without a recorded cost count as the median
+    # of the known ones, so with no costs at all this deals units out
+    # round-robin and balances the file count. Ties are broken by unit name
+    # and shard number, so every node computes the same assignment.
+    costs = costs or {}
+    known = [costs[unit] for unit in units if unit in costs]
+    default = statistics.median(known) if known else 1.0
+    shards = [(0.0, shard) for shard in range(1, count + 1)]
+    assignment = {}
+    for unit in sorted(units, key=lambda u: (-costs.get(u, default), u)):
+        load, shard = heapq.heappop(shards)
+        assignment[unit] = shard
+        heapq.heappush(shards, (load + costs.get(unit, default), shard))
+    return assignment
+
+
+def shardSongs(songs, index, count, unitOf, costs=None):
+    # Keep the songs whose unit (the song itself, or its songbook folder)
+    # belongs to this shard, in their original order
+    songs = list(songs)
+    units = [unitOf(song) for song in songs]
+    assignment = assignUnits(set(units), count, costs)
+    return [
+        song for song, unit in zip(songs, units) if assignment[unit] == index
+    ]
+
+
+def shardBuild(musicTarget, songs, index, count, songbook=False, costs=None):
+    # Songbooks are rendered by one chordpro process per folder, so a
+    # folder is never split between shards. Every node must compute the
+    # same split, so costs only come from a file they all read and none of
+    # them writes (e.g. a manifest merged after the previous run); without
+    # one, shards get equal numbers of songs.
+    keyFile = Manifest.manifestPath(musicTarget)
+    unitCosts = None
+    if costs is not None:
+        unitCosts = Manifest.unitCosts(Manifest.loadManifest(costs))
+
+    def unitOf(song):
+        if songbook:
+            from genpdf_butler.GenPDF import bookOutput
+
+            song = bookOutput(os.path.dirname(song))
+        return Manifest.songKey(song, keyFile)
+
+    return shardSongs(songs, index, count, unitOf, unitCosts)
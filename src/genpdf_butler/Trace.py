@@ -0,0 +1,62 @@
+import json
+import os
+
+# Track of the spans recorded without one: the main thread, which
+# discovers, patches and drives the renderers
+MAIN_TRACK = "main"
+
+
+def statsPath(tracePath):
+    # trace.json -> trace.pstats, for `python -m pstats` or snakeviz
+    return os.path.splitext(tracePath)[0] + ".pstats"
+
+
+def traceEvents(report):
+    # Chrome trace event format: complete ("X") events in microseconds, one
+    # thread per track so that concurrent renders sit on separate rows
+    tracks = {MAIN_TRACK: 0}
+    events = []
+    for span in report.get("trace", []):
+        track = span["track"] or MAIN_TRACK
+        tid = tracks.setdefault(track, len(tracks))
+        events.append(
+            {
+                "name": span["name"],
+                "cat": span["category"],
+                "ph": "X",
+                "ts": round(span["start"] * 1e6, 3),
+                "dur": round(span["seconds"] * 1e6, 3),
+                "pid": 1,
+                "tid": tid,
+                "args": span["args"],
+            }
+        )
+    names = [
+        {
+            "name": "thread_name",
+            "ph": "M",
+            "pid": 1,
+            "tid": tid,
+            "args": {"name": track},
+        }
+        for track, tid in tracks.items()
+    ]
+    names.append(
+        {
+            "name": "process_name",
+            "ph": "M",
+            "pid": 1,
+            "tid": 0,
+            "args": {"name": "genpdf"},
+        }
+    )
+    return names + sorted(
+        events, key=lambda event: (event["tid"], event["ts"])
+    )
+
+
+def writeTrace(report, path):
+    with open(path, mode="w", encoding="utf-8") as f:
+        json.dump(
+            {"traceEvents": traceEvents(report), "displayTimeUnit": "ms"}, f
+        )
@@ -0,0 +1,112 @@
+import os
+import queue
+import time
+from pathlib import Path
+
+from genpdf_butler import Discovery
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # optional: pip install genpdf_butler[watch]
+    Observer = None
+
+
+def snapshot(musicTarget):
+    # Song path -> (mtime, size) for everything discovery would render
+    state = {}
+    for song in Discovery.findSongs(musicTarget):
+        try:
+            st = os.stat(song)
+        except OSError:
+            continue
+        state[song] = (st.st_mtime_ns, st.st_size)
+    return state
+
+
+def diffSnapshots(old, new):
+    changed = sorted(song for song, sig in new.items() if old.get(song) != sig)
+    removed = sorted(song for song in old if song not in new)
+    return changed, removed
+
+
+def pollChanges(musicTarget, interval=1.0, debounce=0.5, sleep=time.sleep):
+    # Yield sorted lists of songs that were added or modified. A burst of
+    # saves is collected until the tree has been quiet for `debounce`
+    # seconds, so each song is rendered once per burst
+    state = snapshot(musicTarget)
+    while True:
+        sleep(interval)
+        current = snapshot(musicTarget)
+        changed, _ = diffSnapshots(state, current)
+        if not changed:
+            state = current
+            continue
+
+        pending = set(changed)
+        while True:
+            sleep(debounce)
+            latest = snapshot(musicTarget)
+            more, gone = diffSnapshots(current, latest)
+            current = latest
+            if not more and not gone:
+                break
+            pending.update(more)
+        state = current
+        batch = sorted(song for song in pending if song in current)
+        if batch:
+            yield batch
+
+
+def eventChanges(musicTarget, debounce=0.5):
+    # Same contract as pollChanges, driven by file system notifications
+    # (inotify on Linux) instead of rescanning the tree
+    root = os.path.abspath(musicTarget)
+    patterns = Discovery.loadIgnore(root)
+    events = queue.Queue()
+
+    class SongEvents(FileSystemEventHandler):
+        # Only writes count: watchdog also reports songs being opened and
+        # read, which staging and rendering a song do themselves
+        def on_created(self, event):
+            self.changed(event.src_path, event)
+
+        def on_modified(self, event):
+            self.changed(event.src_path, event)
+
+        def on_moved(self, event):
+            # Renames report the new name (editors often save that way)
+            self.changed(event.dest_path, event)
+
+        def changed(self, path, event):
+            if event.is_directory:
+                return
+            if Discovery.wanted(root, path, patterns):
+                events.put(Path(musicTarget) / os.path.relpath(path, root))
+
+    observer = Observer()
+    observer.schedule(SongEvents(), root, recursive=True)
+    observer.start()
+    try:
+        while True:
+            try:
+                pending = {events.get(timeout=1.0)}
+            except queue.Empty:
+                continue
+            while True:
+                try:
+                    pending.add(events.get(timeout=debounce))
+                except queue.Empty:
+                    break
+            batch = sorted(song for song in pending if song.exists())
+            if batch:
+                yield batch
+    finally:
+        observer.stop()
+        observer.join()
+
+
+def watchChanges(musicTarget, debounce=0.5, interval=1.0):
+    if Observer is not None and os.path.isdir(musicTarget):
+        return eventChanges(musicTarget, debounce)
+    return pollChanges(musicTarget, interval, debounce)
@@ -1,10 +1,40 @@
 import argparse
 import os
+import signal
+import subprocess
 import sys
 
-from git import Repo
 
-from genpdf_butler import GenPDF, PatchTextColor
+def _terminate(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _configureLogging(verbosity):
+    import logging
+
+    class StderrHandler(logging.StreamHandler):
+        # Always writes to the current sys.stderr, which may be swapped
+        # after the handler is installed
+        @property
+        def stream(self):
+            return sys.stderr
+
+        @stream.setter
+        def stream(self, value):
+            pass
+
+    logger = logging.getLogger("genpdf_butler")
+    logger.setLevel(
+        {-1: logging.WARNING, 0: logging.INFO, 1: logging.DEBUG}[verbosity]
+    )
+    # main() may run more than once in a process (tests, the watcher's
+    # callers), but only ever installs one handler
+    if not any(h.get_name() == "genpdf" for h in logger.handlers):
+        handler = StderrHandler()
+        handler.set_name("genpdf")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    return logger
 
 
 def main():
@@ -15,42 +45,513 @@ def main():
         default=os.getcwd(),
         help=".chopro filename or directory containing .chopro files",
     )
-    parser.add_argument("--pagesize", type=str, default="a6")
-    parser.add_argument("--showchords", type=str, default="false")
+    parser.add_argument(
+        "--pagesize",
+        type=str,
+        default="a6",
+        help="page size, or a comma separated list of page sizes to build "
+        "several variants of every song in one run (e.g. a6,a4,letter)",
+    )
+    parser.add_argument(
+        "--showchords",
+        type=str,
+        default="false",
+        help="show chord diagrams (true/false), or a comma separated list "
+        "paired with the --pagesize list",
+    )
+    parser.add_argument(
+        "--jobs",
+        default=str(os.cpu_count() or 1),
+        metavar="N|MIN:MAX|auto",
+        help="number of chordpro renders to run in parallel, or bounds "
+        "between which to scale them with the host's free memory and load "
+        "('auto' is 1:number of CPUs) (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=300,
+        metavar="SECONDS",
+        help="kill a chordpro render that runs longer than this, keeping "
+        "the previous PDF; 0 means no limit (default: 300)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=1,
+        help="retry renders that timed out or were killed by a signal this "
+        "many times (default: 1)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only render songs whose patched source, chordpro settings "
+        "or chordpro version changed since the last build",
+    )
+    parser.add_argument(
+        "--staged",
+        action="store_true",
+        help="render patched copies from a temporary staging area instead "
+        "of patching songs in place (no git repository needed)",
+    )
+    parser.add_argument(
+        "--songbook",
+        action="store_true",
+        help="render each folder's songs into one combined PDF named after "
+        "the folder, with a single chordpro process per folder",
+    )
+    parser.add_argument(
+        "--report",
+        metavar="PATH",
+        help="write a machine-readable run report (per-song timings, exit "
+        "codes and phase totals) as JSON, or as JSON Lines if PATH ends "
+        "in .jsonl",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and re-render songs as they are saved (implies "
+        "--staged; uses watchdog when installed, polling otherwise)",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.5,
+        metavar="SECONDS",
+        help="with --watch, wait until saves have stopped for this long "
+        "before rendering (default: 0.5)",
+    )
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const="",
+        metavar="DIR",
+        help="reuse PDFs from a content-addressed cache shared by every "
+        "checkout on this host (default DIR: $XDG_CACHE_HOME/genpdf_butler)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=1024,
+        metavar="MB",
+        help="with --cache, evict least recently used PDFs beyond this "
+        "size (default: 1024)",
+    )
+    parser.add_argument(
+        "--changed",
+        action="store_true",
+        help="only render songs changed in git since the last complete "
+        "build (whose commit is recorded in the manifest), and remove the "
+        "PDFs of deleted or renamed songs",
+    )
+    parser.add_argument(
+        "--shard",
+        metavar="i/N",
+        help="only render the i-th of N deterministic shares of the songs, "
+        "balanced by file count or by --shard-costs; see genpdf-merge for "
+        "combining the shards' results",
+    )
+    parser.add_argument(
+        "--shard-costs",
+        metavar="PATH",
+        help="balance --shard by the render times in this manifest (e.g. "
+        "the shards' manifests merged after the last run); it is only read, "
+        "so every shard computes the same split",
+    )
+    parser.add_argument(
+        "--manifest",
+        metavar="PATH",
+        help="keep the build manifest here instead of in the target folder "
+        "(it is kept for --incremental/--changed, or whenever this is given, "
+        "and records the render times parallel builds schedule by; with "
+        "--shard, each shard defaults to its own)",
+    )
+    parser.add_argument(
+        "--where",
+        action="append",
+        default=[],
+        metavar="FIELD=PATTERN",
+        help="only render songs whose FIELD (title, artist, key, tag or "
+        "path) matches PATTERN (case-insensitive, * and ? wildcards), as "
+        "recorded in the library's metadata index; may be repeated",
+    )
+    parser.add_argument(
+        "--setlist",
+        metavar="FILE",
+        help="only render the songs listed in FILE, one per line by path "
+        "below the target or by title",
+    )
+    parser.add_argument(
+        "--reindex",
+        action="store_true",
+        help="rebuild the library's metadata index from scratch (the index "
+        "is otherwise kept up to date by every full build once it exists)",
+    )
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument(
+        "-q",
+        "--quiet",
+        dest="verbosity",
+        action="store_const",
+        const=-1,
+        default=0,
+        help="only report warnings and errors (no progress)",
+    )
+    verbosity.add_argument(
+        "-v",
+        "--verbose",
+        dest="verbosity",
+        action="store_const",
+        const=1,
+        help="report every song (chordpro output, cache hits, patching)",
+    )
+    parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="shrink each rendered PDF (recompressed streams, one copy of "
+        "each font and image, no unused resources); needs pikepdf: pip "
+        "install genpdf_butler[optimize]",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="TRACE",
+        help="write a timeline of the run's phases and chordpro renders to "
+        "TRACE (Chrome trace JSON, for chrome://tracing, Perfetto or "
+        "speedscope) and a Python profile beside it (TRACE with a .pstats "
+        "suffix)",
+    )
+    parser.add_argument(
+        "--no-git",
+        action="store_true",
+        help="never look for a git repository (implies --staged)",
+    )
     args = parser.parse_args()
+    from genpdf_butler import Concurrency
+
+    try:
+        minJobs, args.jobs = Concurrency.parseJobs(args.jobs)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.timeout < 0:
+        parser.error("--timeout cannot be negative")
+    if args.retries < 0:
+        parser.error("--retries cannot be negative")
+    if args.cache_size < 1:
+        parser.error("--cache-size must be at least 1")
+    if args.changed and (args.staged or args.no_git or args.watch):
+        parser.error(
+            "--changed needs git and cannot be combined with --staged, "
+            "--no-git or --watch"
+        )
+    if args.optimize:
+        from genpdf_butler import Optimize
+
+        if not Optimize.available():
+            parser.error(
+                "--optimize needs pikepdf: pip install genpdf_butler[optimize]"
+            )
+    if args.profile and args.watch:
+        parser.error("--profile cannot be combined with --watch")
+    where = []
+    if args.where or args.setlist or args.reindex:
+        from genpdf_butler import Index
+
+        if args.watch or args.changed or args.songbook:
+            parser.error(
+                "--where, --setlist and --reindex cannot be combined with "
+                "--watch, --changed or --songbook"
+            )
+        try:
+            where = [Index.parseWhere(text) for text in args.where]
+        except ValueError as e:
+            parser.error(str(e))
+    shard = None
+    if args.shard:
+        from genpdf_butler import Shard
+
+        if args.watch:
+            parser.error("--shard cannot be combined with --watch")
+        try:
+            shard = Shard.parseShard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.shard_costs:
+        parser.error("--shard-costs needs --shard")
+
+    args.minJobs = minJobs if minJobs < args.jobs else None
+    args.where = where
+    args.shard = shard
+
+    log = _configureLogging(args.verbosity)
+    if not args.profile:
+        _build(parser, args, log)
+        return
 
-    print("Generating Music List (this takes a few seconds)", file=sys.stderr)
+    # Only the main thread is profiled: discovery, patching, git and the
+    # bookkeeping around renders; the renders themselves are on the trace
+    import cProfile
+
+    from genpdf_butler import Trace
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        _build(parser, args, log)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(Trace.statsPath(args.profile))
+
+
+def _build(parser, args, log):
+    log.info("Generating Music List (this takes a few seconds)")
 
     musictarget = args.musictarget
     pagesize = args.pagesize
     showchords = args.showchords
+    jobs = args.jobs
+    incremental = args.incremental
+
+    # The rendering pipeline is imported only once the arguments are known,
+    # so that `genpdf --help` and argument errors return immediately
+    from genpdf_butler import Discovery, GenPDF, Report
 
-    repo = Repo(path=".", search_parent_directories=True)
-
-    # Check if any .chopro or .cho files are modified or untracked
-    dirty_chopro_files = [
-        item.a_path
-        for item in repo.index.diff(None)
-        if item.a_path.endswith((".chopro", ".cho"))
-    ]
-    untracked_chopro_files = [
-        f for f in repo.untracked_files if f.endswith((".chopro", ".cho"))
-    ]
-
-    if dirty_chopro_files or untracked_chopro_files:
-        print(
-            "Cannot operate on a repo with .chopro/.cho changes -- "
-            "commit, discard, or stash your .chopro/.cho changes and try again"
+    try:
+        GenPDF.variants(pagesize, showchords)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Before anything is discovered or patched, so that a missing or broken
+    # chordpro fails at once rather than once per song
+    try:
+        path, version = GenPDF.probeChordpro()
+    except (OSError, subprocess.TimeoutExpired) as e:
+        log.error(f"Cannot run chordpro: {e}")
+        sys.exit(1)
+    log.debug(f"Using {version} ({path})")
+
+    report = None
+    if args.report or args.profile:
+        report = Report.newReport(trace=bool(args.profile))
+    where = args.where
+    shard = args.shard
+    if shard:
+        from genpdf_butler import Shard
+
+        if not args.manifest and (incremental or args.changed):
+            from genpdf_butler import Manifest
+
+            # Shards run at the same time and must not share a manifest
+            args.manifest = Manifest.shardManifestPath(musictarget, *shard)
+
+    # The metadata index is created by the first selective build (or
+    # --reindex) and from then on updated by every full build's discovery
+    index = None
+    selected = None
+    if os.path.isdir(musictarget) and not (args.watch or args.changed):
+        from genpdf_butler import Index
+
+        indexFile = Index.indexPath(musictarget)
+        indexed = os.path.exists(indexFile)
+        if indexed or where or args.setlist or args.reindex:
+            index = Index.openIndex(indexFile)
+        if where or args.setlist:
+            setlist = None
+            if args.setlist:
+                try:
+                    setlist = Index.readSetlist(args.setlist)
+                except OSError as e:
+                    parser.error(f"cannot read --setlist: {e}")
+            with Report.phase(report, "index"):
+                if args.reindex or not indexed:
+                    Index.updateIndex(index, musictarget, rebuild=True)
+                selected = Index.select(index, musictarget, where, setlist)
+            log.info(f"{len(selected)} songs selected")
+    elif args.where or args.setlist:
+        parser.error("--where and --setlist need a library folder")
+
+    def discover():
+        if selected is not None:
+            return selected
+        songs = Discovery.findSongs(musictarget)
+        if index is not None:
+            songs = Index.indexing(index, musictarget, songs, args.reindex)
+        return Report.timed(report, "discovery", songs)
+
+    cache = args.cache
+    if cache == "":
+        from genpdf_butler import Cache
+
+        cache = Cache.defaultCacheDir()
+    renderOptions = dict(
+        cache=cache,
+        cacheSize=args.cache_size << 20,
+        timeout=args.timeout or None,
+        retries=args.retries,
+        # Per-song detail already shows progress when verbose
+        progress=args.verbosity == 0,
+        manifestFile=args.manifest,
+        minJobs=args.minJobs,
+        optimize=args.optimize,
+    )
+
+    # A terminated build unwinds like Ctrl-C: running renders are killed,
+    # their partial output removed and patched songs restored
+    signal.signal(signal.SIGTERM, _terminate)
+
+    if args.watch:
+        # Imported here so that watchdog is only loaded when watching
+        from genpdf_butler import Watch
+
+        # Songs are being edited while we run, so they are never patched in
+        # place: each burst of saves is rendered from staged copies
+        log.info(f"Watching '{musictarget}' for changes (Ctrl-C to stop)")
+        try:
+            for changed in Watch.watchChanges(
+                musictarget, debounce=args.debounce
+            ):
+                if args.songbook:
+                    changed = Discovery.withFolderSongs(musictarget, changed)
+                GenPDF.createPDFs(
+                    musictarget,
+                    pagesize,
+                    showchords,
+                    jobs=jobs,
+                    incremental=incremental,
+                    staged=True,
+                    songs=changed,
+                    songbook=args.songbook,
+                    **renderOptions,
+                )
+        except KeyboardInterrupt:
+            log.info("Stopped watching")
+        return
+
+    if args.staged or args.no_git:
+        # Sources are never modified, so there is nothing to check or
+        # restore; songs are staged as the renderers ask for them
+        songs = discover()
+        if shard:
+            songs = Shard.shardBuild(
+                musictarget, songs, *shard, args.songbook, args.shard_costs
+            )
+        GenPDF.createPDFs(
+            musictarget,
+            pagesize,
+            showchords,
+            jobs=jobs,
+            incremental=incremental,
+            staged=True,
+            songs=songs,
+            songbook=args.songbook,
+            report=report,
+            **renderOptions,
         )
-        if dirty_chopro_files:
-            print("Modified .chopro/.cho files:", dirty_chopro_files)
-        if untracked_chopro_files:
-            print("Untracked .chopro/.cho files:", untracked_chopro_files)
     else:
-        PatchTextColor.PatchColors(musictarget)
-        GenPDF.createPDFs(musictarget, pagesize, showchords)
-        repo.git.restore("*.chopro")
-        repo.git.restore("*.cho")
+        from genpdf_butler import Repository
+
+        with Report.phase(report, "git"):
+            repo = Repository.openRepo()
+
+            # Check if any .chopro or .cho files below the target are
+            # modified or untracked
+            pathspecs = Repository.songPathspecs(repo, musictarget)
+            dirty_chopro_files, untracked_chopro_files = Repository.dirtySongs(
+                repo, pathspecs
+            )
+
+        if dirty_chopro_files or untracked_chopro_files:
+            log.error(
+                "Cannot operate on a repo with .chopro/.cho changes -- "
+                "commit, discard, or stash your .chopro/.cho changes and "
+                "try again"
+            )
+            if dirty_chopro_files:
+                log.error(f"Modified .chopro/.cho files: {dirty_chopro_files}")
+            if untracked_chopro_files:
+                log.error(
+                    f"Untracked .chopro/.cho files: {untracked_chopro_files}"
+                )
+            return
+
+        songs = None
+        if args.changed:
+            from genpdf_butler import Manifest
+
+            # The recorded commit only stands for a build of the same kind
+            manifestFile = args.manifest or Manifest.manifestPath(musictarget)
+            buildKey = Manifest.settingsHash(
+                [pagesize, showchords, str(args.songbook)]
+            )
+            with Report.phase(report, "git"):
+                head = Repository.headCommit(repo)
+                since = Manifest.lastBuild(
+                    Manifest.loadManifest(manifestFile), buildKey
+                )
+                changes = None
+                if since:
+                    changes = Repository.changedSongs(repo, since, pathspecs)
+            if changes is not None:
+                songs, removed = changes
+                if os.path.isdir(musictarget):
+                    patterns = Discovery.loadIgnore(musictarget)
+                    songs, removed = (
+                        [
+                            song
+                            for song in paths
+                            if Discovery.wanted(musictarget, song, patterns)
+                        ]
+                        for paths in (songs, removed)
+                    )
+                if args.songbook and (songs or removed):
+                    songs = Discovery.withFolderSongs(
+                        musictarget, songs + removed
+                    )
+                GenPDF.removeOutputs(
+                    removed, pagesize, showchords, songbook=args.songbook
+                )
+                log.info(f"{len(songs)} songs changed since {since[:12]}")
+
+        # Discovery, patching and rendering are chained: createPDFs patches
+        # each song in place just before handing it to the renderers, so the
+        # first PDFs do not wait for the whole library
+        if songs is None:
+            songs = discover()
+        if shard:
+            # Every node must see the whole library to agree on the split
+            songs = Shard.shardBuild(
+                musictarget, songs, *shard, args.songbook, args.shard_costs
+            )
+        failed = []
+        if songs or not args.changed:
+            patched = []
+            try:
+                failed = GenPDF.createPDFs(
+                    musictarget,
+                    pagesize,
+                    showchords,
+                    jobs=jobs,
+                    incremental=incremental,
+                    songs=songs,
+                    patched=patched,
+                    songbook=args.songbook,
+                    report=report,
+                    **renderOptions,
+                )
+            finally:
+                # Patched songs are put back even when rendering fails
+                with Report.phase(report, "git"):
+                    Repository.restoreSongs(repo, patched)
+        if args.changed and not failed:
+            # Failed songs are retried by the next run
+            Manifest.recordBuild(manifestFile, head, buildKey)
+
+    if args.report:
+        Report.writeReport(report, args.report)
+    if args.profile:
+        from genpdf_butler import Trace
+
+        Trace.writeTrace(report, args.profile)
+        log.info(f"Wrote trace to {args.profile}")
 
 
 if __name__ == "__main__":
@@ -1,11 +1,25 @@
 """Shared test fixtures and configuration."""
 
+import os
+import subprocess
+import sys
 import tempfile
 from pathlib import Path
+from unittest.mock import patch
 
 import pytest
 
 
+@pytest.fixture(autouse=True)
+def _isolated_user_cache(tmp_path, monkeypatch):
+    """Keep generated chordpro configs and probes out of ~/.cache."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "xdg-cache"))
+    from genpdf_butler import GenPDF
+
+    GenPDF.probeChordpro.cache_clear()
+    GenPDF.chordproVersion.cache_clear()
+
+
 @pytest.fixture
 def temp_dir():
     """Create a temporary directory for tests."""
@@ -62,3 +76,36 @@ def create_test_files(temp_dir):
         return created_files
 
     return _create_files
+
+
+@pytest.fixture
+def mock_chordpro():
+    """Replace the chordpro subprocess with a successful no-op.
+
+    Returns:
+        The mock standing in for the GenPDF module's chordpro runner
+    """
+
+    def _run(cmd, **kwargs):
+        return subprocess.CompletedProcess(cmd, 0, stdout="", stderr="")
+
+    with patch("genpdf_butler.GenPDF._run", side_effect=_run) as mock_run:
+        yield mock_run
+
+
+@pytest.fixture
+def fake_chordpro(temp_dir, monkeypatch):
+    """Put the benchmark suite's fake chordpro first on PATH.
+
+    Returns:
+        Path of the installed chordpro executable
+    """
+    if sys.platform == "win32":
+        pytest.skip("the fake chordpro is a POSIX shell wrapper")
+    from benchmarks import fake_chordpro as stub
+
+    bin_dir = temp_dir / "bin"
+    executable = stub.install(str(bin_dir))
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("GENPDF_FAKE_CHORDPRO_LATENCY", "0")
+    return Path(executable)
@@ -0,0 +1,156 @@
+"""Tests for Cache module."""
+
+import os
+import threading
+import time
+
+from genpdf_butler import Cache
+
+FINGERPRINT = {"source": "abc", "settings": "def", "chordpro": "6.0"}
+
+
+class TestCache:
+    """Test cases for the shared content-addressed PDF cache."""
+
+    def test_key_depends_on_every_fingerprint_field(self):
+        """Test that any fingerprint change gives a different key."""
+        key = Cache.cacheKey(FINGERPRINT)
+        assert key == Cache.cacheKey(dict(reversed(FINGERPRINT.items())))
+        for field in FINGERPRINT:
+            assert key != Cache.cacheKey({**FINGERPRINT, field: "other"})
+
+    def test_default_dir_follows_xdg(self, monkeypatch, temp_dir):
+        """Test that XDG_CACHE_HOME is honoured."""
+        monkeypatch.setenv("XDG_CACHE_HOME", str(temp_dir))
+        assert Cache.defaultCacheDir() == str(temp_dir / "genpdf_butler")
+
+    def test_miss_then_store_then_hit(self, temp_dir):
+        """Test that a stored PDF is handed out to another checkout."""
+        cacheDir = str(temp_dir / "cache")
+        key = Cache.cacheKey(FINGERPRINT)
+        first = temp_dir / "one" / "song.pdf"
+        second = temp_dir / "two" / "song.pdf"
+        first.parent.mkdir()
+        second.parent.mkdir()
+        first.write_bytes(b"%PDF-1.4 rendered")
+
+        assert not Cache.fetch(cacheDir, key, str(second))
+        assert not second.exists()
+        assert Cache.store(cacheDir, key, str(first))
+        assert Cache.fetch(cacheDir, key, str(second))
+        assert second.read_bytes() == b"%PDF-1.4 rendered"
+        assert not [p for p in os.listdir(second.parent) if p.endswith(".tmp")]
+
+    def test_store_is_a_copy(self, temp_dir):
+        """Test that rewriting the rendered PDF leaves the cache intact."""
+        cacheDir = str(temp_dir / "cache")
+        key = Cache.cacheKey(FINGERPRINT)
+        pdf = temp_dir / "song.pdf"
+        pdf.write_bytes(b"original")
+        Cache.store(cacheDir, key, str(pdf))
+
+        with open(pdf, mode="wb") as f:
+            f.write(b"rewritten")
+
+        with open(Cache.entryPath(cacheDir, key), mode="rb") as f:
+            assert f.read() == b"original"
+
+    def test_hit_leaves_an_identical_output_untouched(self, temp_dir):
+        """Test that fetching over the same PDF keeps its mtime."""
+        cacheDir = str(temp_dir / "cache")
+        key = Cache.cacheKey(FINGERPRINT)
+        pdf = temp_dir / "song.pdf"
+        pdf.write_bytes(b"%PDF-1.4 rendered")
+        Cache.store(cacheDir, key, str(pdf))
+        os.utime(pdf, (1_000_000_000, 1_000_000_000))
+        inode = pdf.stat().st_ino
+
+        assert Cache.fetch(cacheDir, key, str(pdf))
+
+        assert pdf.stat().st_ino == inode
+        assert pdf.stat().st_mtime == 1_000_000_000
+
+    def test_hit_leaves_other_checkouts_untouched(self, temp_dir):
+        """Test that a hit does not change outputs fetched elsewhere."""
+        cacheDir = str(temp_dir / "cache")
+        key = Cache.cacheKey(FINGERPRINT)
+        rendered = temp_dir / "song.pdf"
+        rendered.write_bytes(b"%PDF-1.4 rendered")
+        Cache.store(cacheDir, key, str(rendered))
+        first = temp_dir / "one" / "song.pdf"
+        second = temp_dir / "two" / "song.pdf"
+        first.parent.mkdir()
+        second.parent.mkdir()
+        assert Cache.fetch(cacheDir, key, str(first))
+        os.utime(first, (1_000_000_000, 1_000_000_000))
+
+        assert Cache.fetch(cacheDir, key, str(second))
+
+        assert first.stat().st_mtime == 1_000_000_000
+        assert not os.path.samefile(first, Cache.entryPath(cacheDir, key))
+
+    def test_evict_removes_least_recently_used(self, temp_dir):
+        """Test that eviction keeps the most recently used entries."""
+        cacheDir = str(temp_dir / "cache")
+        pdf = temp_dir / "song.pdf"
+        keys = []
+        for i in range(4):
+            pdf.write_bytes(b"x" * 100)
+            key = Cache.cacheKey({**FINGERPRINT, "source": str(i)})
+            Cache.store(cacheDir, key, str(pdf))
+            past = time.time() - 100 + i
+            os.utime(Cache.entryPath(cacheDir, key), (past, past))
+            keys.append(key)
+        # A hit makes the oldest entry the most recent one
+        assert Cache.fetch(cacheDir, keys[0], str(pdf))
+
+        assert Cache.evict(cacheDir, maxBytes=250) == 2
+
+        kept = [
+            key
+            for key in keys
+            if os.path.exists(Cache.entryPath(cacheDir, key))
+        ]
+        assert kept == [keys[0], keys[3]]
+
+    def test_evict_cleans_up_abandoned_temp_files(self, temp_dir):
+        """Test that temp files from crashed writers are removed."""
+        cacheDir = str(temp_dir / "cache")
+        stale = temp_dir / "cache" / "pdf" / "ab" / ".genpdf-x.tmp"
+        stale.parent.mkdir(parents=True)
+        stale.write_bytes(b"partial")
+        past = time.time() - 2 * Cache.STALE_TMP_SECONDS
+        os.utime(stale, (past, past))
+
+        Cache.evict(cacheDir)
+
+        assert not stale.exists()
+
+    def test_concurrent_writers(self, temp_dir):
+        """Test that racing stores and fetches only see complete files."""
+        cacheDir = str(temp_dir / "cache")
+        key = Cache.cacheKey(FINGERPRINT)
+        content = b"%PDF" + b"x" * 100000
+        errors = []
+
+        def _worker(n):
+            pdf = temp_dir / f"song{n}.pdf"
+            out = temp_dir / f"out{n}.pdf"
+            pdf.write_bytes(content)
+            for _ in range(20):
+                Cache.store(cacheDir, key, str(pdf))
+                if Cache.fetch(cacheDir, key, str(out)):
+                    if out.read_bytes() != content:
+                        errors.append(n)
+
+        threads = [
+            threading.Thread(target=_worker, args=(n,)) for n in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        entries = os.listdir(os.path.dirname(Cache.entryPath(cacheDir, key)))
+        assert entries == [key + ".pdf"]
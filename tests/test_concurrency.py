@@ -0,0 +1,115 @@
+"""Tests for Concurrency module."""
+
+import os
+import sys
+import threading
+
+import pytest
+
+from genpdf_butler import Concurrency
+
+GB = 1 << 30
+
+
+@pytest.fixture
+def host(monkeypatch):
+    """Control the free memory and load the governor sees."""
+    state = {"available": 16 * GB, "load": 0.1}
+    monkeypatch.setattr(
+        Concurrency, "_memAvailable", lambda: state["available"]
+    )
+    monkeypatch.setattr(Concurrency, "_loadPerCpu", lambda: state["load"])
+    monkeypatch.setattr(Concurrency, "ADJUST_INTERVAL", 0)
+    return state
+
+
+class TestConcurrency:
+    """Test cases for scaling renders with memory and load."""
+
+    def test_parse_jobs(self):
+        """Test fixed counts, bounds and auto."""
+        assert Concurrency.parseJobs("3") == (3, 3)
+        assert Concurrency.parseJobs("2:8") == (2, 8)
+        assert Concurrency.parseJobs("auto") == (1, os.cpu_count() or 1)
+        for text in ("0", "4:2", "x", "1:y", ""):
+            with pytest.raises(ValueError):
+                Concurrency.parseJobs(text)
+
+    def test_scales_up_while_busy_and_unconstrained(self, host):
+        """Test one step up per look, only while every slot is used."""
+        governor = Concurrency.newGovernor(1, 3)
+        Concurrency.adjust(governor, [])
+        assert governor["limit"] == 1
+
+        for expected in (2, 3, 3):
+            governor["active"] = governor["limit"]
+            Concurrency.adjust(governor, [])
+            assert governor["limit"] == expected
+
+    def test_sheds_renders_under_pressure(self, host):
+        """Test scaling down on low memory or high load, to the minimum."""
+        governor = Concurrency.newGovernor(2, 6)
+        governor["limit"] = governor["active"] = 5
+        host["available"] = 100 << 20
+        Concurrency.adjust(governor, [])
+        assert governor["limit"] == 4
+
+        host["available"] = 16 * GB
+        host["load"] = 3.0
+        for _ in range(5):
+            Concurrency.adjust(governor, [])
+        assert governor["limit"] == 2
+
+    def test_measured_render_size_is_used(self, host, monkeypatch):
+        """Test that the largest render seen sets the memory needed."""
+        monkeypatch.setattr(Concurrency, "_treeRss", lambda pid: 4 * GB)
+        governor = Concurrency.newGovernor(1, 4)
+        governor["active"] = 1
+        host["available"] = 6 * GB
+
+        Concurrency.adjust(governor, [type("P", (), {"pid": 1})()])
+
+        assert governor["renderBytes"] == 4 * GB
+        assert governor["limit"] == 1
+
+    def test_adjustments_are_rate_limited(self, host, monkeypatch):
+        """Test that memory and load are not sampled on every call."""
+        monkeypatch.setattr(Concurrency, "ADJUST_INTERVAL", 60)
+        governor = Concurrency.newGovernor(1, 4)
+        governor["active"] = 1
+        Concurrency.adjust(governor, [])
+        assert governor["limit"] == 1
+
+    @pytest.mark.skipif(
+        not sys.platform.startswith("linux"), reason="reads /proc"
+    )
+    def test_tree_rss_of_this_process(self):
+        """Test that resident memory is read from /proc."""
+        assert Concurrency._treeRss(os.getpid()) > 0
+        assert Concurrency._treeRss(2**22 + 1) == 0
+
+    def test_acquire_waits_for_a_slot(self):
+        """Test that the limit holds workers back until one is released."""
+        governor = Concurrency.newGovernor(1, 2)
+        cancelled = threading.Event()
+        assert Concurrency.acquire(governor, cancelled)
+        started = threading.Event()
+
+        def _worker():
+            if Concurrency.acquire(governor, cancelled):
+                started.set()
+
+        thread = threading.Thread(target=_worker)
+        thread.start()
+        assert not started.wait(0.1)
+        Concurrency.release(governor)
+        assert started.wait(5)
+        thread.join()
+
+    def test_cancellation_frees_waiting_workers(self):
+        """Test that a cancelled build does not leave workers blocked."""
+        governor = Concurrency.newGovernor(1, 2)
+        cancelled = threading.Event()
+        Concurrency.acquire(governor, cancelled)
+        cancelled.set()
+        assert not Concurrency.acquire(governor, cancelled)
@@ -0,0 +1,61 @@
+"""Tests for Config module."""
+
+import json
+import os
+
+from genpdf_butler import Config, GenPDF
+
+
+class TestConfig:
+    """Test cases for compiled chordpro configs and the probe record."""
+
+    def test_defines_become_one_config_file(self):
+        """Test that every --define ends up in a single nested config."""
+        cmd = Config.compileSettings(GenPDF.chordproSettings("a4", "true"))
+
+        assert cmd[:-1] == [
+            "chordpro",
+            "--config=ukulele",
+            "--config=ukulele-ly",
+            "--text-font=helvetica",
+            "--chord-font=helvetica",
+        ]
+        assert cmd[-1].startswith("--config=")
+        with open(cmd[-1].split("=", 1)[1], encoding="utf-8") as f:
+            config = json.load(f)
+        assert config["settings"] == {"inline-chords": True}
+        assert config["pdf"]["diagrams"] == {"show": True}
+        assert config["pdf"]["margintop"] == 70
+        assert config["pdf"]["even-odd-pages"] == 0
+        assert config["pdf"]["fonts"] == {"chord": {"color": "red"}}
+        assert config["pdf"]["papersize"] == "a4"
+
+    def test_files_are_named_after_their_content(self):
+        """Test that equal settings share a file and others do not."""
+        a4 = Config.compileSettings(GenPDF.chordproSettings("a4", "true"))
+        again = Config.compileSettings(GenPDF.chordproSettings("a4", "true"))
+        a6 = Config.compileSettings(GenPDF.chordproSettings("a6", "true"))
+
+        assert a4 == again
+        assert a4[-1] != a6[-1]
+        assert sorted(os.listdir(Config.configDir())) == sorted(
+            os.path.basename(cmd[-1]) for cmd in (a4, a6)
+        )
+
+    def test_unwritable_cache_keeps_the_defines(self, temp_dir, monkeypatch):
+        """Test that settings are passed as given when no file can be made."""
+        (temp_dir / "not-a-dir").write_text("", encoding="utf-8")
+        monkeypatch.setenv("XDG_CACHE_HOME", str(temp_dir / "not-a-dir"))
+        settings = GenPDF.chordproSettings("a4", "true")
+
+        assert Config.compileSettings(settings) == settings
+
+    def test_probe_is_tied_to_the_binary(self):
+        """Test that a recorded version only answers for the same file."""
+        binary = ["/usr/bin/chordpro", 1234, 5678]
+        assert Config.readProbe(binary) is None
+
+        Config.writeProbe(binary, "ChordPro 6.050")
+
+        assert Config.readProbe(binary) == "ChordPro 6.050"
+        assert Config.readProbe(["/usr/bin/chordpro", 1234, 9999]) is None
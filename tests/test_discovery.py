@@ -0,0 +1,145 @@
+"""Tests for Discovery module."""
+
+from pathlib import Path
+
+from genpdf_butler.Discovery import (
+    findSongs,
+    ignored,
+    isSong,
+    wanted,
+    withFolderSongs,
+)
+
+
+def _touch(root, *paths):
+    """Create empty files (and their folders) below root."""
+    for path in paths:
+        target = root / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.touch()
+
+
+def _found(root):
+    """Return the discovered songs as sorted paths relative to root."""
+    return sorted(p.relative_to(root).as_posix() for p in findSongs(str(root)))
+
+
+class TestFindSongs:
+    """Test cases for the shared song discovery walk."""
+
+    def test_is_song_is_case_insensitive(self):
+        """Test extension matching for both song formats."""
+        assert isSong("a.chopro")
+        assert isSong("a.CHO")
+        assert not isSong("a.pdf")
+        assert not isSong("chopro")
+
+    def test_finds_songs_recursively(self, temp_dir):
+        """Test that only .chopro/.cho files are returned, at any depth."""
+        _touch(
+            temp_dir,
+            "a.chopro",
+            "b.cho",
+            "notes.txt",
+            "folk/c.chopro",
+            "folk/deep/d.CHO",
+        )
+        assert _found(temp_dir) == [
+            "a.chopro",
+            "b.cho",
+            "folk/c.chopro",
+            "folk/deep/d.CHO",
+        ]
+
+    def test_is_lazy(self, temp_dir):
+        """Test that discovery is a generator rather than a list."""
+        _touch(temp_dir, "a.chopro")
+        songs = findSongs(str(temp_dir))
+        assert next(songs) == temp_dir / "a.chopro"
+
+    def test_prunes_hidden_and_vcs_directories(self, temp_dir):
+        """Test that .git, other hidden folders and CVS are skipped."""
+        _touch(
+            temp_dir,
+            "a.chopro",
+            ".git/b.chopro",
+            ".cache/c.cho",
+            "CVS/d.chopro",
+        )
+        assert _found(temp_dir) == ["a.chopro"]
+
+    def test_single_song_target(self, temp_dir):
+        """Test that a song path yields just that song."""
+        _touch(temp_dir, "a.chopro")
+        song = temp_dir / "a.chopro"
+        assert list(findSongs(str(song))) == [Path(song)]
+
+    def test_single_non_song_target(self, temp_dir):
+        """Test that a non-song file yields nothing."""
+        _touch(temp_dir, "a.txt")
+        assert list(findSongs(str(temp_dir / "a.txt"))) == []
+
+    def test_genpdfignore_rules(self, temp_dir):
+        """Test names, paths and directory-only rules in .genpdfignore."""
+        _touch(
+            temp_dir,
+            "keep.chopro",
+            "draft-song.chopro",
+            "output/x.chopro",
+            "folk/old/y.cho",
+            "folk/old.cho",
+            "folk/z.cho",
+        )
+        (temp_dir / ".genpdfignore").write_text(
+            "# comment\n\ndraft-*\noutput\nfolk/old/\n", encoding="utf-8"
+        )
+        assert _found(temp_dir) == [
+            "folk/old.cho",
+            "folk/z.cho",
+            "keep.chopro",
+        ]
+
+
+class TestIgnored:
+    """Test cases for .genpdfignore pattern matching."""
+
+    def test_name_pattern_matches_anywhere(self):
+        """Test that slash-free patterns match names at any depth."""
+        assert ignored("a/b/tmp.cho", False, ["tmp.*"])
+
+    def test_path_pattern_is_anchored(self):
+        """Test that patterns with a slash match from the root."""
+        assert ignored("a/b.cho", False, ["/a/*.cho"])
+        assert not ignored("x/a/b.cho", False, ["a/*.cho"])
+
+    def test_directory_pattern_skips_files(self):
+        """Test that a trailing slash only matches directories."""
+        assert ignored("build", True, ["build/"])
+        assert not ignored("build", False, ["build/"])
+
+
+class TestWanted:
+    """Test cases for filtering individual paths like the walk does."""
+
+    def test_matches_the_walk(self, temp_dir):
+        """Test songs, hidden folders, ignore rules and outside paths."""
+        patterns = ["drafts/"]
+        assert wanted(temp_dir, temp_dir / "a" / "b.cho", patterns)
+        assert not wanted(temp_dir, temp_dir / "a" / "b.txt", patterns)
+        assert not wanted(temp_dir, temp_dir / ".git" / "b.cho", patterns)
+        assert not wanted(temp_dir, temp_dir / "drafts" / "b.cho", patterns)
+        assert not wanted(temp_dir / "a", temp_dir / "b.cho", patterns)
+
+
+class TestWithFolderSongs:
+    """Test cases for expanding changes to whole songbooks."""
+
+    def test_expands_to_every_song_in_the_folder(self, temp_dir):
+        """Test that a change pulls in its folder mates only."""
+        _touch(temp_dir, "folk/a.chopro", "folk/b.cho", "blues/c.chopro")
+
+        songs = withFolderSongs(str(temp_dir), [temp_dir / "folk" / "b.cho"])
+        assert songs == [
+            temp_dir / "folk" / "a.chopro",
+            temp_dir / "folk" / "b.cho",
+        ]
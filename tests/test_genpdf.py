@@ -1,33 +1,45 @@
 """Tests for GenPDF module."""
 
+import json
+import logging
 import os
+import signal
+import subprocess
 import tempfile
+import threading
+import time
 from pathlib import Path
 from unittest.mock import patch
 
-from genpdf_butler.GenPDF import createPDFs
+import pytest
+
+from genpdf_butler import (
+    Concurrency,
+    Config,
+    GenPDF,
+    Manifest,
+    Optimize,
+    Output,
+    Progress,
+    Report,
+)
+from genpdf_butler.GenPDF import bookOutput, createPDFs
 
 
 class TestCreatePDFs:
     """Test cases for the createPDFs function."""
 
-    def test_chordpro_settings_configuration(self):
+    def test_chordpro_settings_configuration(self, caplog):
         """Test that chordpro settings are properly configured."""
-        with (
-            patch("genpdf_butler.GenPDF.os.path.exists", return_value=False),
-            patch("genpdf_butler.GenPDF.print") as mock_print,
-        ):
+        with patch("genpdf_butler.GenPDF.os.path.exists", return_value=False):
             createPDFs("nonexistent", "a4", "true")
-            mock_print.assert_called_once_with(
-                "no such file or folder 'nonexistent'"
-            )
+            assert caplog.messages == ["no such file or folder 'nonexistent'"]
 
-    def test_ext_function_returns_lowercase_extension(self):
+    def test_ext_function_returns_lowercase_extension(self, mock_chordpro):
         """Test that the internal ext function returns lowercase extensions."""
         with (
             patch("genpdf_butler.GenPDF.os.path.exists", return_value=True),
             patch("genpdf_butler.GenPDF.os.path.isdir", return_value=False),
-            patch("genpdf_butler.GenPDF.subprocess.run") as mock_run,
         ):
             # Create a temporary file with uppercase extension
             with tempfile.NamedTemporaryFile(
@@ -39,84 +51,69 @@ class TestCreatePDFs:
                 createPDFs(tmp_path, "a4", "true")
                 # Should have been called since the extension matches
                 # (case insensitive)
-                mock_run.assert_called_once()
+                mock_chordpro.assert_called_once()
             finally:
                 os.unlink(tmp_path)
 
-    @patch("genpdf_butler.GenPDF.subprocess.run")
-    @patch("genpdf_butler.GenPDF.os.path.isdir")
-    @patch("genpdf_butler.GenPDF.os.path.exists")
-    def test_single_file_processing(self, mock_exists, mock_isdir, mock_run):
+    def test_single_file_processing(self, mock_chordpro):
         """Test processing a single chopro file."""
-        mock_exists.return_value = True
-        mock_isdir.return_value = False
+        config = Config.compileSettings(GenPDF.chordproSettings("a4", "true"))[
+            -1
+        ]
 
-        createPDFs("test.chopro", "a4", "true")
+        with (
+            patch("genpdf_butler.GenPDF.os.path.exists", return_value=True),
+            patch("genpdf_butler.GenPDF.os.path.isdir", return_value=False),
+        ):
+            createPDFs("test.chopro", "a4", "true")
 
         expected_args = [
             "chordpro",
             "--config=ukulele",
             "--config=ukulele-ly",
-            "--define=pdf:diagrams:show=true",
-            "--define=settings:inline-chords=true",
-            "--define=pdf:even-odd-pages=0",
-            "--define=pdf:margintop=70",
-            "--define=pdf:marginbottom=0",
-            "--define=pdf:marginleft=10",
-            "--define=pdf:marginright=50",
-            "--define=pdf:headspace=50",
-            "--define=pdf:footspace=10",
-            "--define=pdf:head-first-only=true",
-            "--define=pdf:fonts:chord:color=red",
-            "--define=pdf:papersize=a4",
             "--text-font=helvetica",
             "--chord-font=helvetica",
-            "--output=test.pdf",
+            config,
+            f"--output={Output.tempPath('test.pdf')}",
             "test.chopro",
         ]
 
-        mock_run.assert_called_once_with(expected_args)
+        mock_chordpro.assert_called_once()
+        assert mock_chordpro.call_args.args == (expected_args,)
+        assert mock_chordpro.call_args.kwargs["timeout"] == 300
 
-    @patch("genpdf_butler.GenPDF.subprocess.run")
-    @patch("genpdf_butler.GenPDF.os.path.isdir")
-    @patch("genpdf_butler.GenPDF.os.path.exists")
-    def test_single_cho_file_processing(
-        self, mock_exists, mock_isdir, mock_run
-    ):
+    def test_single_cho_file_processing(self, mock_chordpro):
         """Test processing a single .cho file."""
-        mock_exists.return_value = True
-        mock_isdir.return_value = False
+        config = Config.compileSettings(
+            GenPDF.chordproSettings("a6", "false")
+        )[-1]
 
-        createPDFs("test.cho", "a6", "false")
+        with (
+            patch("genpdf_butler.GenPDF.os.path.exists", return_value=True),
+            patch("genpdf_butler.GenPDF.os.path.isdir", return_value=False),
+        ):
+            createPDFs("test.cho", "a6", "false")
 
         expected_args = [
             "chordpro",
             "--config=ukulele",
             "--config=ukulele-ly",
-            "--define=pdf:diagrams:show=false",
-            "--define=settings:inline-chords=true",
-            "--define=pdf:even-odd-pages=0",
-            "--define=pdf:margintop=70",
-            "--define=pdf:marginbottom=0",
-            "--define=pdf:marginleft=10",
-            "--define=pdf:marginright=50",
-            "--define=pdf:headspace=50",
-            "--define=pdf:footspace=10",
-            "--define=pdf:head-first-only=true",
-            "--define=pdf:fonts:chord:color=red",
-            "--define=pdf:papersize=a6",
             "--text-font=helvetica",
             "--chord-font=helvetica",
-            "--output=test.pdf",
+            config,
+            f"--output={Output.tempPath('test.pdf')}",
             "test.cho",
         ]
 
-        mock_run.assert_called_once_with(expected_args)
+        mock_chordpro.assert_called_once()
+        assert mock_chordpro.call_args.args == (expected_args,)
+        assert mock_chordpro.call_args.kwargs["timeout"] == 300
 
-    @patch("genpdf_butler.GenPDF.subprocess.run")
     @patch("genpdf_butler.GenPDF.os.path.isdir")
     @patch("genpdf_butler.GenPDF.os.path.exists")
-    def test_directory_processing(self, mock_exists, mock_isdir, mock_run):
+    def test_directory_processing(
+        self, mock_exists, mock_isdir, mock_chordpro
+    ):
         """Test processing a directory containing chopro files."""
         mock_exists.return_value = True
         mock_isdir.return_value = True
@@ -135,43 +132,984 @@ class TestCreatePDFs:
             createPDFs(temp_dir, "a4", "true")
 
             # Should be called twice (for .chopro and .cho files, not .txt)
-            assert mock_run.call_count == 2
+            assert mock_chordpro.call_count == 2
 
-    @patch("genpdf_butler.GenPDF.print")
     @patch("genpdf_butler.GenPDF.os.path.exists")
-    def test_nonexistent_target(self, mock_exists, mock_print):
+    def test_nonexistent_target(self, mock_exists, caplog):
         """Test handling of nonexistent file or directory."""
         mock_exists.return_value = False
 
         createPDFs("nonexistent.chopro", "a4", "true")
 
-        mock_print.assert_called_once_with(
-            "no such file or folder 'nonexistent.chopro'"
-        )
+        assert caplog.record_tuples == [
+            (
+                "genpdf_butler.GenPDF",
+                logging.ERROR,
+                "no such file or folder 'nonexistent.chopro'",
+            )
+        ]
 
-    def test_parameter_variations(self):
+    def test_parameter_variations(self, mock_chordpro):
         """Test that different parameters are properly incorporated."""
+        # Written before os.path is patched
+        Config.compileSettings(GenPDF.chordproSettings("letter", "true"))
         with (
             patch("genpdf_butler.GenPDF.os.path.exists", return_value=True),
             patch("genpdf_butler.GenPDF.os.path.isdir", return_value=False),
-            patch("genpdf_butler.GenPDF.subprocess.run") as mock_run,
         ):
-
             createPDFs("test.chopro", "letter", "true")
 
-            args = mock_run.call_args[0][0]
-            assert "--define=pdf:papersize=letter" in args
-            assert "--define=pdf:diagrams:show=true" in args
+        config = mock_chordpro.call_args[0][0][-3].split("=", 1)[1]
+        with open(config, encoding="utf-8") as f:
+            pdf = json.load(f)["pdf"]
+        assert pdf["papersize"] == "letter"
+        assert pdf["diagrams"]["show"] is True
 
-    def test_unsupported_file_extension(self):
+    def test_unsupported_file_extension(self, mock_chordpro):
         """Test that files with unsupported extensions are ignored."""
         with (
             patch("genpdf_butler.GenPDF.os.path.exists", return_value=True),
             patch("genpdf_butler.GenPDF.os.path.isdir", return_value=False),
-            patch("genpdf_butler.GenPDF.subprocess.run") as mock_run,
         ):
-
             createPDFs("test.txt", "a4", "true")
 
             # Should not be called for .txt files
-            mock_run.assert_not_called()
+            mock_chordpro.assert_not_called()
+
+    def test_parallel_output_matches_serial(self, caplog):
+        """Test that a parallel run reports songs exactly like a serial run."""
+
+        def _run(cmd, **kwargs):
+            # Finish the first songs last to scramble completion order
+            song = Path(cmd[-1])
+            time.sleep(0.05 if song.stem == "song0" else 0)
+            return subprocess.CompletedProcess(
+                cmd, 0, stdout=f"rendered {song.name}\n", stderr=""
+            )
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(6):
+                (Path(temp_dir) / f"song{i}.chopro").touch()
+
+            with patch(
+                "genpdf_butler.GenPDF._run", side_effect=_run
+            ) as mock_run:
+                caplog.set_level(logging.DEBUG, logger="genpdf_butler")
+                createPDFs(temp_dir, "a4", "true", jobs=1)
+                serial = list(caplog.messages)
+                caplog.clear()
+                createPDFs(temp_dir, "a4", "true", jobs=4)
+                parallel = list(caplog.messages)
+
+            assert mock_run.call_count == 12
+            assert parallel == serial
+            assert sum("rendered song" in line for line in serial) == 6
+
+
+class TestChordproProbe:
+    """Test cases for finding chordpro and its version once."""
+
+    def test_version_is_probed_once_per_binary(self, fake_chordpro):
+        """Test that a later process reuses the recorded version."""
+        path, version = GenPDF.probeChordpro()
+        assert path == str(fake_chordpro)
+        assert version == "ChordPro fake 0.0"
+
+        GenPDF.probeChordpro.cache_clear()
+        with patch("genpdf_butler.GenPDF._run") as mock_run:
+            assert GenPDF.probeChordpro() == (path, version)
+        mock_run.assert_not_called()
+
+    def test_missing_chordpro(self, temp_dir, monkeypatch):
+        """Test that a missing binary fails without running anything."""
+        monkeypatch.setenv("PATH", str(temp_dir))
+
+        with pytest.raises(FileNotFoundError):
+            GenPDF.probeChordpro()
+        assert GenPDF.chordproVersion() == "unknown"
+
+    def test_broken_chordpro(self, fake_chordpro, monkeypatch):
+        """Test that a chordpro that cannot report its version is an error."""
+
+        def _run(cmd, **kwargs):
+            return subprocess.CompletedProcess(cmd, 2, "", "Can't locate\n")
+
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run):
+            with pytest.raises(OSError, match="Can't locate"):
+                GenPDF.probeChordpro()
+
+
+class TestLogging:
+    """Test cases for what a build reports at each log level."""
+
+    def _build(self, temp_dir, caplog, level):
+        """Render two songs, one of which fails, and return the messages."""
+        (temp_dir / "good.chopro").touch()
+        (temp_dir / "bad.chopro").touch()
+
+        def _run(cmd, **kwargs):
+            code = 2 if cmd[-1].endswith("bad.chopro") else 0
+            return subprocess.CompletedProcess(
+                cmd,
+                code,
+                "chordpro says hi\n",
+                "Parse error\n" if code else "",
+            )
+
+        caplog.set_level(level, logger="genpdf_butler")
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run):
+            createPDFs(str(temp_dir), "a4", "true")
+        return caplog.messages
+
+    def test_per_song_detail_only_at_debug(self, temp_dir, caplog):
+        """Test that INFO shows failures but not every song."""
+        messages = self._build(temp_dir, caplog, logging.INFO)
+
+        assert not any("Processing file" in m for m in messages)
+        assert not any("chordpro says hi" in m for m in messages)
+        assert any("bad.chopro (exit code 2)" in m for m in messages)
+        assert "Parse error" in messages
+
+    def test_debug_shows_every_song(self, temp_dir, caplog):
+        """Test that DEBUG reports each song and chordpro's output."""
+        messages = self._build(temp_dir, caplog, logging.DEBUG)
+
+        assert sum("Processing file" in m for m in messages) == 2
+        assert messages.count("chordpro says hi") == 2
+
+    def test_progress_counts_every_song(self, temp_dir, monkeypatch):
+        """Test that the progress display sees renders and failures."""
+        (temp_dir / "good.chopro").touch()
+        (temp_dir / "bad.chopro").touch()
+        shown = []
+        monkeypatch.setattr(
+            Progress, "finish", lambda progress: shown.append(dict(progress))
+        )
+
+        def _run(cmd, **kwargs):
+            code = 2 if cmd[-1].endswith("bad.chopro") else 0
+            return subprocess.CompletedProcess(cmd, code, "", "")
+
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run):
+            createPDFs(str(temp_dir), "a4", "true", jobs=2, progress=True)
+
+        assert [(p["done"], p["failed"], p["total"]) for p in shown] == [
+            (2, 1, 2)
+        ]
+
+
+class TestRenderOrchestration:
+    """Test cases for timeouts, retries and cancellation of renders."""
+
+    def test_hung_render_is_killed_and_cleaned_up(
+        self, temp_dir, fake_chordpro, monkeypatch
+    ):
+        """Test that a hung chordpro times out without stalling the rest."""
+        monkeypatch.setenv("GENPDF_FAKE_CHORDPRO_HANG", "slow")
+        (temp_dir / "fast.chopro").write_text("A\n", encoding="utf-8")
+        (temp_dir / "slow.chopro").write_text("B\n", encoding="utf-8")
+        report = Report.newReport()
+
+        start = time.monotonic()
+        failed = createPDFs(
+            str(temp_dir), "a4", "true", jobs=2, report=report, timeout=1
+        )
+
+        assert time.monotonic() - start < 30
+        assert failed == [str(temp_dir / "slow.pdf")]
+        assert (temp_dir / "fast.pdf").exists()
+        assert not (temp_dir / "slow.pdf").exists()
+        codes = {
+            Path(song["song"]).name: song["returncode"]
+            for song in report["songs"]
+        }
+        assert codes == {
+            "fast.chopro": 0,
+            "slow.chopro": GenPDF.TIMEOUT_RETURNCODE,
+        }
+
+    def test_transient_failure_is_retried(self, temp_dir, monkeypatch):
+        """Test that a timed out render is tried again."""
+        monkeypatch.setattr(GenPDF, "RETRY_DELAY", 0)
+        (temp_dir / "a.chopro").write_text("A\n", encoding="utf-8")
+        attempts = []
+
+        def _run(cmd, **kwargs):
+            attempts.append(cmd[-1])
+            if len(attempts) == 1:
+                raise subprocess.TimeoutExpired(cmd, kwargs["timeout"])
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run):
+            failed = createPDFs(str(temp_dir), "a4", "true", retries=2)
+
+        assert failed == []
+        assert len(attempts) == 2
+
+    def test_rejected_song_is_not_retried(self, temp_dir, monkeypatch):
+        """Test that an ordinary chordpro error fails straight away."""
+        monkeypatch.setattr(GenPDF, "RETRY_DELAY", 0)
+        (temp_dir / "a.chopro").write_text("A\n", encoding="utf-8")
+
+        def _run(cmd, **kwargs):
+            return subprocess.CompletedProcess(cmd, 1, "", "Parse error\n")
+
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run) as mock_run:
+            failed = createPDFs(str(temp_dir), "a4", "true", retries=2)
+
+        assert failed == [str(temp_dir / "a.pdf")]
+        assert mock_run.call_count == 1
+
+    def test_cancellation_kills_renders_and_removes_partials(
+        self, temp_dir, fake_chordpro, monkeypatch
+    ):
+        """Test that Ctrl-C leaves no running chordpro or half-written PDF."""
+        monkeypatch.setenv("GENPDF_FAKE_CHORDPRO_HANG", "song")
+        for n in range(4):
+            (temp_dir / f"song{n}.chopro").write_text("A\n", encoding="utf-8")
+
+        def _interrupt(signum, frame):
+            raise KeyboardInterrupt
+
+        previous = signal.signal(signal.SIGALRM, _interrupt)
+        signal.setitimer(signal.ITIMER_REAL, 1.0)
+        start = time.monotonic()
+        try:
+            with pytest.raises(KeyboardInterrupt):
+                createPDFs(str(temp_dir), "a4", "true", jobs=2)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+        assert time.monotonic() - start < 30
+        assert not list(temp_dir.glob("*.pdf"))
+
+
+class TestAtomicOutputs:
+    """Test cases for rendering to a temporary file and publishing it."""
+
+    def _age(self, pdf):
+        """Backdate an output, returning its inode."""
+        os.utime(pdf, (1_000_000_000, 1_000_000_000))
+        return pdf.stat().st_ino
+
+    def test_rebuild_replaces_only_changed_pdfs(self, temp_dir, fake_chordpro):
+        """Test that a full rebuild leaves identical PDFs untouched."""
+        (temp_dir / "same.chopro").write_text("A\n", encoding="utf-8")
+        (temp_dir / "edited.chopro").write_text("B\n", encoding="utf-8")
+        createPDFs(str(temp_dir), "a4", "true", jobs=2)
+        same = self._age(temp_dir / "same.pdf")
+        edited = self._age(temp_dir / "edited.pdf")
+        (temp_dir / "edited.chopro").write_text("B2\n", encoding="utf-8")
+        report = Report.newReport()
+
+        createPDFs(str(temp_dir), "a4", "true", jobs=2, report=report)
+
+        assert (temp_dir / "same.pdf").stat().st_ino == same
+        assert (temp_dir / "same.pdf").stat().st_mtime == 1_000_000_000
+        assert (temp_dir / "edited.pdf").stat().st_ino != edited
+        assert (temp_dir / "edited.pdf").stat().st_mtime > 1_000_000_000
+        replaced = {
+            Path(song["output"]).name: song["replaced"]
+            for song in report["songs"]
+        }
+        assert replaced == {"edited.pdf": True, "same.pdf": False}
+        assert Report.summary(report)["unchanged"] == 1
+        assert sorted(p.name for p in temp_dir.glob("*.pdf")) == [
+            "edited.pdf",
+            "same.pdf",
+        ]
+
+    def test_failed_render_keeps_the_previous_pdf(
+        self, temp_dir, fake_chordpro, monkeypatch
+    ):
+        """Test that chordpro failing on an edit leaves the last good PDF."""
+        (temp_dir / "song.chopro").write_text("A\n", encoding="utf-8")
+        createPDFs(str(temp_dir), "a4", "true")
+        before = (temp_dir / "song.pdf").read_bytes()
+        monkeypatch.setenv("GENPDF_FAKE_CHORDPRO_FAIL", "song")
+        (temp_dir / "song.chopro").write_text("{broken\n", encoding="utf-8")
+
+        failed = createPDFs(str(temp_dir), "a4", "true")
+
+        assert failed == [str(temp_dir / "song.pdf")]
+        assert (temp_dir / "song.pdf").read_bytes() == before
+        assert [p.name for p in temp_dir.glob("*.pdf")] == ["song.pdf"]
+
+
+class TestStreaming:
+    """Test cases for overlapping discovery, patching and rendering."""
+
+    def _songs(self, temp_dir, count, consumed):
+        """Yield songs lazily, counting how many were asked for."""
+        for n in range(count):
+            song = temp_dir / f"song{n:03}.chopro"
+            song.write_text("A\n", encoding="utf-8")
+            consumed.append(song)
+            yield song
+
+    def test_first_render_starts_with_the_first_song(self, temp_dir):
+        """Test that a serial build renders before discovering more."""
+        consumed = []
+        seen = []
+
+        def _run(cmd, **kwargs):
+            seen.append(len(consumed))
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run):
+            createPDFs(
+                str(temp_dir),
+                "a4",
+                "true",
+                songs=self._songs(temp_dir, 20, consumed),
+            )
+
+        assert seen == list(range(1, 21))
+
+    def test_parallel_build_keeps_a_bounded_window(self, temp_dir):
+        """Test that only a few songs are planned ahead of the workers."""
+        consumed = []
+        ahead = []
+        rendered = []
+
+        def _run(cmd, **kwargs):
+            ahead.append(len(consumed) - len(rendered))
+            rendered.append(cmd[-1])
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run):
+            failed = createPDFs(
+                str(temp_dir),
+                "a4",
+                "true",
+                jobs=2,
+                songs=self._songs(temp_dir, 100, consumed),
+            )
+
+        assert failed == []
+        assert len(rendered) == 100
+        assert max(ahead) <= 2 * GenPDF.WINDOW_PER_JOB + 1
+
+    def test_a_long_render_holds_back_a_bounded_backlog(self, temp_dir):
+        """Test that renders finished behind a long one are not unbounded."""
+        consumed = []
+        started = []
+        held = []
+
+        def _run(cmd, **kwargs):
+            started.append(cmd[-1])
+            if cmd[-1].endswith("song000.chopro"):
+                time.sleep(0.5)
+                held.append(len(started))
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run):
+            failed = createPDFs(
+                str(temp_dir),
+                "a4",
+                "true",
+                jobs=2,
+                songs=self._songs(temp_dir, 100, consumed),
+            )
+
+        assert failed == []
+        assert len(started) == 100
+        assert held[0] <= 2 * GenPDF.HELD_PER_JOB + 1
+
+
+class TestScheduling:
+    """Test cases for dispatching the longest expected renders first."""
+
+    def _build(self, temp_dir, report=None, **kwargs):
+        """Run a parallel build, returning the songs in dispatch order."""
+        dispatched = []
+        lock = threading.Lock()
+
+        def _run(cmd, **kwargs):
+            with lock:
+                dispatched.append(Path(cmd[-1]).name)
+            time.sleep(0.05 if cmd[-1].endswith("slow.chopro") else 0.01)
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run):
+            createPDFs(
+                str(temp_dir),
+                "a4",
+                "true",
+                jobs=2,
+                report=report,
+                **kwargs,
+            )
+        return dispatched
+
+    def test_recorded_timings_order_the_next_build(self, temp_dir):
+        """Test that the slowest song goes first once its time is known."""
+        for name in ("a.chopro", "b.chopro", "c.chopro", "slow.chopro"):
+            (temp_dir / name).write_text("A\n", encoding="utf-8")
+        # A new, large song is estimated from its size
+        (temp_dir / "d.chopro").write_text("A\n" * 1000, encoding="utf-8")
+
+        manifestFile = str(temp_dir / "timings.json")
+
+        first = self._build(temp_dir, manifestFile=manifestFile)
+        (temp_dir / "d.chopro").unlink()
+        (temp_dir / "big.chopro").write_text("A\n" * 1000, encoding="utf-8")
+        report = Report.newReport()
+        second = self._build(temp_dir, report, manifestFile=manifestFile)
+
+        assert first[0] == "a.chopro"
+        assert second[:2] == ["big.chopro", "slow.chopro"]
+        # Reporting follows the order the songs were planned in; the quick
+        # songs took about the same time, so their order is not fixed
+        reported = [Path(song["song"]).name for song in report["songs"]]
+        assert reported[:2] == ["big.chopro", "slow.chopro"]
+        assert sorted(reported[2:]) == ["a.chopro", "b.chopro", "c.chopro"]
+        schedule = Report.summary(report)["schedule"]
+        assert schedule["jobs"] == 2
+        assert schedule["savedSeconds"] == pytest.approx(
+            schedule["discoveryMakespan"] - schedule["makespan"], abs=1e-5
+        )
+
+    def test_timings_are_recorded_without_incremental(self, temp_dir):
+        """Test that a build given a manifest records what its songs took."""
+        (temp_dir / "a.chopro").write_text("A\n", encoding="utf-8")
+        self._build(temp_dir, manifestFile=str(temp_dir / "timings.json"))
+
+        manifest = Manifest.loadManifest(str(temp_dir / "timings.json"))
+        assert list(manifest["timings"]) == ["a.chopro"]
+        assert manifest["songs"] == {}
+
+    def test_plain_builds_leave_no_manifest(self, temp_dir):
+        """Test that a build asked for no manifest does not write one."""
+        (temp_dir / "a.chopro").write_text("A\n", encoding="utf-8")
+        self._build(temp_dir)
+
+        assert not (temp_dir / Manifest.MANIFEST_NAME).exists()
+
+    def test_songs_are_ordered_before_they_are_patched(self, temp_dir):
+        """Test that songs are patched in the order they are scheduled."""
+        for name in ("a.chopro", "b.chopro", "slow.chopro"):
+            (temp_dir / name).write_text("A\n", encoding="utf-8")
+        manifestFile = str(temp_dir / "timings.json")
+        self._build(temp_dir, manifestFile=manifestFile)
+        patchOrder = []
+
+        def _patch(song):
+            patchOrder.append(song.name)
+            return False
+
+        with patch(
+            "genpdf_butler.PatchTextColor.patchFile", side_effect=_patch
+        ):
+            dispatched = self._build(
+                temp_dir, manifestFile=manifestFile, patched=[]
+            )
+
+        assert dispatched[0] == "slow.chopro"
+        assert patchOrder[0] == "slow.chopro"
+        assert sorted(patchOrder) == ["a.chopro", "b.chopro", "slow.chopro"]
+
+
+class TestAdaptiveConcurrency:
+    """Test cases for scaling parallel renders with the host."""
+
+    def _build(self, temp_dir, monkeypatch, available):
+        """Render twenty songs, returning the most seen running at once."""
+        monkeypatch.setattr(Concurrency, "ADJUST_INTERVAL", 0)
+        monkeypatch.setattr(Concurrency, "_memAvailable", lambda: available)
+        monkeypatch.setattr(Concurrency, "_loadPerCpu", lambda: 0.1)
+        for n in range(20):
+            (temp_dir / f"song{n:02}.chopro").write_text("A\n", "utf-8")
+        lock = threading.Lock()
+        active = [0]
+        peak = [0]
+
+        def _run(cmd, **kwargs):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run):
+            failed = createPDFs(str(temp_dir), "a4", "true", jobs=4, minJobs=1)
+        assert failed == []
+        return peak[0]
+
+    def test_scales_up_on_an_idle_host(self, temp_dir, monkeypatch):
+        """Test that renders are added while memory and CPUs are free."""
+        assert self._build(temp_dir, monkeypatch, 64 << 30) > 1
+
+    def test_stays_at_the_minimum_without_memory(self, temp_dir, monkeypatch):
+        """Test that a host short of memory renders one song at a time."""
+        assert self._build(temp_dir, monkeypatch, 10 << 20) == 1
+
+
+class TestOptimizeStage:
+    """Test cases for optimizing PDFs as they are rendered."""
+
+    def _build(self, temp_dir, **kwargs):
+        """Render two songs, returning the songs chordpro rendered."""
+        rendered = []
+
+        def _run(cmd, **run_kwargs):
+            if cmd[-1] == "--version":
+                return subprocess.CompletedProcess(cmd, 0, "6.050\n", "")
+            rendered.append(Path(cmd[-1]).name)
+            Path(cmd[-2].split("=", 1)[1]).write_bytes(b"%PDF" + b"x" * 96)
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run):
+            createPDFs(str(temp_dir), "a4", "true", jobs=2, **kwargs)
+        return sorted(rendered)
+
+    def test_optimized_in_the_workers(self, temp_dir, monkeypatch):
+        """Test that each render is optimized off the main thread."""
+        (temp_dir / "a.chopro").write_text("A\n", encoding="utf-8")
+        (temp_dir / "b.chopro").write_text("B\n", encoding="utf-8")
+        threads = []
+
+        def _optimize(path):
+            threads.append(threading.current_thread())
+            Path(path).write_bytes(b"%PDF" + b"x" * 36)
+            return 100, 40
+
+        monkeypatch.setattr(Optimize, "optimizePDF", _optimize)
+        monkeypatch.setattr(
+            Optimize, "settings", lambda: ["--genpdf-optimize"]
+        )
+        report = Report.newReport()
+
+        self._build(temp_dir, optimize=True, report=report)
+
+        assert len(threads) == 2
+        assert threading.main_thread() not in threads
+        assert [song["sizeBefore"] for song in report["songs"]] == [100, 100]
+        assert Report.summary(report)["optimized"] == {
+            "songs": 2,
+            "sizeBefore": 200,
+            "size": 80,
+        }
+
+    def test_optimizing_invalidates_incremental_outputs(
+        self, temp_dir, monkeypatch
+    ):
+        """Test that plain and optimized PDFs are not mistaken for each other."""
+        GenPDF.chordproVersion.cache_clear()
+        (temp_dir / "a.chopro").write_text("A\n", encoding="utf-8")
+        monkeypatch.setattr(Optimize, "optimizePDF", lambda path: (100, 100))
+        monkeypatch.setattr(
+            Optimize, "settings", lambda: ["--genpdf-optimize"]
+        )
+
+        assert self._build(temp_dir, incremental=True) == ["a.chopro"]
+        assert self._build(temp_dir, incremental=True) == []
+        assert self._build(temp_dir, incremental=True, optimize=True) == [
+            "a.chopro"
+        ]
+        assert self._build(temp_dir, incremental=True, optimize=True) == []
+
+
+class TestIncrementalBuilds:
+    """Test cases for skipping songs whose PDF is up to date."""
+
+    def _build(self, temp_dir, **kwargs):
+        """Run an incremental build, returning the songs chordpro saw."""
+        rendered = []
+
+        def _run(cmd, **run_kwargs):
+            if cmd[-1] == "--version":
+                return subprocess.CompletedProcess(cmd, 0, "6.050\n", "")
+            rendered.append(Path(cmd[-1]).name)
+            Path(cmd[-2].split("=", 1)[1]).write_bytes(b"%PDF-1.4")
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run):
+            createPDFs(
+                str(temp_dir),
+                kwargs.get("pagesize", "a4"),
+                "true",
+                incremental=True,
+            )
+        return sorted(rendered)
+
+    def setup_method(self):
+        """Forget the chordpro version probed by earlier tests."""
+        GenPDF.chordproVersion.cache_clear()
+
+    def test_second_build_skips_unchanged_songs(self, temp_dir):
+        """Test that nothing is re-rendered when nothing changed."""
+        (temp_dir / "a.chopro").write_text("A\n", encoding="utf-8")
+        (temp_dir / "b.cho").write_text("B\n", encoding="utf-8")
+
+        assert self._build(temp_dir) == ["a.chopro", "b.cho"]
+        assert self._build(temp_dir) == []
+
+    def test_changed_source_is_rerendered(self, temp_dir):
+        """Test that editing a song re-renders only that song."""
+        (temp_dir / "a.chopro").write_text("A\n", encoding="utf-8")
+        (temp_dir / "b.cho").write_text("B\n", encoding="utf-8")
+        self._build(temp_dir)
+
+        (temp_dir / "b.cho").write_text("B changed\n", encoding="utf-8")
+        assert self._build(temp_dir) == ["b.cho"]
+
+    def test_missing_pdf_is_rerendered(self, temp_dir):
+        """Test that deleting an output brings the song back."""
+        (temp_dir / "a.chopro").write_text("A\n", encoding="utf-8")
+        self._build(temp_dir)
+
+        (temp_dir / "a.pdf").unlink()
+        assert self._build(temp_dir) == ["a.chopro"]
+
+    def test_changed_settings_rerender_everything(self, temp_dir):
+        """Test that a different page size invalidates every song."""
+        (temp_dir / "a.chopro").write_text("A\n", encoding="utf-8")
+        self._build(temp_dir)
+
+        assert self._build(temp_dir, pagesize="letter") == ["a.chopro"]
+
+    def test_failed_render_is_retried(self, temp_dir):
+        """Test that a song chordpro failed on is not recorded."""
+        (temp_dir / "a.chopro").write_text("A\n", encoding="utf-8")
+
+        def _fail(cmd, **kwargs):
+            return subprocess.CompletedProcess(cmd, 1, "", "error\n")
+
+        with patch("genpdf_butler.GenPDF._run", side_effect=_fail):
+            createPDFs(str(temp_dir), "a4", "true", incremental=True)
+        (temp_dir / "a.pdf").write_bytes(b"%PDF-1.4")
+
+        assert self._build(temp_dir) == ["a.chopro"]
+
+
+class TestVariants:
+    """Test cases for building several page size / chord variants."""
+
+    def test_lists_are_paired_and_broadcast(self):
+        """Test that a single value applies to every variant."""
+        assert GenPDF.variants("a6,a4,letter", "false,true,true") == [
+            ("a6", "false"),
+            ("a4", "true"),
+            ("letter", "true"),
+        ]
+        assert GenPDF.variants("a6,a4", "true") == [
+            ("a6", "true"),
+            ("a4", "true"),
+        ]
+        assert GenPDF.variants("a4", "true") == [("a4", "true")]
+
+    def test_mismatched_lists_are_rejected(self):
+        """Test that lists of different lengths raise ValueError."""
+        with pytest.raises(ValueError):
+            GenPDF.variants("a6,a4,letter", "false,true")
+
+    def test_output_names(self):
+        """Test the deterministic per-variant output names."""
+        assert GenPDF.outputName("dir/song.chopro") == "dir/song.pdf"
+        assert (
+            GenPDF.outputName("dir.cho/song.cho", "a4-diagrams")
+            == "dir.cho/song.a4-diagrams.pdf"
+        )
+        assert GenPDF.variantName("a4", "true") == "a4-diagrams"
+        assert GenPDF.variantName("a6", "false") == "a6"
+
+    def test_every_variant_rendered_in_one_run(self, temp_dir, mock_chordpro):
+        """Test that each song is rendered once per variant."""
+        (temp_dir / "a.chopro").write_text("A\n", encoding="utf-8")
+        (temp_dir / "b.cho").write_text("B\n", encoding="utf-8")
+
+        createPDFs(str(temp_dir), "a6,a4", "false,true", jobs=2)
+
+        outputs = sorted(
+            call.args[0][-2].split("=", 1)[1]
+            for call in mock_chordpro.call_args_list
+        )
+        assert outputs == [
+            Output.tempPath(str(temp_dir / name))
+            for name in (
+                "a.a4-diagrams.pdf",
+                "a.a6.pdf",
+                "b.a4-diagrams.pdf",
+                "b.a6.pdf",
+            )
+        ]
+
+    def test_incremental_tracks_each_variant(self, temp_dir):
+        """Test that variants are cached independently."""
+        GenPDF.chordproVersion.cache_clear()
+        (temp_dir / "a.chopro").write_text("A\n", encoding="utf-8")
+        rendered = []
+
+        def _run(cmd, **kwargs):
+            if cmd[-1] == "--version":
+                return subprocess.CompletedProcess(cmd, 0, "6.050\n", "")
+            output = cmd[-2].split("=", 1)[1]
+            rendered.append(Path(output).name.split("-", 2)[2])
+            Path(output).write_bytes(b"%PDF-1.4")
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run):
+            createPDFs(str(temp_dir), "a6,a4", "false", incremental=True)
+            (temp_dir / "a.a4.pdf").unlink()
+            createPDFs(str(temp_dir), "a6,a4", "false", incremental=True)
+
+        assert rendered == ["a.a6.pdf", "a.a4.pdf", "a.a4.pdf"]
+
+
+class TestRemoveOutputs:
+    """Test cases for deleting the PDFs of removed songs."""
+
+    def test_every_variant_is_removed(self, temp_dir):
+        """Test that each variant's PDF of a removed song goes."""
+        for name in ("a.a6.pdf", "a.a4-diagrams.pdf", "b.a6.pdf"):
+            (temp_dir / name).write_bytes(b"%PDF")
+
+        removed = GenPDF.removeOutputs(
+            [temp_dir / "a.chopro"], "a6,a4", "false,true"
+        )
+
+        assert sorted(Path(pdf).name for pdf in removed) == [
+            "a.a4-diagrams.pdf",
+            "a.a6.pdf",
+        ]
+        assert os.listdir(temp_dir) == ["b.a6.pdf"]
+
+    def test_songbook_goes_with_its_last_song(self, temp_dir):
+        """Test that a songbook is kept while its folder has songs."""
+        for folder in ("folk", "blues"):
+            (temp_dir / folder).mkdir()
+            (temp_dir / folder / f"{folder}.pdf").write_bytes(b"%PDF")
+        (temp_dir / "folk" / "b.cho").touch()
+
+        GenPDF.removeOutputs(
+            [temp_dir / "folk" / "a.chopro", temp_dir / "blues" / "c.cho"],
+            "a6",
+            "false",
+            songbook=True,
+        )
+
+        assert (temp_dir / "folk" / "folk.pdf").exists()
+        assert not (temp_dir / "blues" / "blues.pdf").exists()
+
+
+class TestStagedRendering:
+    """Test cases for rendering patched copies from a staging area."""
+
+    def test_staged_render_leaves_sources_untouched(self, temp_dir):
+        """Test that chordpro sees patched text and the song is unchanged."""
+        original = "Normal line\n&blue: Blue line\nBack to normal\n"
+        song = temp_dir / "folk" / "song.chopro"
+        song.parent.mkdir()
+        song.write_text(original, encoding="utf-8")
+        seen = {}
+
+        def _run(cmd, **kwargs):
+            seen["output"] = cmd[-2]
+            seen["source"] = cmd[-1]
+            seen["text"] = Path(cmd[-1]).read_text(encoding="utf-8")
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run):
+            createPDFs(str(temp_dir), "a4", "true", staged=True)
+
+        assert song.read_text(encoding="utf-8") == original
+        assert seen["output"] == (
+            f"--output={Output.tempPath(str(temp_dir / 'folk' / 'song.pdf'))}"
+        )
+        assert Path(seen["source"]).name == "song.chopro"
+        assert Path(seen["source"]) != song
+        assert "{textcolour: blue}" in seen["text"]
+        assert "&blue" not in seen["text"]
+        # The staging area is removed once the run finishes
+        assert not Path(seen["source"]).exists()
+
+    def test_staged_single_file(self, temp_dir, mock_chordpro):
+        """Test staging a single song given by path."""
+        song = temp_dir / "song.cho"
+        song.write_text("&blue text\n", encoding="utf-8")
+
+        createPDFs(str(song), "a6", "false", staged=True)
+
+        cmd = mock_chordpro.call_args[0][0]
+        assert (
+            cmd[-2]
+            == f"--output={Output.tempPath(str(temp_dir / 'song.pdf'))}"
+        )
+        assert Path(cmd[-1]) != song
+        assert song.read_text(encoding="utf-8") == "&blue text\n"
+
+
+class TestSongbooks:
+    """Test cases for rendering one combined PDF per folder."""
+
+    def test_one_chordpro_process_per_folder(self, temp_dir, mock_chordpro):
+        """Test that each folder's songs go to a single chordpro call."""
+        for path in ("b.chopro", "a.cho", "folk/c.chopro", "folk/d.chopro"):
+            song = temp_dir / path
+            song.parent.mkdir(exist_ok=True)
+            song.touch()
+
+        createPDFs(str(temp_dir), "a4", "true", jobs=2, songbook=True)
+
+        calls = [call.args[0] for call in mock_chordpro.call_args_list]
+        assert len(calls) == 2
+        root_book, folk_book = sorted(calls, key=lambda cmd: cmd[-1])
+        assert root_book[-3:] == [
+            f"--output={Output.tempPath(bookOutput(str(temp_dir)))}",
+            str(temp_dir / "a.cho"),
+            str(temp_dir / "b.chopro"),
+        ]
+        assert folk_book[-3:] == [
+            f"--output={Output.tempPath(str(temp_dir / 'folk' / 'folk.pdf'))}",
+            str(temp_dir / "folk" / "c.chopro"),
+            str(temp_dir / "folk" / "d.chopro"),
+        ]
+
+    def test_incremental_songbook_tracks_all_songs(self, temp_dir):
+        """Test that editing one song rebuilds only its folder's book."""
+        for path in ("a.chopro", "folk/b.chopro"):
+            song = temp_dir / path
+            song.parent.mkdir(exist_ok=True)
+            song.write_text(path, encoding="utf-8")
+        outputs = []
+
+        def _run(cmd, **kwargs):
+            if cmd[-1] != "--version":
+                output = next(
+                    arg.split("=", 1)[1]
+                    for arg in cmd
+                    if arg.startswith("--output=")
+                )
+                outputs.append(Path(output).name.split("-", 2)[2])
+                Path(output).write_bytes(b"%PDF-1.4")
+            return subprocess.CompletedProcess(cmd, 0, "6.0\n", "")
+
+        GenPDF.chordproVersion.cache_clear()
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run):
+            createPDFs(
+                str(temp_dir), "a4", "true", incremental=True, songbook=True
+            )
+            assert sorted(outputs) == ["folk.pdf", temp_dir.name + ".pdf"]
+
+            outputs.clear()
+            (temp_dir / "folk" / "b.chopro").write_text(
+                "new", encoding="utf-8"
+            )
+            createPDFs(
+                str(temp_dir), "a4", "true", incremental=True, songbook=True
+            )
+            assert outputs == ["folk.pdf"]
+
+
+class TestSharedCache:
+    """Test cases for reusing PDFs rendered by another checkout."""
+
+    def _build(self, checkout, cacheDir):
+        """Render a checkout with the shared cache; list what chordpro ran."""
+        rendered = []
+
+        def _run(cmd, **kwargs):
+            if cmd[-1] == "--version":
+                return subprocess.CompletedProcess(cmd, 0, "6.050\n", "")
+            output = cmd[-2].split("=", 1)[1]
+            rendered.append(Path(cmd[-1]).name)
+            Path(output).write_bytes(b"%PDF " + Path(cmd[-1]).read_bytes())
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+
+        report = Report.newReport()
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run):
+            createPDFs(
+                str(checkout),
+                "a4",
+                "true",
+                staged=True,
+                report=report,
+                cache=str(cacheDir),
+            )
+        return sorted(rendered), report
+
+    def test_second_checkout_renders_nothing(self, temp_dir):
+        """Test that identical songs in another clone are cache hits."""
+        GenPDF.chordproVersion.cache_clear()
+        for clone in ("one", "two"):
+            (temp_dir / clone).mkdir()
+            (temp_dir / clone / "a.chopro").write_text(
+                "A &blue: x\n", encoding="utf-8"
+            )
+            (temp_dir / clone / "b.cho").write_text("B\n", encoding="utf-8")
+        (temp_dir / "two" / "b.cho").write_text("B edited\n", encoding="utf-8")
+        cacheDir = temp_dir / "cache"
+
+        assert self._build(temp_dir / "one", cacheDir)[0] == [
+            "a.chopro",
+            "b.cho",
+        ]
+        rendered, report = self._build(temp_dir / "two", cacheDir)
+
+        assert rendered == ["b.cho"]
+        assert (temp_dir / "two" / "a.pdf").read_bytes() == (
+            temp_dir / "one" / "a.pdf"
+        ).read_bytes()
+        caches = {
+            Path(song["output"]).name: song["cache"]
+            for song in report["songs"]
+        }
+        assert caches == {"a.pdf": "shared", "b.pdf": "miss"}
+        assert Report.summary(report)["cached"] == 1
+
+    def test_failed_render_is_not_cached(self, temp_dir):
+        """Test that only successful renders are stored."""
+        GenPDF.chordproVersion.cache_clear()
+        (temp_dir / "songs").mkdir()
+        (temp_dir / "songs" / "a.chopro").write_text("A\n", encoding="utf-8")
+
+        def _fail(cmd, **kwargs):
+            if cmd[-1] == "--version":
+                return subprocess.CompletedProcess(cmd, 0, "6.050\n", "")
+            Path(cmd[-2].split("=", 1)[1]).write_bytes(b"partial")
+            return subprocess.CompletedProcess(cmd, 1, "", "error\n")
+
+        with patch("genpdf_butler.GenPDF._run", side_effect=_fail):
+            createPDFs(
+                str(temp_dir / "songs"),
+                "a4",
+                "true",
+                cache=str(temp_dir / "cache"),
+            )
+
+        assert not any(
+            files for _, _, files in os.walk(temp_dir / "cache" / "pdf")
+        )
+
+
+class TestRunReport:
+    """Test cases for per-song instrumentation."""
+
+    def test_failures_are_recorded(self, temp_dir):
+        """Test that exit codes, stderr and timings reach the report."""
+        (temp_dir / "good.chopro").touch()
+        (temp_dir / "bad.chopro").touch()
+
+        def _run(cmd, **kwargs):
+            if cmd[-1].endswith("bad.chopro"):
+                return subprocess.CompletedProcess(cmd, 2, "", "Parse error\n")
+            Path(cmd[-2].split("=", 1)[1]).write_bytes(b"%PDF")
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+
+        report = Report.newReport()
+        with patch("genpdf_butler.GenPDF._run", side_effect=_run):
+            createPDFs(str(temp_dir), "a4", "true", jobs=2, report=report)
+
+        bad, good = report["songs"]
+        assert bad["returncode"] == 2
+        assert bad["stderr"] == "Parse error\n"
+        assert bad["size"] is None
+        assert good["returncode"] == 0
+        assert good["size"] == 4
+        assert good["cache"] == "miss"
+        assert good["seconds"] >= 0
+        assert "render" in report["phases"]
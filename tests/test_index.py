@@ -0,0 +1,158 @@
+"""Tests for Index module."""
+
+import os
+
+import pytest
+
+from genpdf_butler import Index
+
+
+def _song(path, title, artist, key="G", tags=""):
+    """Write a song with the given metadata directives."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = [f"{{title: {title}}}", f"{{artist: {artist}}}", f"{{key: {key}}}"]
+    if tags:
+        lines.append(f"{{tag: {tags}}}")
+    path.write_text("\n".join(lines) + "\n[G]La la\n", encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def library(temp_dir):
+    """A small library with an index built over it."""
+    root = temp_dir / "library"
+    _song(root / "cash" / "ring.chopro", "Ring of Fire", "Johnny Cash")
+    _song(root / "cash" / "walk.cho", "I Walk the Line", "Johnny Cash", "F")
+    _song(
+        root / "trad" / "night.chopro",
+        "Silent Night",
+        "Traditional",
+        "C",
+        "christmas, hymn",
+    )
+    conn = Index.openIndex(Index.indexPath(str(root)))
+    Index.updateIndex(conn, str(root))
+    yield root, conn
+    conn.close()
+
+
+class TestIndex:
+    """Test cases for the song metadata index."""
+
+    def test_read_meta(self):
+        """Test the directive forms that carry metadata."""
+        meta = Index.readMeta(
+            b"{t: Title}\n{title: Later}\n{meta: artist Someone}\n"
+            b"{key:D}\n{tag: a, b}\n{tag: c}\n{comment: x}\n"
+        )
+        assert meta == {
+            "title": "Title",
+            "artist": "Someone",
+            "key": "D",
+            "tag": ["a", "b", "c"],
+        }
+
+    def test_where_selects_by_metadata(self, library):
+        """Test field matching, wildcards and combined conditions."""
+        root, conn = library
+
+        def names(*where):
+            selected = Index.select(
+                conn, str(root), [Index.parseWhere(w) for w in where]
+            )
+            return [song.name for song in selected]
+
+        assert names("artist=johnny cash") == ["ring.chopro", "walk.cho"]
+        assert names("title=*night*") == ["night.chopro"]
+        assert names("tag=HYMN") == ["night.chopro"]
+        assert names("artist=Johnny*", "key=F") == ["walk.cho"]
+        assert names("path=trad/*") == ["night.chopro"]
+        assert names("artist=nobody") == []
+
+    def test_parse_where_rejects_unknown_fields(self):
+        """Test that a malformed condition is reported."""
+        for text in ("composer=x", "artist"):
+            with pytest.raises(ValueError):
+                Index.parseWhere(text)
+
+    def test_setlist_order_by_path_or_title(self, library, caplog):
+        """Test that a setlist keeps its order and warns about misses."""
+        root, conn = library
+        selected = Index.select(
+            conn,
+            str(root),
+            setlist=["silent night", "cash/ring.chopro", "Missing Song"],
+        )
+        assert selected == [
+            root / "trad" / "night.chopro",
+            root / "cash" / "ring.chopro",
+        ]
+        assert "Missing Song" in caplog.text
+
+    def test_only_changed_songs_are_read_again(self, library, monkeypatch):
+        """Test that an update re-reads just the songs that changed."""
+        root, conn = library
+        song = _song(root / "cash" / "ring.chopro", "Ring of Fire", "June")
+        os.utime(song, ns=(1, 1))
+        (root / "trad" / "night.chopro").unlink()
+        stored = []
+        real = Index._store
+        monkeypatch.setattr(
+            Index,
+            "_store",
+            lambda conn, relPath, *args: (
+                stored.append(relPath),
+                real(conn, relPath, *args),
+            ),
+        )
+
+        Index.updateIndex(conn, str(root))
+
+        assert stored == ["cash/ring.chopro"]
+        paths = [row[0] for row in conn.execute("SELECT path FROM songs")]
+        assert sorted(paths) == ["cash/ring.chopro", "cash/walk.cho"]
+        assert conn.execute("SELECT count(*) FROM tags").fetchone() == (0,)
+
+    def test_restored_songs_are_not_parsed_again(self, library, monkeypatch):
+        """Test that a song patched and restored in place is only hashed."""
+        root, conn = library
+        song = root / "cash" / "ring.chopro"
+        original = song.read_bytes()
+        song.write_bytes(b"{textcolour: blue}\n" + original)
+        song.write_bytes(original)
+        os.utime(song, ns=(1, 1))
+        stored = []
+        monkeypatch.setattr(
+            Index,
+            "_store",
+            lambda conn, relPath, *args: stored.append(relPath),
+        )
+
+        Index.updateIndex(conn, str(root))
+
+        assert stored == []
+        assert conn.execute(
+            "SELECT mtime FROM songs WHERE path = 'cash/ring.chopro'"
+        ).fetchone() == (1,)
+
+    def test_selection_sees_edited_matches(self, library):
+        """Test that a stale match is re-read before being selected."""
+        root, conn = library
+        _song(root / "cash" / "walk.cho", "I Walk the Line", "Someone Else")
+        os.utime(root / "cash" / "walk.cho", ns=(1, 1))
+
+        selected = Index.select(
+            conn, str(root), [Index.parseWhere("artist=johnny cash")]
+        )
+
+        assert selected == [root / "cash" / "ring.chopro"]
+
+    def test_indexing_passes_songs_through(self, library):
+        """Test that the discovery tap yields every song unchanged."""
+        root, conn = library
+        songs = [root / "cash" / "ring.chopro", root / "new.chopro"]
+        _song(songs[1], "New", "Someone")
+
+        assert list(Index.indexing(conn, str(root), iter(songs))) == songs
+        paths = [row[0] for row in conn.execute("SELECT path FROM songs")]
+        assert sorted(paths) == ["cash/ring.chopro", "new.chopro"]
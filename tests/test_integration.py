@@ -0,0 +1,282 @@
+"""End-to-end tests running genpdf against the fake chordpro."""
+
+import json
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
+from git import Repo
+
+from benchmarks.corpus import generateCorpus
+from genpdf_butler import Manifest, Merge
+from genpdf_butler.__main__ import main
+
+pytestmark = pytest.mark.integration
+
+
+def _run_genpdf(*args):
+    """Run the genpdf entry point with the given arguments."""
+    with patch.object(sys, "argv", ["genpdf", *args]):
+        main()
+
+
+class TestEndToEnd:
+    """Test cases for complete genpdf runs."""
+
+    def test_staged_build(self, temp_dir, fake_chordpro):
+        """Test that every song gets a PDF and no song is modified."""
+        library = temp_dir / "library"
+        songs = generateCorpus(library, 12, blueDensity=0.5, folders=3)
+        before = {song: song.read_bytes() for song in songs}
+
+        _run_genpdf(str(library), "--staged", "--jobs", "4")
+
+        for song in songs:
+            assert song.with_suffix(".pdf").read_bytes().startswith(b"%PDF")
+            assert song.read_bytes() == before[song]
+
+    def test_rebuild_touches_only_changed_pdfs(self, temp_dir, fake_chordpro):
+        """Test that a full rebuild rewrites just the edited song's PDF."""
+        library = temp_dir / "library"
+        songs = generateCorpus(library, 10, blueDensity=0.5, folders=2)
+        _run_genpdf(str(library), "--staged", "--jobs", "2")
+        for song in songs:
+            os.utime(song.with_suffix(".pdf"), (1_000_000_000, 1_000_000_000))
+        songs[3].write_text("{title: Edited}\n", encoding="utf-8")
+
+        _run_genpdf(str(library), "--staged", "--jobs", "2")
+
+        touched = [
+            song
+            for song in songs
+            if song.with_suffix(".pdf").stat().st_mtime != 1_000_000_000
+        ]
+        assert touched == [songs[3]]
+
+    def test_in_place_build_restores_sources(
+        self, temp_dir, fake_chordpro, monkeypatch
+    ):
+        """Test the git-backed flow: patch, render, then restore."""
+        library = temp_dir / "library"
+        songs = generateCorpus(library, 8, blueDensity=0.5, folders=2)
+        repo = Repo.init(library)
+        with repo.config_writer() as config:
+            config.set_value("user", "name", "Test")
+            config.set_value("user", "email", "test@example.com")
+        repo.index.add([str(song.relative_to(library)) for song in songs])
+        repo.index.commit("songs")
+        monkeypatch.chdir(library)
+
+        _run_genpdf(str(library), "--jobs", "2")
+
+        assert all(song.with_suffix(".pdf").exists() for song in songs)
+        assert not repo.is_dirty(untracked_files=False)
+
+    def test_changed_build_follows_git_history(
+        self, temp_dir, fake_chordpro, monkeypatch
+    ):
+        """Test that --changed renders only what was committed since."""
+        library = temp_dir / "library"
+        songs = generateCorpus(library, 6, blueDensity=0.5, folders=2)
+        repo = Repo.init(library)
+        with repo.config_writer() as config:
+            config.set_value("user", "name", "Test")
+            config.set_value("user", "email", "test@example.com")
+        repo.index.add([str(song.relative_to(library)) for song in songs])
+        repo.index.commit("songs")
+        monkeypatch.chdir(library)
+
+        _run_genpdf(str(library), "--changed", "--jobs", "2")
+        assert all(song.with_suffix(".pdf").exists() for song in songs)
+
+        edited, deleted, untouched = songs[0], songs[1], songs[2]
+        edited.write_text("{title: Edited}\n", encoding="utf-8")
+        repo.index.add([str(edited.relative_to(library))])
+        repo.index.remove(
+            [str(deleted.relative_to(library))], working_tree=True
+        )
+        repo.index.commit("edit")
+        edited.with_suffix(".pdf").unlink()
+        untouched.with_suffix(".pdf").unlink()
+
+        _run_genpdf(str(library), "--changed")
+
+        assert edited.with_suffix(".pdf").exists()
+        assert not deleted.with_suffix(".pdf").exists()
+        assert not untouched.with_suffix(".pdf").exists()
+        assert not repo.is_dirty(untracked_files=False)
+
+    def test_generated_corpus_is_reproducible(self, temp_dir):
+        """Test that the benchmark corpus is deterministic."""
+        first = generateCorpus(temp_dir / "a", 20, blueDensity=0.3)
+        second = generateCorpus(temp_dir / "b", 20, blueDensity=0.3)
+        assert [song.read_bytes() for song in first] == [
+            song.read_bytes() for song in second
+        ]
+        assert sum(song.suffix == ".cho" for song in first) == 5
+
+    def test_sharded_build_merges(self, temp_dir, fake_chordpro):
+        """Test that concurrent shard processes cover every song once."""
+        library = temp_dir / "library"
+        songs = generateCorpus(library, 15, blueDensity=0.5, folders=3)
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+
+        processes = [
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "genpdf_butler",
+                    str(library),
+                    "--staged",
+                    "--incremental",
+                    "--shard",
+                    f"{i}/3",
+                    "--manifest",
+                    str(temp_dir / f"m{i}.json"),
+                    "--report",
+                    str(temp_dir / f"r{i}.json"),
+                ],
+                env=env,
+            )
+            for i in (1, 2, 3)
+        ]
+        assert [process.wait() for process in processes] == [0, 0, 0]
+        Merge.main(
+            [
+                "--manifests",
+                *(str(temp_dir / f"m{i}.json") for i in (1, 2, 3)),
+                "--manifest-out",
+                str(temp_dir / "m.json"),
+                "--reports",
+                *(str(temp_dir / f"r{i}.json") for i in (1, 2, 3)),
+                "--report-out",
+                str(temp_dir / "r.json"),
+            ]
+        )
+
+        shards = [
+            set(Manifest.loadManifest(str(temp_dir / f"m{i}.json"))["songs"])
+            for i in (1, 2, 3)
+        ]
+        assert all(shards)
+        assert sum(len(shard) for shard in shards) == len(songs)
+        merged = Manifest.loadManifest(str(temp_dir / "m.json"))
+        assert set(merged["songs"]) == {
+            song.relative_to(library).as_posix() for song in songs
+        }
+        assert set(merged["timings"]) == set(merged["songs"])
+        report = json.loads((temp_dir / "r.json").read_text("utf-8"))
+        assert report["summary"]["songs"] == len(songs)
+        assert all(song.with_suffix(".pdf").exists() for song in songs)
+
+    def test_repeated_sharded_builds_render_each_song_once(
+        self, temp_dir, fake_chordpro
+    ):
+        """Test that shards with their own manifests agree on every run."""
+        library = temp_dir / "library"
+        songs = generateCorpus(library, 30, blueDensity=0.5, folders=3)
+        env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+
+        def build(run, *extra):
+            """Run three shards side by side; list what each one rendered."""
+            processes = [
+                subprocess.Popen(
+                    [
+                        sys.executable,
+                        "-m",
+                        "genpdf_butler",
+                        str(library),
+                        "--staged",
+                        "--shard",
+                        f"{i}/3",
+                        "--manifest",
+                        str(temp_dir / f"m{i}.json"),
+                        "--report",
+                        str(temp_dir / f"r{run}-{i}.json"),
+                        *extra,
+                    ],
+                    env=env,
+                )
+                for i in (1, 2, 3)
+            ]
+            assert [process.wait() for process in processes] == [0, 0, 0]
+            rendered = []
+            for i in (1, 2, 3):
+                report = (temp_dir / f"r{run}-{i}.json").read_text("utf-8")
+                rendered.extend(
+                    song["song"] for song in json.loads(report)["songs"]
+                )
+            return sorted(rendered)
+
+        everySong = sorted(str(song) for song in songs)
+        assert build(1) == everySong
+        assert build(2) == everySong
+
+        Merge.main(
+            [
+                "--manifests",
+                *(str(temp_dir / f"m{i}.json") for i in (1, 2, 3)),
+                "--manifest-out",
+                str(temp_dir / "costs.json"),
+            ]
+        )
+        costs = ["--shard-costs", str(temp_dir / "costs.json")]
+        assert build(3, *costs) == everySong
+        assert build(4, *costs) == everySong
+
+    def test_selective_build_from_index(self, temp_dir, fake_chordpro):
+        """Test --where and --setlist against the metadata index."""
+        library = temp_dir / "library"
+        songs = generateCorpus(library, 12, blueDensity=0.5, folders=3)
+        wanted = [
+            song
+            for song in songs
+            if "{artist: Artist 3}" in song.read_text(encoding="utf-8")
+        ]
+
+        _run_genpdf(str(library), "--staged", "--where", "artist=artist 3")
+
+        assert wanted
+        assert [
+            song for song in songs if song.with_suffix(".pdf").exists()
+        ] == (wanted)
+        assert (library / ".genpdf-index.sqlite").exists()
+
+        setlist = temp_dir / "setlist.txt"
+        setlist.write_text(
+            f"# encore\n{songs[5].relative_to(library).as_posix()}\n",
+            encoding="utf-8",
+        )
+        _run_genpdf(str(library), "--staged", "--setlist", str(setlist))
+
+        assert songs[5].with_suffix(".pdf").exists()
+        assert sum(song.with_suffix(".pdf").exists() for song in songs) == (
+            len(wanted) + 1
+        )
+
+    def test_profile_writes_trace_and_stats(
+        self, temp_dir, fake_chordpro, monkeypatch
+    ):
+        """Test that concurrent renders land on separate trace tracks."""
+        import pstats
+
+        library = temp_dir / "library"
+        generateCorpus(library, 6, blueDensity=0.5, folders=2)
+        monkeypatch.setenv("GENPDF_FAKE_CHORDPRO_LATENCY", "0.2")
+        trace = temp_dir / "run.json"
+
+        _run_genpdf(
+            str(library), "--staged", "--jobs", "3", "--profile", str(trace)
+        )
+
+        events = json.loads(trace.read_text(encoding="utf-8"))["traceEvents"]
+        renders = [e for e in events if e.get("cat") == "render"]
+        phases = {e["name"] for e in events if e.get("cat") == "phase"}
+        assert len(renders) == 6
+        assert len({e["tid"] for e in renders}) == 3
+        assert {"discovery", "render"} <= phases
+        assert pstats.Stats(str(temp_dir / "run.pstats")).total_calls > 0
+        assert not (temp_dir / "report.json").exists()
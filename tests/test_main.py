@@ -1,27 +1,46 @@
 """Tests for __main__ module."""
 
+import json
+import logging
 import os
+import subprocess
 import sys
+from pathlib import Path
 from unittest.mock import Mock, patch
 
+import pytest
+
+from genpdf_butler import Manifest
 from genpdf_butler.__main__ import main
+from genpdf_butler.Discovery import findSongs
+
+
+def _mock_repo(status=""):
+    """Create a mock Repo whose `git status` prints the given entries."""
+    mock_repo_instance = Mock()
+    mock_repo_instance.working_tree_dir = os.getcwd()
+    mock_repo_instance.git.status.return_value = status
+    return mock_repo_instance
 
 
 class TestMain:
     """Test cases for the main function."""
 
-    @patch("genpdf_butler.__main__.Repo")
-    @patch("genpdf_butler.__main__.GenPDF.createPDFs")
-    @patch("genpdf_butler.__main__.PatchTextColor.PatchColors")
-    def test_main_with_clean_repo(
-        self, mock_patch_colors, mock_create_pdfs, mock_repo
-    ):
+    @pytest.fixture(autouse=True)
+    def _chordpro_installed(self):
+        """Answer the startup probe as an installed chordpro would."""
+        with patch(
+            "genpdf_butler.GenPDF.probeChordpro",
+            return_value=("/usr/bin/chordpro", "6.050"),
+        ):
+            yield
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_main_with_clean_repo(self, mock_create_pdfs, mock_repo):
         """Test main function with a clean repository."""
         # Mock a clean repository
-        mock_repo_instance = Mock()
-        mock_repo_instance.index.diff.return_value = []
-        mock_repo_instance.untracked_files = []
-        mock_repo_instance.git.restore = Mock()
+        mock_repo_instance = _mock_repo()
         mock_repo.return_value = mock_repo_instance
 
         # Mock command line arguments
@@ -37,28 +56,25 @@ class TestMain:
         with patch.object(sys, "argv", test_args):
             main()
 
-            # Verify that the processing functions were called
-            mock_patch_colors.assert_called_once()
-            mock_create_pdfs.assert_called_once_with("test_dir", "a4", "true")
+            # Verify that the processing functions were called; songs are
+            # patched in place by createPDFs as it plans them
+            mock_create_pdfs.assert_called_once()
+            assert mock_create_pdfs.call_args.kwargs["patched"] == []
+            assert mock_create_pdfs.call_args.args == (
+                "test_dir",
+                "a4",
+                "true",
+            )
 
-            # Verify git restore was called for both file types
-            mock_repo_instance.git.restore.assert_any_call("*.chopro")
-            mock_repo_instance.git.restore.assert_any_call("*.cho")
+            # Nothing was patched, so there is nothing to restore
+            mock_repo_instance.git.restore.assert_not_called()
 
-    @patch("genpdf_butler.__main__.Repo")
-    @patch("genpdf_butler.__main__.GenPDF.createPDFs")
-    @patch("genpdf_butler.__main__.PatchTextColor.PatchColors")
-    @patch("builtins.print")
-    def test_main_with_dirty_repo(
-        self, mock_print, mock_patch_colors, mock_create_pdfs, mock_repo
-    ):
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_main_with_dirty_repo(self, mock_create_pdfs, mock_repo, caplog):
         """Test main function with modified chopro files in repository."""
         # Mock a repository with dirty chopro files
-        mock_repo_instance = Mock()
-        mock_diff_item = Mock()
-        mock_diff_item.a_path = "song.chopro"
-        mock_repo_instance.index.diff.return_value = [mock_diff_item]
-        mock_repo_instance.untracked_files = ["new_song.cho"]
+        mock_repo_instance = _mock_repo(" M song.chopro\0?? new_song.cho\0")
         mock_repo.return_value = mock_repo_instance
 
         test_args = ["genpdf", "test_dir"]
@@ -67,31 +83,22 @@ class TestMain:
             main()
 
             # Verify that processing functions were NOT called
-            mock_patch_colors.assert_not_called()
             mock_create_pdfs.assert_not_called()
 
-            # Verify error messages were printed
-            mock_print.assert_called()
-            print_calls = [call[0][0] for call in mock_print.call_args_list]
-
-            # Check that appropriate error messages were printed
-            error_message_found = any(
-                "Cannot operate on a repo" in call for call in print_calls
-            )
-            assert error_message_found
-
-    @patch("genpdf_butler.__main__.Repo")
-    @patch("genpdf_butler.__main__.GenPDF.createPDFs")
-    @patch("genpdf_butler.__main__.PatchTextColor.PatchColors")
-    def test_main_default_arguments(
-        self, mock_patch_colors, mock_create_pdfs, mock_repo
-    ):
+            # Check that appropriate error messages were logged
+            errors = [
+                record.message
+                for record in caplog.records
+                if record.levelno == logging.ERROR
+            ]
+            assert any("Cannot operate on a repo" in e for e in errors)
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_main_default_arguments(self, mock_create_pdfs, mock_repo):
         """Test main function with default arguments."""
         # Mock a clean repository
-        mock_repo_instance = Mock()
-        mock_repo_instance.index.diff.return_value = []
-        mock_repo_instance.untracked_files = []
-        mock_repo_instance.git.restore = Mock()
+        mock_repo_instance = _mock_repo()
         mock_repo.return_value = mock_repo_instance
 
         # Test with minimal arguments (just the script name)
@@ -105,22 +112,21 @@ class TestMain:
             main()
 
             # Verify default values were used
-            mock_create_pdfs.assert_called_once_with(
-                "/current/dir", "a6", "false"
+            mock_create_pdfs.assert_called_once()
+            assert mock_create_pdfs.call_args.args == (
+                "/current/dir",
+                "a6",
+                "false",
             )
+            assert mock_create_pdfs.call_args.kwargs["jobs"] == os.cpu_count()
+            assert mock_create_pdfs.call_args.kwargs["incremental"] is False
 
-    @patch("genpdf_butler.__main__.Repo")
-    @patch("genpdf_butler.__main__.GenPDF.createPDFs")
-    @patch("genpdf_butler.__main__.PatchTextColor.PatchColors")
-    def test_main_custom_arguments(
-        self, mock_patch_colors, mock_create_pdfs, mock_repo
-    ):
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_main_custom_arguments(self, mock_create_pdfs, mock_repo):
         """Test main function with custom arguments."""
         # Mock a clean repository
-        mock_repo_instance = Mock()
-        mock_repo_instance.index.diff.return_value = []
-        mock_repo_instance.untracked_files = []
-        mock_repo_instance.git.restore = Mock()
+        mock_repo_instance = _mock_repo()
         mock_repo.return_value = mock_repo_instance
 
         test_args = [
@@ -135,51 +141,47 @@ class TestMain:
         with patch.object(sys, "argv", test_args):
             main()
 
-            mock_create_pdfs.assert_called_once_with(
-                "/music/folder", "letter", "true"
+            mock_create_pdfs.assert_called_once()
+            assert mock_create_pdfs.call_args.args == (
+                "/music/folder",
+                "letter",
+                "true",
             )
 
-    @patch("genpdf_butler.__main__.Repo")
-    @patch("builtins.print")
-    def test_stderr_output(self, mock_print, mock_repo):
+    @patch("git.Repo")
+    def test_stderr_output(self, mock_repo, capsys):
         """Test that status message is printed to stderr."""
-        mock_repo_instance = Mock()
-        mock_repo_instance.index.diff.return_value = []
-        mock_repo_instance.untracked_files = []
-        mock_repo_instance.git.restore = Mock()
+        mock_repo_instance = _mock_repo()
         mock_repo.return_value = mock_repo_instance
 
         test_args = ["genpdf"]
 
         with (
             patch.object(sys, "argv", test_args),
-            patch("genpdf_butler.__main__.PatchTextColor.PatchColors"),
-            patch("genpdf_butler.__main__.GenPDF.createPDFs"),
+            patch("genpdf_butler.GenPDF.createPDFs"),
         ):
 
             main()
 
             # Check that the status message was printed
-            mock_print.assert_called_with(
-                "Generating Music List (this takes a few seconds)",
-                file=sys.stderr,
+            captured = capsys.readouterr()
+            assert (
+                "Generating Music List (this takes a few seconds)"
+                in captured.err
             )
+            assert "Generating Music List" not in captured.out
 
-    @patch("genpdf_butler.__main__.Repo")
+    @patch("git.Repo")
     def test_git_repo_initialization(self, mock_repo):
         """Test that git repository is properly initialized."""
-        mock_repo_instance = Mock()
-        mock_repo_instance.index.diff.return_value = []
-        mock_repo_instance.untracked_files = []
-        mock_repo_instance.git.restore = Mock()
+        mock_repo_instance = _mock_repo()
         mock_repo.return_value = mock_repo_instance
 
         test_args = ["genpdf"]
 
         with (
             patch.object(sys, "argv", test_args),
-            patch("genpdf_butler.__main__.PatchTextColor.PatchColors"),
-            patch("genpdf_butler.__main__.GenPDF.createPDFs"),
+            patch("genpdf_butler.GenPDF.createPDFs"),
         ):
 
             main()
@@ -189,25 +191,14 @@ class TestMain:
                 path=".", search_parent_directories=True
             )
 
-    @patch("genpdf_butler.__main__.Repo")
-    @patch("builtins.print")
-    def test_dirty_files_filtering(self, mock_print, mock_repo):
+    @patch("git.Repo")
+    def test_dirty_files_filtering(self, mock_repo, caplog):
         """Test that only chopro/cho files are considered for dirty check."""
         # Mock repository with mixed file types
-        mock_diff_items = [
-            Mock(a_path="song.chopro"),
-            Mock(a_path="readme.txt"),
-            Mock(a_path="config.cho"),
-            Mock(a_path="script.py"),
-        ]
-
-        mock_repo_instance = Mock()
-        mock_repo_instance.index.diff.return_value = mock_diff_items
-        mock_repo_instance.untracked_files = [
-            "new_song.chopro",
-            "other.md",
-            "test.cho",
-        ]
+        mock_repo_instance = _mock_repo(
+            " M song.chopro\0 M readme.txt\0 M config.cho\0 M script.py\0"
+            "?? new_song.chopro\0?? other.md\0?? test.cho\0"
+        )
         mock_repo.return_value = mock_repo_instance
 
         test_args = ["genpdf"]
@@ -216,7 +207,8 @@ class TestMain:
             main()
 
             # Should print information about chopro/cho files only
-            print_calls = [call[0][0] for call in mock_print.call_args_list]
+            print_calls = caplog.messages
+            assert any("song.chopro" in call for call in print_calls)
 
             # Non chopro/cho files should not be mentioned
             txt_mentioned = any("readme.txt" in call for call in print_calls)
@@ -243,20 +235,415 @@ class TestMain:
         for test_args, expected_args in test_cases:
             with (
                 patch.object(sys, "argv", test_args),
-                patch("genpdf_butler.__main__.Repo") as mock_repo,
-                patch("genpdf_butler.__main__.PatchTextColor.PatchColors"),
-                patch(
-                    "genpdf_butler.__main__.GenPDF.createPDFs"
-                ) as mock_create_pdfs,
+                patch("git.Repo") as mock_repo,
+                patch("genpdf_butler.GenPDF.createPDFs") as mock_create_pdfs,
             ):
 
                 # Mock clean repo
-                mock_repo_instance = Mock()
-                mock_repo_instance.index.diff.return_value = []
-                mock_repo_instance.untracked_files = []
-                mock_repo_instance.git.restore = Mock()
+                mock_repo_instance = _mock_repo()
                 mock_repo.return_value = mock_repo_instance
 
                 main()
 
-                mock_create_pdfs.assert_called_once_with(*expected_args)
+                mock_create_pdfs.assert_called_once()
+                assert mock_create_pdfs.call_args.args == expected_args
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_jobs_argument(self, mock_create_pdfs, mock_repo):
+        """Test that --jobs is passed through to createPDFs."""
+        mock_repo_instance = _mock_repo()
+        mock_repo.return_value = mock_repo_instance
+
+        with patch.object(sys, "argv", ["genpdf", "songs", "--jobs", "3"]):
+            main()
+
+        assert mock_create_pdfs.call_args.kwargs["jobs"] == 3
+        assert mock_create_pdfs.call_args.kwargs["minJobs"] is None
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_jobs_bounds_enable_adaptive_concurrency(
+        self, mock_create_pdfs, mock_repo
+    ):
+        """Test that --jobs MIN:MAX passes both bounds to createPDFs."""
+        mock_repo.return_value = _mock_repo()
+
+        with patch.object(sys, "argv", ["genpdf", "songs", "--jobs", "2:6"]):
+            main()
+
+        assert mock_create_pdfs.call_args.kwargs["jobs"] == 6
+        assert mock_create_pdfs.call_args.kwargs["minJobs"] == 2
+
+    def test_jobs_argument_must_be_positive(self):
+        """Test that --jobs rejects values below one."""
+        with (
+            patch.object(sys, "argv", ["genpdf", "--jobs", "0"]),
+            pytest.raises(SystemExit),
+        ):
+            main()
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_timeout_and_retries_arguments(self, mock_create_pdfs, mock_repo):
+        """Test that --timeout 0 disables the limit and --retries passes."""
+        mock_repo.return_value = _mock_repo()
+        argv = ["genpdf", "songs", "--timeout", "0", "--retries", "3"]
+        with patch.object(sys, "argv", argv):
+            main()
+
+        assert mock_create_pdfs.call_args.kwargs["timeout"] is None
+        assert mock_create_pdfs.call_args.kwargs["retries"] == 3
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_quiet_and_verbose(self, mock_create_pdfs, mock_repo, capsys):
+        """Test that -q hides progress and info, -v shows per-song detail."""
+        mock_repo.return_value = _mock_repo()
+        logger = logging.getLogger("genpdf_butler")
+        try:
+            with patch.object(sys, "argv", ["genpdf", "songs", "--quiet"]):
+                main()
+            assert mock_create_pdfs.call_args.kwargs["progress"] is False
+            assert logger.getEffectiveLevel() == logging.WARNING
+            assert capsys.readouterr().err == ""
+
+            with patch.object(sys, "argv", ["genpdf", "songs", "-v"]):
+                main()
+            assert mock_create_pdfs.call_args.kwargs["progress"] is False
+            assert logger.getEffectiveLevel() == logging.DEBUG
+
+            with patch.object(sys, "argv", ["genpdf", "songs"]):
+                main()
+            assert mock_create_pdfs.call_args.kwargs["progress"] is True
+            assert logger.getEffectiveLevel() == logging.INFO
+        finally:
+            logger.setLevel(logging.NOTSET)
+
+    def test_changed_requires_git(self):
+        """Test that --changed cannot be combined with --no-git."""
+        with (
+            patch.object(sys, "argv", ["genpdf", "--changed", "--no-git"]),
+            pytest.raises(SystemExit),
+        ):
+            main()
+
+    def test_bad_shard_is_rejected(self):
+        """Test that --shard needs a valid i/N and no --watch."""
+        for argv in (
+            ["--shard", "3/2"],
+            ["--shard", "1/2", "--watch"],
+            ["--shard-costs", "m.json"],
+        ):
+            with (
+                patch.object(sys, "argv", ["genpdf", *argv]),
+                pytest.raises(SystemExit),
+            ):
+                main()
+
+    def test_selection_needs_a_plain_build(self):
+        """Test that --where is rejected with --songbook or bad fields."""
+        for argv in (
+            ["--where", "artist=x", "--songbook"],
+            ["--where", "composer=x", "--staged"],
+        ):
+            with (
+                patch.object(sys, "argv", ["genpdf", *argv]),
+                pytest.raises(SystemExit),
+            ):
+                main()
+
+    def test_optimize_needs_pikepdf(self, monkeypatch):
+        """Test that --optimize explains how to install pikepdf."""
+        from genpdf_butler import Optimize
+
+        monkeypatch.setattr(Optimize, "pikepdf", None)
+        with (
+            patch.object(sys, "argv", ["genpdf", "--optimize"]),
+            pytest.raises(SystemExit),
+        ):
+            main()
+
+    def test_mismatched_variant_lists_are_rejected(self):
+        """Test that --pagesize and --showchords lists must pair up."""
+        argv = ["genpdf", "--pagesize", "a6,a4", "--showchords", "a,b,c"]
+        with (
+            patch.object(sys, "argv", argv),
+            pytest.raises(SystemExit),
+        ):
+            main()
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_incremental_argument(self, mock_create_pdfs, mock_repo):
+        """Test that --incremental is passed through to createPDFs."""
+        mock_repo_instance = _mock_repo()
+        mock_repo.return_value = mock_repo_instance
+
+        with patch.object(sys, "argv", ["genpdf", "songs", "--incremental"]):
+            main()
+
+        assert mock_create_pdfs.call_args.kwargs["incremental"] is True
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_shards_keep_their_own_manifest(self, mock_create_pdfs, mock_repo):
+        """Test that an incremental shard defaults to a manifest of its own."""
+        mock_repo.return_value = _mock_repo()
+        argv = ["genpdf", "songs", "--incremental", "--shard", "2/3"]
+
+        with patch.object(sys, "argv", argv):
+            main()
+
+        assert mock_create_pdfs.call_args.kwargs[
+            "manifestFile"
+        ] == Manifest.shardManifestPath("songs", 2, 3)
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_staged_mode_skips_git_and_patching(
+        self, mock_create_pdfs, mock_repo
+    ):
+        """Test that --staged never opens the repo or patches in place."""
+        with patch.object(sys, "argv", ["genpdf", "songs", "--staged"]):
+            main()
+
+        mock_repo.assert_not_called()
+        mock_create_pdfs.assert_called_once()
+        assert mock_create_pdfs.call_args.kwargs["staged"] is True
+        # Nothing is patched in place, so there is nothing to restore
+        assert "patched" not in mock_create_pdfs.call_args.kwargs
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.Repository.restoreSongs")
+    def test_songs_stream_through_patching(
+        self, mock_restore, mock_repo, temp_dir
+    ):
+        """Test that each song is patched only as the renderer asks."""
+        (temp_dir / "a.chopro").write_text("&blue: a\n", encoding="utf-8")
+        (temp_dir / "b.cho").write_text("b\n", encoding="utf-8")
+        mock_repo_instance = _mock_repo()
+        mock_repo.return_value = mock_repo_instance
+        seen = []
+
+        def _run(cmd, **kwargs):
+            # Each song arrives already patched
+            song = Path(cmd[-1])
+            seen.append((song, "{textcolour" in song.read_text()))
+            return subprocess.CompletedProcess(cmd, 0, "", "")
+
+        with (
+            patch.object(sys, "argv", ["genpdf", str(temp_dir)]),
+            patch(
+                "genpdf_butler.Discovery.findSongs",
+                wraps=findSongs,
+            ) as mock_find,
+            patch("genpdf_butler.GenPDF._run", side_effect=_run),
+        ):
+            main()
+
+        mock_find.assert_called_once_with(str(temp_dir))
+        assert seen == [
+            (temp_dir / "a.chopro", True),
+            (temp_dir / "b.cho", False),
+        ]
+        mock_restore.assert_called_once_with(
+            mock_repo_instance, [temp_dir / "a.chopro"]
+        )
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    @patch("genpdf_butler.Repository.restoreSongs")
+    def test_only_patched_songs_are_restored(
+        self, mock_restore, mock_create_pdfs, mock_repo
+    ):
+        """Test that the restore is limited to the files patching changed."""
+        mock_repo_instance = _mock_repo()
+        mock_repo.return_value = mock_repo_instance
+
+        def _render(*args, patched, **kwargs):
+            patched.append("songs/a.chopro")
+            raise RuntimeError("render failed")
+
+        mock_create_pdfs.side_effect = _render
+
+        with (
+            patch.object(sys, "argv", ["genpdf", "songs"]),
+            pytest.raises(RuntimeError),
+        ):
+            main()
+
+        # Patched songs are put back even when rendering fails
+        mock_restore.assert_called_once_with(
+            mock_repo_instance, ["songs/a.chopro"]
+        )
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_songbook_argument(self, mock_create_pdfs, mock_repo):
+        """Test that --songbook is passed through to createPDFs."""
+        mock_repo.return_value = _mock_repo()
+
+        with patch.object(sys, "argv", ["genpdf", "songs", "--songbook"]):
+            main()
+
+        assert mock_create_pdfs.call_args.kwargs["songbook"] is True
+
+    def test_report_is_written(self, temp_dir, mock_chordpro):
+        """Test that --report records every song and the run phases."""
+        (temp_dir / "a.chopro").write_text("&blue: a\n", encoding="utf-8")
+        (temp_dir / "b.cho").write_text("b\n", encoding="utf-8")
+        report = temp_dir / "report.json"
+
+        test_args = [
+            "genpdf",
+            str(temp_dir),
+            "--staged",
+            "--jobs",
+            "2",
+            "--report",
+            str(report),
+        ]
+        with patch.object(sys, "argv", test_args):
+            main()
+
+        data = json.loads(report.read_text(encoding="utf-8"))
+        assert [song["song"] for song in data["songs"]] == [
+            str(temp_dir / "a.chopro"),
+            str(temp_dir / "b.cho"),
+        ]
+        assert all(song["returncode"] == 0 for song in data["songs"])
+        assert set(data["summary"]["phases"]) == {
+            "discovery",
+            "patch",
+            "render",
+        }
+        assert data["summary"]["schedule"]["jobs"] == 2
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_watch_renders_each_batch_staged(
+        self, mock_create_pdfs, mock_repo
+    ):
+        """Test that --watch renders just the changed songs, staged."""
+        batches = [["songs/a.chopro"], ["songs/b.cho", "songs/c.cho"]]
+
+        def _changes(target, debounce):
+            yield from batches
+            raise KeyboardInterrupt
+
+        with (
+            patch.object(sys, "argv", ["genpdf", "songs", "--watch"]),
+            patch("genpdf_butler.Watch.watchChanges", side_effect=_changes),
+        ):
+            main()
+
+        mock_repo.assert_not_called()
+        assert [
+            call.kwargs["songs"] for call in mock_create_pdfs.call_args_list
+        ] == batches
+        assert all(
+            call.kwargs["staged"] and "patched" not in call.kwargs
+            for call in mock_create_pdfs.call_args_list
+        )
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_no_git_skips_repository_discovery(
+        self, mock_create_pdfs, mock_repo
+    ):
+        """Test that --no-git renders staged copies without a repo."""
+        with patch.object(sys, "argv", ["genpdf", "songs", "--no-git"]):
+            main()
+
+        mock_repo.assert_not_called()
+        assert mock_create_pdfs.call_args.kwargs["staged"] is True
+        assert "patched" not in mock_create_pdfs.call_args.kwargs
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_missing_chordpro_fails_before_any_work(
+        self, mock_create_pdfs, mock_repo, caplog
+    ):
+        """Test that no song is touched when chordpro cannot run."""
+        with (
+            patch(
+                "genpdf_butler.GenPDF.probeChordpro",
+                side_effect=FileNotFoundError("chordpro not found on PATH"),
+            ),
+            patch.object(sys, "argv", ["genpdf", "songs"]),
+            pytest.raises(SystemExit) as exit_info,
+        ):
+            main()
+
+        assert exit_info.value.code == 1
+        assert "Cannot run chordpro: chordpro not found on PATH" in (
+            caplog.messages
+        )
+        mock_repo.assert_not_called()
+        mock_create_pdfs.assert_not_called()
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_cache_defaults_to_xdg_dir(
+        self, mock_create_pdfs, mock_repo, monkeypatch
+    ):
+        """Test that a bare --cache uses the per-user cache directory."""
+        monkeypatch.setenv("XDG_CACHE_HOME", "/var/cache/test")
+        mock_repo.return_value = _mock_repo()
+        argv = ["genpdf", "songs", "--cache", "--cache-size", "5"]
+        with patch.object(sys, "argv", argv):
+            main()
+
+        kwargs = mock_create_pdfs.call_args.kwargs
+        assert kwargs["cache"] == "/var/cache/test/genpdf_butler"
+        assert kwargs["cacheSize"] == 5 << 20
+
+    @patch("git.Repo")
+    @patch("genpdf_butler.GenPDF.createPDFs")
+    def test_cache_is_off_by_default(self, mock_create_pdfs, mock_repo):
+        """Test that nothing is cached unless --cache is given."""
+        mock_repo.return_value = _mock_repo()
+        with patch.object(sys, "argv", ["genpdf", "songs"]):
+            main()
+
+        assert mock_create_pdfs.call_args.kwargs["cache"] is None
+
+
+class TestStartup:
+    """Test cases for keeping the entry point cheap to start."""
+
+    def _loaded_modules(self, *argv):
+        """Run main in a fresh interpreter and list the modules it loaded."""
+        script = (
+            "import sys\n"
+            "from genpdf_butler.__main__ import main\n"
+            f"sys.argv = {['genpdf', *argv]!r}\n"
+            "try:\n"
+            "    main()\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            "print(' '.join(sorted(sys.modules)), file=sys.stderr)\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return set(result.stderr.split("\n")[-2].split())
+
+    def test_help_imports_nothing_heavy(self):
+        """Test that --help loads neither GitPython nor the pipeline."""
+        modules = self._loaded_modules("--help")
+        assert "git" not in modules
+        assert "genpdf_butler.GenPDF" not in modules
+        assert "concurrent.futures" not in modules
+
+    def test_no_git_run_never_imports_gitpython(self, temp_dir):
+        """Test that a --no-git render does not load GitPython."""
+        modules = self._loaded_modules(str(temp_dir), "--no-git")
+        assert "genpdf_butler.GenPDF" in modules
+        assert "git" not in modules
+        # pikepdf is only loaded for --optimize
+        assert "genpdf_butler.Optimize" not in modules
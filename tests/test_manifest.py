@@ -0,0 +1,187 @@
+"""Tests for Manifest module."""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from genpdf_butler import Manifest
+
+
+class TestManifest:
+    """Test cases for the build manifest helpers."""
+
+    def test_manifest_path_for_directory(self, temp_dir):
+        """Test that a directory target keeps its manifest inside it."""
+        assert Manifest.manifestPath(str(temp_dir)) == str(
+            temp_dir / Manifest.MANIFEST_NAME
+        )
+
+    def test_manifest_path_for_single_file(self, temp_dir):
+        """Test that a single song keeps its manifest beside it."""
+        song = temp_dir / "song.chopro"
+        song.touch()
+        assert Manifest.manifestPath(str(song)) == str(
+            temp_dir / Manifest.MANIFEST_NAME
+        )
+
+    def test_load_missing_manifest(self, temp_dir):
+        """Test that a missing manifest loads as empty."""
+        assert Manifest.loadManifest(str(temp_dir / "missing.json")) == {
+            "songs": {},
+            "timings": {},
+        }
+
+    def test_load_corrupt_manifest(self, temp_dir):
+        """Test that an unreadable manifest is treated as empty."""
+        path = temp_dir / Manifest.MANIFEST_NAME
+        path.write_text("{not json", encoding="utf-8")
+        assert Manifest.loadManifest(str(path)) == {
+            "songs": {},
+            "timings": {},
+        }
+
+    def test_save_and_load_round_trip(self, temp_dir):
+        """Test that a saved manifest loads back unchanged."""
+        path = str(temp_dir / Manifest.MANIFEST_NAME)
+        manifest = {
+            "songs": {"a.chopro": {"source": "x"}},
+            "timings": {"a.chopro": 1.5},
+        }
+        Manifest.saveManifest(path, manifest)
+
+        assert Manifest.loadManifest(path) == manifest
+        assert (
+            json.loads(
+                (temp_dir / Manifest.MANIFEST_NAME).read_text(encoding="utf-8")
+            )
+            == manifest
+        )
+        assert os.listdir(temp_dir) == [Manifest.MANIFEST_NAME]
+
+    def test_concurrent_saves_do_not_collide(self, temp_dir):
+        """Test that writers of one manifest never share a temporary file."""
+        path = str(temp_dir / Manifest.MANIFEST_NAME)
+        manifests = [
+            {"songs": {}, "timings": {f"{i}.chopro": float(i)}}
+            for i in range(20)
+        ]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(
+                pool.map(
+                    lambda manifest: Manifest.saveManifest(path, manifest),
+                    manifests,
+                )
+            )
+
+        assert Manifest.loadManifest(path) in manifests
+        assert os.listdir(temp_dir) == [Manifest.MANIFEST_NAME]
+
+    def test_shard_manifest_path(self, temp_dir):
+        """Test that each shard gets its own manifest beside the shared one."""
+        first = Manifest.shardManifestPath(str(temp_dir), 1, 3)
+        second = Manifest.shardManifestPath(str(temp_dir), 2, 3)
+
+        assert first != second
+        assert os.path.dirname(first) == str(temp_dir)
+        assert os.path.basename(first).startswith(".genpdf-manifest")
+        assert first.endswith(".json")
+
+    def test_song_key_is_relative_posix_path(self, temp_dir):
+        """Test that songs are keyed relative to the manifest directory."""
+        manifestFile = str(temp_dir / Manifest.MANIFEST_NAME)
+        song = temp_dir / "folk" / "song.chopro"
+        assert Manifest.songKey(song, manifestFile) == "folk/song.chopro"
+
+    def test_fingerprint_tracks_every_input(self, temp_dir):
+        """Test that source, settings and version all change the print."""
+        song = temp_dir / "song.chopro"
+        song.write_text("{title: A}\n", encoding="utf-8")
+        settings = ["chordpro", "--define=pdf:papersize=a4"]
+
+        base = Manifest.fingerprint([song], settings, "6.0")
+        assert base == Manifest.fingerprint([song], list(settings), "6.0")
+        assert base != Manifest.fingerprint([song], settings, "6.1")
+        assert base != Manifest.fingerprint(
+            [song], ["chordpro", "--define=pdf:papersize=a6"], "6.0"
+        )
+
+        song.write_text("{title: B}\n", encoding="utf-8")
+        assert base != Manifest.fingerprint([song], settings, "6.0")
+
+    def test_songbook_fingerprint_depends_on_every_song(self, temp_dir):
+        """Test that a songbook hash covers each song and their order."""
+        a = temp_dir / "a.chopro"
+        b = temp_dir / "b.chopro"
+        a.write_text("A\n", encoding="utf-8")
+        b.write_text("B\n", encoding="utf-8")
+
+        book = Manifest.sourcesHash([a, b])
+        assert Manifest.sourcesHash([a]) == Manifest.sourceHash(a)
+        assert book != Manifest.sourcesHash([b, a])
+
+        b.write_text("B changed\n", encoding="utf-8")
+        assert book != Manifest.sourcesHash([a, b])
+
+    def test_prune_keeps_variants_of_existing_songs(self, temp_dir):
+        """Test that variant entries live and die with their song."""
+        (temp_dir / "a.chopro").write_text("A\n", encoding="utf-8")
+        manifestFile = Manifest.manifestPath(str(temp_dir))
+        manifest = {
+            "songs": {
+                "a.chopro": {},
+                Manifest.variantKey("a.chopro", "a4-diagrams"): {},
+                Manifest.variantKey("gone.chopro", "a4"): {},
+                "gone.chopro": {},
+            }
+        }
+
+        Manifest.pruneMissing(manifest, manifestFile)
+
+        assert sorted(manifest["songs"]) == [
+            "a.chopro",
+            "a.chopro#a4-diagrams",
+        ]
+
+    def test_build_commit_round_trip(self, temp_dir):
+        """Test that the last build is only trusted for the same settings."""
+        manifestFile = Manifest.manifestPath(str(temp_dir))
+        manifest = Manifest.loadManifest(manifestFile)
+        assert Manifest.lastBuild(manifest, "s") is None
+
+        Manifest.recordBuild(manifestFile, "abc123", "s")
+        manifest = Manifest.loadManifest(manifestFile)
+        assert Manifest.lastBuild(manifest, "s") == "abc123"
+        assert Manifest.lastBuild(manifest, "other") is None
+
+    def test_unit_costs_sum_variants(self):
+        """Test that recorded timings add up per song across variants."""
+        manifest = {
+            "timings": {
+                "a.chopro": 1.0,
+                "b.chopro#a4": 2.0,
+                "b.chopro#letter": 0.5,
+            }
+        }
+        assert Manifest.unitCosts(manifest) == {
+            "a.chopro": 1.0,
+            "b.chopro": 2.5,
+        }
+
+    def test_merge_manifests(self):
+        """Test that shard manifests combine and agree on the build."""
+        build = {"commit": "abc", "settings": "def"}
+        shards = [
+            {"songs": {"a.chopro": "x"}, "timings": {"a.chopro": 1.0}},
+            {"songs": {"b.chopro": "y"}, "timings": {"b.chopro": 2.0}},
+        ]
+        merged = Manifest.mergeManifests(shards)
+        assert merged["songs"] == {"a.chopro": "x", "b.chopro": "y"}
+        assert merged["timings"] == {"a.chopro": 1.0, "b.chopro": 2.0}
+        assert "build" not in merged
+
+        for shard in shards:
+            shard["build"] = dict(build)
+        assert Manifest.mergeManifests(shards)["build"] == build
+        shards[1]["build"]["commit"] = "other"
+        assert "build" not in Manifest.mergeManifests(shards)
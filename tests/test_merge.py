@@ -0,0 +1,50 @@
+"""Tests for Merge module."""
+
+import json
+
+import pytest
+
+from genpdf_butler import Manifest, Merge, Report
+
+
+class TestMerge:
+    """Test cases for the genpdf-merge command."""
+
+    def test_merges_manifests_and_reports(self, temp_dir):
+        """Test that shard outputs combine into one manifest and report."""
+        for n, song in enumerate(("a.chopro", "b.chopro"), start=1):
+            Manifest.saveManifest(
+                str(temp_dir / f"m{n}.json"),
+                {"songs": {song: "fp"}, "timings": {song: 1.0}},
+            )
+            report = Report.newReport()
+            Report.recordSong(report, song, temp_dir / "x.pdf", 1.0, 0)
+            Report.writeReport(report, str(temp_dir / f"r{n}.jsonl"))
+
+        Merge.main(
+            [
+                "--manifests",
+                str(temp_dir / "m1.json"),
+                str(temp_dir / "m2.json"),
+                "--manifest-out",
+                str(temp_dir / "m.json"),
+                "--reports",
+                str(temp_dir / "r1.jsonl"),
+                str(temp_dir / "r2.jsonl"),
+                "--report-out",
+                str(temp_dir / "r.json"),
+            ]
+        )
+
+        manifest = Manifest.loadManifest(str(temp_dir / "m.json"))
+        assert sorted(manifest["songs"]) == ["a.chopro", "b.chopro"]
+        merged = json.loads((temp_dir / "r.json").read_text("utf-8"))
+        assert merged["summary"]["songs"] == 2
+        assert merged["summary"]["shards"] == 2
+
+    def test_inputs_need_an_output(self, temp_dir):
+        """Test that merging without somewhere to write is rejected."""
+        with pytest.raises(SystemExit):
+            Merge.main(["--manifests", str(temp_dir / "m1.json")])
+        with pytest.raises(SystemExit):
+            Merge.main([])
@@ -0,0 +1,89 @@
+"""Tests for Optimize module."""
+
+import pytest
+
+from genpdf_butler import Optimize
+
+pikepdf = pytest.importorskip("pikepdf")
+
+
+def _bloated_pdf(path):
+    """Write an uncompressed PDF with a font embedded once per page."""
+    pdf = pikepdf.new()
+    for n in range(3):
+        fontFile = pikepdf.Stream(pdf, b"glyphs " * 2000)
+        descriptor = pdf.make_indirect(
+            pikepdf.Dictionary(
+                Type=pikepdf.Name.FontDescriptor,
+                FontName=pikepdf.Name("/Helvetica"),
+                Flags=32,
+                FontFile2=fontFile,
+            )
+        )
+        font = pdf.make_indirect(
+            pikepdf.Dictionary(
+                Type=pikepdf.Name.Font,
+                Subtype=pikepdf.Name.TrueType,
+                BaseFont=pikepdf.Name("/Helvetica"),
+                FontDescriptor=descriptor,
+            )
+        )
+        unused = pdf.make_indirect(pikepdf.Stream(pdf, b"unused " * 500))
+        page = pikepdf.Dictionary(
+            Type=pikepdf.Name.Page,
+            MediaBox=[0, 0, 612, 792],
+            Contents=pikepdf.Stream(
+                pdf, b"BT /F1 12 Tf 72 720 Td (Verse %d) Tj ET" % n
+            ),
+            Resources=pikepdf.Dictionary(
+                Font=pikepdf.Dictionary(F1=font),
+                XObject=pikepdf.Dictionary(Unused=unused),
+            ),
+        )
+        pdf.pages.append(pikepdf.Page(page))
+    pdf.save(path, compress_streams=False)
+
+
+class TestOptimize:
+    """Test cases for shrinking rendered PDFs."""
+
+    def test_shrinks_and_shares_fonts(self, temp_dir):
+        """Test that duplicate fonts and unused resources are dropped."""
+        path = temp_dir / "song.pdf"
+        _bloated_pdf(str(path))
+
+        before, after = Optimize.optimizePDF(str(path))
+
+        assert after < before
+        assert path.stat().st_size == after
+        with pikepdf.open(path) as pdf:
+            fonts = {page.Resources.Font.F1.objgen for page in pdf.pages}
+            assert len(fonts) == 1
+            for page in pdf.pages:
+                assert "/Unused" not in page.Resources.get("/XObject", {})
+
+    def test_identical_input_gives_identical_output(self, temp_dir):
+        """Test that optimizing is deterministic, for incremental builds."""
+        first = temp_dir / "first.pdf"
+        second = temp_dir / "second.pdf"
+        _bloated_pdf(str(first))
+        second.write_bytes(first.read_bytes())
+
+        Optimize.optimizePDF(str(first))
+        Optimize.optimizePDF(str(second))
+
+        assert first.read_bytes() == second.read_bytes()
+
+    def test_unreadable_pdf_is_left_alone(self, temp_dir, caplog):
+        """Test that a PDF pikepdf cannot read is kept as rendered."""
+        path = temp_dir / "song.pdf"
+        path.write_bytes(b"not a pdf")
+
+        assert Optimize.optimizePDF(str(path)) == (9, 9)
+        assert path.read_bytes() == b"not a pdf"
+        assert not [p for p in temp_dir.iterdir() if p.suffix == ".tmp"]
+        assert "Could not optimize" in caplog.text
+
+    def test_missing_pdf(self, temp_dir):
+        """Test that a render that wrote nothing is not an error."""
+        assert Optimize.optimizePDF(str(temp_dir / "missing.pdf")) is None
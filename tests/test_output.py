@@ -0,0 +1,77 @@
+"""Tests for Output module."""
+
+import os
+import re
+
+from benchmarks.fake_chordpro import pdfBytes
+from genpdf_butler import Output
+
+
+class TestOutput:
+    """Test cases for publishing rendered PDFs."""
+
+    def test_temp_path_is_hidden_beside_the_output(self, temp_dir):
+        """Test that the temporary file can be renamed over the output."""
+        tmp = Output.tempPath(str(temp_dir / "song.pdf"))
+        assert os.path.dirname(tmp) == str(temp_dir)
+        assert os.path.basename(tmp).startswith(".")
+        assert tmp.endswith(".pdf")
+
+    def test_timestamps_and_id_are_ignored(self, temp_dir):
+        """Test that two renders of the same song compare equal."""
+        first, second = temp_dir / "first.pdf", temp_dir / "second.pdf"
+        first.write_bytes(pdfBytes(["song.chopro"]))
+        # Rendered at another time, and with another random /ID
+        second.write_bytes(
+            re.sub(
+                rb"\(D:\d+\)", b"(D:19990101000000)", pdfBytes(["song.chopro"])
+            )
+        )
+        assert first.read_bytes() != second.read_bytes()
+        assert Output.samePDF(first, second)
+
+    def test_content_changes_are_not_ignored(self, temp_dir):
+        """Test that a different song is a different PDF."""
+        first, second = temp_dir / "first.pdf", temp_dir / "second.pdf"
+        first.write_bytes(pdfBytes(["song.chopro 1"]))
+        second.write_bytes(pdfBytes(["song.chopro 2"]))
+        assert not Output.samePDF(first, second)
+        assert not Output.samePDF(first, temp_dir / "missing.pdf")
+
+    def test_unchanged_output_is_left_alone(self, temp_dir):
+        """Test that an identical render keeps the output's inode and mtime."""
+        output = temp_dir / "song.pdf"
+        output.write_bytes(pdfBytes(["song.chopro"]))
+        os.utime(output, (1_000_000_000, 1_000_000_000))
+        inode = output.stat().st_ino
+        tmp = Output.tempPath(str(output))
+        with open(tmp, mode="wb") as f:
+            f.write(pdfBytes(["song.chopro"]))
+
+        assert Output.publish(tmp, str(output)) is False
+
+        assert not os.path.exists(tmp)
+        assert output.stat().st_ino == inode
+        assert output.stat().st_mtime == 1_000_000_000
+
+    def test_changed_output_is_replaced(self, temp_dir):
+        """Test that a different render is renamed over the output."""
+        output = temp_dir / "song.pdf"
+        output.write_bytes(pdfBytes(["old"]))
+        tmp = Output.tempPath(str(output))
+        with open(tmp, mode="wb") as f:
+            f.write(pdfBytes(["new"]))
+
+        assert Output.publish(tmp, str(output)) is True
+
+        assert not os.path.exists(tmp)
+        assert b"(new)" in output.read_bytes()
+
+    def test_nothing_rendered(self, temp_dir):
+        """Test that a missing temporary file leaves the output alone."""
+        output = temp_dir / "song.pdf"
+        output.write_bytes(b"%PDF-1.4")
+        tmp = Output.tempPath(str(output))
+
+        assert Output.publish(tmp, str(output)) is None
+        assert output.read_bytes() == b"%PDF-1.4"
@@ -1,9 +1,18 @@
 """Tests for PatchTextColor module."""
 
+import io
 import tempfile
 from pathlib import Path
 
-from genpdf_butler.PatchTextColor import PatchColors
+import pytest
+
+from genpdf_butler.PatchTextColor import (
+    PatchColors,
+    patchFile,
+    patchLines,
+    patchStream,
+    stageSong,
+)
 
 
 class TestPatchColors:
@@ -63,3 +72,130 @@ class TestPatchColors:
 
         finally:
             Path(tmp_file_path).unlink()
+
+    def test_returns_only_changed_files(self):
+        """Test that songs without color markup are neither written nor
+        reported as patched."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            plain = Path(temp_dir) / "plain.chopro"
+            blue = Path(temp_dir) / "blue.cho"
+            plain.write_text("no color\n", encoding="utf-8")
+            blue.write_text("&blue: color\n", encoding="utf-8")
+            before = plain.stat().st_mtime_ns
+
+            assert PatchColors(temp_dir) == [blue]
+            assert plain.stat().st_mtime_ns == before
+
+
+class TestPatchLines:
+    """Test cases for the line-level color translation."""
+
+    def test_blue_section_is_wrapped(self):
+        """Test that a run of &blue lines becomes one textcolour block."""
+        lines = ["plain\n", "&blue: one\n", "&blue two\n", "plain again\n"]
+        assert list(patchLines(lines)) == [
+            "plain\n",
+            "{textcolour: blue}\n",
+            "one\n",
+            "two\n",
+            "{textcolour}\n",
+            "plain again\n",
+        ]
+
+    def test_trailing_blue_section_is_closed(self):
+        """Test that a file ending in color still resets the color."""
+        assert list(patchLines(["&blue: end\n"])) == [
+            "{textcolour: blue}\n",
+            "end\n",
+            "{textcolour}\n",
+        ]
+
+    def test_other_colors(self):
+        """Test that every OnSong color gets its own directive."""
+        lines = ["&red: stop\n", "&green go\n", "&green: go on\n", "x\n"]
+        assert list(patchLines(lines)) == [
+            "{textcolour: red}\n",
+            "stop\n",
+            "{textcolour: green}\n",
+            "go\n",
+            "go on\n",
+            "{textcolour}\n",
+            "x\n",
+        ]
+
+    def test_plain_ampersands_are_left_alone(self):
+        """Test that text which is not color markup passes through."""
+        lines = ["Rhythm & Blues\n", "R&B and &amp;\n"]
+        assert list(patchLines(lines)) == lines
+
+    def test_capitalised_words_are_not_colors(self):
+        """Test that only the lowercase OnSong tags are color markup."""
+        lines = ["{title: Rhythm&Blues}\n", "Tom&Gray fell\n", "&Brown\n"]
+        assert list(patchLines(lines)) == lines
+
+    def test_patch_stream_reports_changes(self):
+        """Test that patchStream says whether it changed anything."""
+        plain = io.StringIO()
+        assert patchStream(["a\n", "b\n"], plain) is False
+        assert plain.getvalue() == "a\nb\n"
+
+        colored = io.StringIO()
+        assert patchStream(["&blue a\n"], colored) is True
+        assert colored.getvalue() == "{textcolour: blue}\na\n{textcolour}\n"
+
+
+class TestPatchFile:
+    """Test cases for patching a song in place."""
+
+    def test_rewrites_changed_song(self, temp_dir):
+        """Test that the song is replaced and no temporary file is left."""
+        song = temp_dir / "song.chopro"
+        song.write_text("&blue: hi\n", encoding="utf-8")
+        song.chmod(0o640)
+
+        assert patchFile(song) is True
+        assert song.read_text(encoding="utf-8") == (
+            "{textcolour: blue}\nhi\n{textcolour}\n"
+        )
+        assert song.stat().st_mode & 0o777 == 0o640
+        assert sorted(temp_dir.iterdir()) == [song]
+
+    def test_leaves_unchanged_song_alone(self, temp_dir):
+        """Test that a song without markup is not rewritten."""
+        song = temp_dir / "song.chopro"
+        song.write_text("plain\n", encoding="utf-8")
+        inode = song.stat().st_ino
+
+        assert patchFile(song) is False
+        assert song.stat().st_ino == inode
+        assert sorted(temp_dir.iterdir()) == [song]
+
+    def test_undecodable_song_is_untouched(self, temp_dir):
+        """Test that a failure leaves the song and no temporary file."""
+        song = temp_dir / "song.chopro"
+        song.write_bytes(b"&blue \xff\xfe\n")
+
+        with pytest.raises(UnicodeDecodeError):
+            patchFile(song)
+        assert song.read_bytes() == b"&blue \xff\xfe\n"
+        assert sorted(temp_dir.iterdir()) == [song]
+
+
+class TestStageSong:
+    """Test cases for writing patched copies to a staging area."""
+
+    def test_stage_song_mirrors_path_and_keeps_source(self, temp_dir):
+        """Test that the staged copy is patched and the source is not."""
+        root = temp_dir / "songs"
+        stage = temp_dir / "stage"
+        song = root / "folk" / "song.chopro"
+        song.parent.mkdir(parents=True)
+        song.write_text("&blue: hi\n", encoding="utf-8")
+
+        staged = stageSong(song, stage, root)
+
+        assert staged == stage / "folk" / "song.chopro"
+        assert staged.read_text(encoding="utf-8") == (
+            "{textcolour: blue}\nhi\n{textcolour}\n"
+        )
+        assert song.read_text(encoding="utf-8") == "&blue: hi\n"
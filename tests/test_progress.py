@@ -0,0 +1,69 @@
+"""Tests for Progress module."""
+
+import io
+import logging
+
+from genpdf_butler import Progress
+
+
+class _Terminal(io.StringIO):
+    """A stream that claims to be a terminal."""
+
+    def isatty(self):
+        """Report a TTY."""
+        return True
+
+
+class TestProgress:
+    """Test cases for the rate-limited progress display."""
+
+    def test_describe_before_and_after_discovery(self):
+        """Test that an ETA appears once the total is known."""
+        progress = Progress.newProgress(io.StringIO())
+        Progress.planned(progress, 10)
+        for failed in (False, True, False, False):
+            Progress.advance(progress, failed=failed)
+        Progress.advance(progress, cached=True)
+
+        now = progress["started"] + 2.5
+        assert Progress.describe(progress, now) == (
+            "5 songs, 1 failed, 1 cached, 2.0/s"
+        )
+        Progress.planComplete(progress)
+        assert Progress.describe(progress, now) == (
+            "5/10 songs, 1 failed, 1 cached, 2.0/s, ETA 3s"
+        )
+
+    def test_terminal_redraws_one_line(self, monkeypatch):
+        """Test that a TTY gets a single line rewritten in place."""
+        stream = _Terminal()
+        monkeypatch.setattr(Progress, "TTY_INTERVAL", 0)
+        progress = Progress.newProgress(stream)
+        for _ in range(3):
+            Progress.advance(progress)
+        Progress.finish(progress)
+
+        output = stream.getvalue()
+        assert output.count("\r\x1b[K") == 4
+        assert output.count("\n") == 1
+        assert output.endswith("\n")
+
+    def test_log_output_is_rate_limited(self, caplog):
+        """Test that CI logs get a line per interval, not per song."""
+        caplog.set_level(logging.INFO, logger="genpdf_butler")
+        progress = Progress.newProgress(io.StringIO())
+        Progress.planned(progress, 1000)
+        Progress.planComplete(progress)
+        for _ in range(1000):
+            Progress.advance(progress)
+        Progress.finish(progress)
+
+        assert len(caplog.messages) == 1
+        assert caplog.messages[0].startswith("1000/1000 songs")
+
+    def test_disabled_progress_is_a_no_op(self):
+        """Test that None (e.g. --quiet) is accepted everywhere."""
+        Progress.planned(None)
+        Progress.advance(None, failed=True)
+        Progress.planComplete(None)
+        Progress.finish(None)
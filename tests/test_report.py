@@ -0,0 +1,194 @@
+"""Tests for Report module."""
+
+import json
+import time
+
+from genpdf_butler import Report
+
+
+def _sample_report(temp_dir):
+    """Build a report with one rendered, one failed and one cached song."""
+    report = Report.newReport()
+    (temp_dir / "a.pdf").write_bytes(b"%PDF-1.4 a")
+    Report.recordSong(report, "a.chopro", temp_dir / "a.pdf", 0.5, 0)
+    Report.recordSong(
+        report, "b.chopro", temp_dir / "b.pdf", 0.25, 1, "x" * 1000
+    )
+    Report.recordSong(report, "c.chopro", temp_dir / "c.pdf", 0, cache="hit")
+    report["phases"]["render"] = 0.75
+    return report
+
+
+class TestReport:
+    """Test cases for the run report."""
+
+    def test_phase_accumulates_time(self):
+        """Test that repeated phases add up."""
+        report = Report.newReport()
+        with Report.phase(report, "patch"):
+            pass
+        with Report.phase(report, "patch"):
+            pass
+        assert list(report["phases"]) == ["patch"]
+        assert report["phases"]["patch"] >= 0
+
+    def test_nested_phases_are_not_counted_twice(self):
+        """Test that a phase is charged only the time outside its nested ones."""
+        report = Report.newReport()
+        with Report.phase(report, "render"):
+            time.sleep(0.02)
+            with Report.phase(report, "patch"):
+                time.sleep(0.05)
+
+        assert 0.05 <= report["phases"]["patch"] < 0.1
+        assert 0.02 <= report["phases"]["render"] < 0.05
+
+    def test_phase_without_report(self):
+        """Test that phases and records are no-ops without a report."""
+        with Report.phase(None, "render"):
+            pass
+        Report.recordSong(None, "a.chopro", "a.pdf", 1.0)
+
+    def test_song_records(self, temp_dir):
+        """Test the fields recorded for each song."""
+        songs = _sample_report(temp_dir)["songs"]
+
+        assert songs[0] == {
+            "song": "a.chopro",
+            "output": str(temp_dir / "a.pdf"),
+            "seconds": 0.5,
+            "returncode": 0,
+            "stderr": "",
+            "size": 10,
+            "sizeBefore": None,
+            "cache": "miss",
+            "replaced": None,
+        }
+        assert songs[1]["size"] is None
+        assert len(songs[1]["stderr"]) == Report.STDERR_EXCERPT
+        assert songs[2]["cache"] == "hit"
+
+    def test_summary_totals(self, temp_dir):
+        """Test the per-run totals."""
+        summary = Report.summary(_sample_report(temp_dir))
+
+        assert summary["songs"] == 3
+        assert summary["rendered"] == 2
+        assert summary["cached"] == 1
+        assert summary["failed"] == 1
+        assert summary["phases"] == {"render": 0.75}
+        assert summary["renderedPerSecond"] == round(2 / 0.75, 3)
+
+    def test_write_json(self, temp_dir):
+        """Test writing a single JSON document."""
+        path = temp_dir / "report.json"
+        Report.writeReport(_sample_report(temp_dir), str(path))
+
+        data = json.loads(path.read_text(encoding="utf-8"))
+        assert data["summary"]["songs"] == 3
+        assert [song["song"] for song in data["songs"]] == [
+            "a.chopro",
+            "b.chopro",
+            "c.chopro",
+        ]
+
+    def test_write_jsonl(self, temp_dir):
+        """Test writing one line per song plus a summary line."""
+        path = temp_dir / "report.jsonl"
+        Report.writeReport(_sample_report(temp_dir), str(path))
+
+        lines = [
+            json.loads(line)
+            for line in path.read_text(encoding="utf-8").splitlines()
+        ]
+        assert [line["type"] for line in lines] == [
+            "song",
+            "song",
+            "song",
+            "summary",
+        ]
+        assert lines[-1]["failed"] == 1
+
+    def test_timed_charges_producer_time_to_its_phase(self):
+        """Test that a lazy producer's work is attributed between items."""
+        report = Report.newReport()
+
+        def _produce():
+            for n in range(3):
+                time.sleep(0.01)
+                yield n
+
+        items = []
+        for item in Report.timed(report, "discovery", _produce()):
+            time.sleep(0.05)
+            items.append(item)
+
+        assert items == [0, 1, 2]
+        assert 0.03 <= report["phases"]["discovery"] < 0.15
+        assert Report.timed(None, "discovery", items) is items
+
+    def test_read_report_round_trip(self, temp_dir):
+        """Test that both formats read back as written."""
+        report = _sample_report(temp_dir)
+        for name in ("report.json", "report.jsonl"):
+            path = str(temp_dir / name)
+            Report.writeReport(report, path)
+            summary, songs = Report.readReport(path)
+            assert songs == report["songs"]
+            assert summary["songs"] == 3
+
+    def test_merge_reports(self, temp_dir):
+        """Test that shard reports add up, timed by the slowest shard."""
+        first = Report.newReport()
+        Report.recordSong(first, "b.chopro", temp_dir / "b.pdf", 2.0, 0)
+        first["phases"]["render"] = 2.0
+        second = _sample_report(temp_dir)
+        Report.writeReport(first, str(temp_dir / "1.json"))
+        Report.writeReport(second, str(temp_dir / "2.jsonl"))
+
+        summary, songs = Report.mergeReports(
+            [str(temp_dir / "1.json"), str(temp_dir / "2.jsonl")]
+        )
+
+        assert [song["song"] for song in songs] == [
+            "a.chopro",
+            "b.chopro",
+            "b.chopro",
+            "c.chopro",
+        ]
+        assert summary["shards"] == 2
+        assert summary["songs"] == 4
+        assert summary["rendered"] == 3
+        assert summary["cached"] == 1
+        assert summary["failed"] == 1
+        assert summary["phases"] == {"render": 2.75}
+
+    def test_phases_are_traced_on_request(self):
+        """Test that phases become spans only when tracing."""
+        plain = Report.newReport()
+        traced = Report.newReport(trace=True)
+        for report in (plain, traced):
+            with Report.phase(report, "git"):
+                pass
+            Report.recordSpan(
+                report, "a.pdf", "render", time.perf_counter(), 1
+            )
+
+        assert "trace" not in plain
+        assert [span["name"] for span in traced["trace"]] == ["git", "a.pdf"]
+        assert traced["trace"][0]["start"] >= 0
+
+    def test_optimized_sizes(self, temp_dir):
+        """Test that the summary totals sizes before and after optimizing."""
+        report = _sample_report(temp_dir)
+        assert Report.summary(report)["optimized"] is None
+
+        Report.recordSong(
+            report, "d.chopro", temp_dir / "a.pdf", 1.0, 0, sizeBefore=40
+        )
+
+        assert Report.summary(report)["optimized"] == {
+            "songs": 1,
+            "sizeBefore": 40,
+            "size": 10,
+        }
@@ -0,0 +1,153 @@
+"""Tests for Repository module."""
+
+import os
+import tempfile
+
+import pytest
+from git import Repo
+
+from genpdf_butler import Repository
+
+
+@pytest.fixture
+def song_repo(temp_dir):
+    """Create a git repository with committed songs in two folders."""
+    repo = Repo.init(temp_dir)
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "Test")
+        config.set_value("user", "email", "test@example.com")
+    for path in ("folk/a.chopro", "folk/b.cho", "blues/c.chopro", "notes.txt"):
+        song = temp_dir / path
+        song.parent.mkdir(exist_ok=True)
+        song.write_text(f"{path}\n", encoding="utf-8")
+    repo.index.add(["folk/a.chopro", "folk/b.cho", "blues/c.chopro"])
+    repo.index.add(["notes.txt"])
+    repo.index.commit("songs")
+    return repo
+
+
+class TestSongPathspecs:
+    """Test cases for limiting git to the render target."""
+
+    def test_directory_target(self, song_repo, temp_dir):
+        """Test that a folder expands to song globs below it."""
+        assert Repository.songPathspecs(song_repo, str(temp_dir / "folk")) == [
+            ":(glob,icase)folk/**/*.chopro",
+            ":(glob,icase)folk/**/*.cho",
+        ]
+
+    def test_repository_root_target(self, song_repo, temp_dir):
+        """Test that the repo root expands to repo-wide song globs."""
+        assert Repository.songPathspecs(song_repo, str(temp_dir)) == [
+            ":(glob,icase)**/*.chopro",
+            ":(glob,icase)**/*.cho",
+        ]
+
+    def test_single_file_target(self, song_repo, temp_dir):
+        """Test that a single song is matched literally."""
+        target = str(temp_dir / "folk" / "a.chopro")
+        assert Repository.songPathspecs(song_repo, target) == [
+            ":(literal)folk/a.chopro"
+        ]
+
+    def test_target_through_a_symlink(self, song_repo, temp_dir):
+        """Test that a target reached through a link maps into the repo."""
+        with tempfile.TemporaryDirectory() as other:
+            link = os.path.join(other, "link")
+            os.symlink(temp_dir, link)
+            target = os.path.join(link, "folk")
+
+            pathspecs = Repository.songPathspecs(song_repo, target)
+            assert pathspecs == [
+                ":(glob,icase)folk/**/*.chopro",
+                ":(glob,icase)folk/**/*.cho",
+            ]
+            assert Repository.dirtySongs(song_repo, pathspecs) == ([], [])
+
+
+class TestDirtySongs:
+    """Test cases for the scoped dirty check."""
+
+    def test_clean_repository(self, song_repo, temp_dir):
+        """Test that a clean tree reports nothing."""
+        pathspecs = Repository.songPathspecs(song_repo, str(temp_dir))
+        assert Repository.dirtySongs(song_repo, pathspecs) == ([], [])
+
+    def test_changes_inside_target(self, song_repo, temp_dir):
+        """Test that modified and untracked songs are both reported."""
+        (temp_dir / "folk" / "a.chopro").write_text("x\n", encoding="utf-8")
+        (temp_dir / "folk" / "new.cho").write_text("x\n", encoding="utf-8")
+        (temp_dir / "notes.txt").write_text("x\n", encoding="utf-8")
+
+        pathspecs = Repository.songPathspecs(song_repo, str(temp_dir))
+        assert Repository.dirtySongs(song_repo, pathspecs) == (
+            ["folk/a.chopro"],
+            ["folk/new.cho"],
+        )
+
+    def test_changes_outside_target_are_ignored(self, song_repo, temp_dir):
+        """Test that edits in other folders do not block the build."""
+        (temp_dir / "blues" / "c.chopro").write_text("x\n", encoding="utf-8")
+        (temp_dir / "blues" / "d.cho").write_text("x\n", encoding="utf-8")
+
+        pathspecs = Repository.songPathspecs(song_repo, str(temp_dir / "folk"))
+        assert Repository.dirtySongs(song_repo, pathspecs) == ([], [])
+
+
+class TestRestoreSongs:
+    """Test cases for restoring only the songs that were patched."""
+
+    def test_restores_only_given_paths(self, song_repo, temp_dir):
+        """Test that one git restore puts back exactly the listed songs."""
+        a = temp_dir / "folk" / "a.chopro"
+        c = temp_dir / "blues" / "c.chopro"
+        a.write_text("patched\n", encoding="utf-8")
+        c.write_text("patched\n", encoding="utf-8")
+
+        Repository.restoreSongs(song_repo, [a])
+
+        assert a.read_text(encoding="utf-8") == "folk/a.chopro\n"
+        assert c.read_text(encoding="utf-8") == "patched\n"
+
+    def test_nothing_to_restore(self, song_repo):
+        """Test that an empty list does not run git at all."""
+        Repository.restoreSongs(song_repo, [])
+
+
+class TestChangedSongs:
+    """Test cases for diffing the songs against the last built commit."""
+
+    def test_modified_renamed_and_deleted(
+        self, song_repo, temp_dir, monkeypatch
+    ):
+        """Test that renames count as a removal plus a change."""
+        monkeypatch.chdir(temp_dir)
+        since = Repository.headCommit(song_repo)
+        (temp_dir / "folk" / "a.chopro").write_text("new\n", encoding="utf-8")
+        (temp_dir / "notes.txt").write_text("new\n", encoding="utf-8")
+        song_repo.index.add(["folk/a.chopro", "notes.txt"])
+        song_repo.index.move(["folk/b.cho", "folk/d.cho"])
+        song_repo.index.remove(["blues/c.chopro"], working_tree=True)
+        song_repo.index.commit("edit")
+
+        pathspecs = Repository.songPathspecs(song_repo, str(temp_dir))
+        changed, removed = Repository.changedSongs(song_repo, since, pathspecs)
+
+        assert sorted(map(str, changed)) == ["folk/a.chopro", "folk/d.cho"]
+        assert sorted(map(str, removed)) == ["blues/c.chopro", "folk/b.cho"]
+
+    def test_scoped_to_target(self, song_repo, temp_dir, monkeypatch):
+        """Test that changes outside the target are not reported."""
+        monkeypatch.chdir(temp_dir)
+        since = Repository.headCommit(song_repo)
+        (temp_dir / "blues" / "c.chopro").write_text("x\n", encoding="utf-8")
+        song_repo.index.add(["blues/c.chopro"])
+        song_repo.index.commit("edit")
+
+        pathspecs = Repository.songPathspecs(song_repo, str(temp_dir / "folk"))
+        assert Repository.changedSongs(song_repo, since, pathspecs) == ([], [])
+
+    def test_unknown_commit(self, song_repo, temp_dir):
+        """Test that a commit git no longer has means a full build."""
+        pathspecs = Repository.songPathspecs(song_repo, str(temp_dir))
+        assert Repository.changedSongs(song_repo, "0" * 40, pathspecs) is None
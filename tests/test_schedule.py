@@ -0,0 +1,39 @@
+"""Tests for Schedule module."""
+
+from genpdf_butler import Schedule
+
+
+def _render(key, size):
+    """A planned render as the scheduler sees it."""
+    return {"key": key, "size": size}
+
+
+class TestSchedule:
+    """Test cases for longest-expected-render-first scheduling."""
+
+    def test_new_songs_are_estimated_from_their_size(self):
+        """Test that known seconds per byte price songs without timings."""
+        renders = [_render("a", 1000), _render("b", 3000), _render("c", 500)]
+        timings = {"a": 2.0, "gone": 100.0}
+        assert Schedule.expectedCosts(renders, timings) == [2.0, 6.0, 1.0]
+
+    def test_without_known_songs_size_decides(self):
+        """Test that size alone orders a plan with no recorded timings."""
+        renders = [_render("a", 10), _render("b", 30), _render("c", 20)]
+        ordered = Schedule.longestFirst(renders, {"gone": 1.0})
+        assert [r["key"] for r in ordered] == ["b", "c", "a"]
+
+    def test_longest_first_keeps_discovery_order_on_ties(self):
+        """Test that the order is stable for equal expected costs."""
+        renders = [_render(key, 100) for key in "abd"]
+        renders.insert(2, _render("c", 50))
+        timings = {"c": 5.0}
+        ordered = Schedule.longestFirst(renders, timings)
+        assert [r["key"] for r in ordered] == ["a", "b", "d", "c"]
+
+    def test_makespan(self):
+        """Test list scheduling of durations onto workers."""
+        assert Schedule.makespan([1, 1, 1, 1, 4], 2) == 6
+        assert Schedule.makespan([4, 1, 1, 1, 1], 2) == 4
+        assert Schedule.makespan([], 3) == 0
+        assert Schedule.makespan([2, 3], 1) == 5
@@ -0,0 +1,90 @@
+"""Tests for Shard module."""
+
+import pytest
+
+from genpdf_butler import Manifest, Shard
+
+
+class TestShard:
+    """Test cases for splitting the songs between build nodes."""
+
+    def test_parse_shard(self):
+        """Test that i/N is 1-based and validated."""
+        assert Shard.parseShard("2/4") == (2, 4)
+        for text in ("0/4", "5/4", "1/0", "2", "a/b", "1/2/3"):
+            with pytest.raises(ValueError):
+                Shard.parseShard(text)
+
+    def test_without_costs_file_count_is_balanced(self):
+        """Test that unknown costs deal units out evenly."""
+        units = [f"song{n:02}.chopro" for n in range(10)]
+        assignment = Shard.assignUnits(units, 3)
+        counts = [list(assignment.values()).count(i) for i in (1, 2, 3)]
+        assert sorted(counts) == [3, 3, 4]
+
+    def test_costs_balance_the_load(self):
+        """Test that one slow song is balanced against many quick ones."""
+        costs = {"slow.chopro": 10.0}
+        costs.update({f"quick{n}.chopro": 2.0 for n in range(5)})
+        assignment = Shard.assignUnits(list(costs), 2, costs)
+        assert [unit for unit, shard in assignment.items() if shard == 1] == [
+            "slow.chopro"
+        ]
+
+    def test_assignment_is_deterministic(self):
+        """Test that the order units are listed in does not matter."""
+        units = [f"song{n}.chopro" for n in range(7)]
+        costs = {"song3.chopro": 4.0, "song5.chopro": 1.5}
+        assert Shard.assignUnits(units, 3, costs) == Shard.assignUnits(
+            list(reversed(units)), 3, costs
+        )
+
+    def test_every_song_in_exactly_one_shard(self):
+        """Test that the shards partition the songs, keeping their order."""
+        songs = [f"song{n}.chopro" for n in range(11)]
+        shards = [
+            Shard.shardSongs(songs, i, 4, lambda song: song)
+            for i in range(1, 5)
+        ]
+        assert sorted(sum(shards, [])) == sorted(songs)
+        for shard in shards:
+            assert shard == [song for song in songs if song in shard]
+
+    def test_songbook_folders_are_not_split(self, temp_dir):
+        """Test that a folder's songs stay together for its songbook."""
+        songs = [
+            str(temp_dir / folder / f"{n}.chopro")
+            for folder in ("a", "b", "c")
+            for n in range(3)
+        ]
+        shards = [
+            Shard.shardBuild(str(temp_dir), songs, i, 2, songbook=True)
+            for i in (1, 2)
+        ]
+        folders = [{song.rsplit("/", 2)[1] for song in s} for s in shards]
+        assert not folders[0] & folders[1]
+        assert len(shards[0]) + len(shards[1]) == len(songs)
+
+    def test_recorded_timings_are_used(self, temp_dir):
+        """Test that costs come from the shared costs file."""
+        costsFile = str(temp_dir / "m.json")
+        timings = {"slow.chopro": 10.0, "a.chopro": 1.0, "b.chopro": 1.0}
+        Manifest.saveManifest(costsFile, {"songs": {}, "timings": timings})
+        songs = [str(temp_dir / unit) for unit in sorted(timings)]
+
+        first = Shard.shardBuild(str(temp_dir), songs, 1, 2, costs=costsFile)
+
+        assert first == [str(temp_dir / "slow.chopro")]
+
+    def test_target_manifest_is_not_consulted(self, temp_dir):
+        """Test that timings a shard recorded itself do not move songs."""
+        songs = [str(temp_dir / f"{name}.chopro") for name in "abcd"]
+        before = [Shard.shardBuild(str(temp_dir), songs, i, 2) for i in (1, 2)]
+        Manifest.saveManifest(
+            Manifest.manifestPath(str(temp_dir)),
+            {"songs": {}, "timings": {"a.chopro": 10.0}},
+        )
+
+        after = [Shard.shardBuild(str(temp_dir), songs, i, 2) for i in (1, 2)]
+
+        assert after == before
@@ -0,0 +1,58 @@
+"""Tests for Trace module."""
+
+import json
+
+from genpdf_butler import Report, Trace
+
+
+class TestTrace:
+    """Test cases for exporting the run timeline."""
+
+    def test_stats_path(self):
+        """Test that the profile is written beside the trace."""
+        assert Trace.statsPath("out/run.json") == "out/run.pstats"
+        assert Trace.statsPath("trace") == "trace.pstats"
+
+    def test_tracks_become_threads(self):
+        """Test that each track gets its own named thread."""
+        report = Report.newReport(trace=True)
+        origin = report["origin"]
+        Report.recordSpan(report, "discovery", "phase", origin, 0.5)
+        Report.recordSpan(
+            report, "a.pdf", "render", origin + 1, 2.0, "render worker 1"
+        )
+        Report.recordSpan(
+            report, "b.pdf", "render", origin + 1.5, 1.0, "render worker 2"
+        )
+
+        events = Trace.traceEvents(report)
+
+        names = {
+            event["args"]["name"]: event["tid"]
+            for event in events
+            if event["name"] == "thread_name"
+        }
+        assert names == {"main": 0, "render worker 1": 1, "render worker 2": 2}
+        spans = [event for event in events if event["ph"] == "X"]
+        assert [(span["name"], span["tid"]) for span in spans] == [
+            ("discovery", 0),
+            ("a.pdf", 1),
+            ("b.pdf", 2),
+        ]
+        assert spans[1]["ts"] == 1e6
+        assert spans[1]["dur"] == 2e6
+
+    def test_write_trace(self, temp_dir):
+        """Test that the file is a Chrome trace document."""
+        report = Report.newReport(trace=True)
+        with Report.phase(report, "render"):
+            pass
+        path = temp_dir / "trace.json"
+
+        Trace.writeTrace(report, str(path))
+
+        data = json.loads(path.read_text(encoding="utf-8"))
+        assert data["displayTimeUnit"] == "ms"
+        assert [e["name"] for e in data["traceEvents"] if e["ph"] == "X"] == [
+            "render"
+        ]
@@ -0,0 +1,132 @@
+"""Tests for Watch module."""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from genpdf_butler import Watch
+
+
+def _write(path, text):
+    """Write text and push the mtime forward so the change is visible."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    bump = time.time_ns() + 10**9 * (len(text) + 1)
+    os.utime(path, ns=(bump, bump))
+
+
+class TestSnapshots:
+    """Test cases for detecting changes between two scans."""
+
+    def test_diff_reports_changed_and_removed(self, temp_dir):
+        """Test added, modified and deleted songs."""
+        _write(temp_dir / "a.chopro", "a")
+        _write(temp_dir / "b.cho", "b")
+        _write(temp_dir / "notes.txt", "n")
+        before = Watch.snapshot(str(temp_dir))
+
+        _write(temp_dir / "a.chopro", "a changed")
+        _write(temp_dir / "c.chopro", "c")
+        (temp_dir / "b.cho").unlink()
+        after = Watch.snapshot(str(temp_dir))
+
+        assert Watch.diffSnapshots(before, after) == (
+            [temp_dir / "a.chopro", temp_dir / "c.chopro"],
+            [temp_dir / "b.cho"],
+        )
+
+
+class TestPollChanges:
+    """Test cases for the polling watcher."""
+
+    def test_burst_of_saves_is_one_batch(self, temp_dir):
+        """Test that saves inside the debounce window are batched."""
+        _write(temp_dir / "a.chopro", "a")
+        _write(temp_dir / "b.chopro", "b")
+        edits = [
+            lambda: _write(temp_dir / "a.chopro", "a1"),
+            lambda: _write(temp_dir / "b.chopro", "b22"),
+            lambda: _write(temp_dir / "a.chopro", "a333"),
+        ]
+
+        def _sleep(seconds):
+            if edits:
+                edits.pop(0)()
+
+        changes = Watch.pollChanges(
+            str(temp_dir), interval=0, debounce=0, sleep=_sleep
+        )
+        assert next(changes) == [temp_dir / "a.chopro", temp_dir / "b.chopro"]
+        assert not edits
+
+    def test_quiet_tree_yields_nothing_until_a_save(self, temp_dir):
+        """Test that polling continues until something changes."""
+        _write(temp_dir / "a.chopro", "a")
+        polls = []
+
+        def _sleep(seconds):
+            polls.append(seconds)
+            if len(polls) == 3:
+                _write(temp_dir / "new.cho", "new")
+
+        changes = Watch.pollChanges(
+            str(temp_dir), interval=1.0, debounce=0.25, sleep=_sleep
+        )
+        assert next(changes) == [temp_dir / "new.cho"]
+        assert polls == [1.0, 1.0, 1.0, 0.25]
+
+    def test_deleted_songs_are_not_rendered(self, temp_dir):
+        """Test that a song removed during the burst is dropped."""
+        _write(temp_dir / "a.chopro", "a")
+        edits = [
+            lambda: _write(temp_dir / "b.chopro", "b"),
+            lambda: (temp_dir / "b.chopro").unlink(),
+            lambda: _write(temp_dir / "a.chopro", "a1"),
+        ]
+
+        def _sleep(seconds):
+            if edits:
+                edits.pop(0)()
+
+        changes = Watch.pollChanges(
+            str(temp_dir), interval=0, debounce=0, sleep=_sleep
+        )
+        assert next(changes) == [temp_dir / "a.chopro"]
+
+
+class TestEventChanges:
+    """Test cases for the notification-driven watcher."""
+
+    def test_save_is_reported(self, temp_dir):
+        """Test that a saved song arrives through watchdog events."""
+        pytest.importorskip("watchdog")
+        _write(temp_dir / "a.chopro", "a")
+        changes = Watch.eventChanges(str(temp_dir), debounce=0.2)
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            batch = pool.submit(next, changes)
+            time.sleep(0.5)
+            _write(temp_dir / ".hidden" / "x.chopro", "x")
+            _write(temp_dir / "notes.txt", "n")
+            _write(temp_dir / "a.chopro", "a1")
+            assert batch.result(timeout=10) == [temp_dir / "a.chopro"]
+        changes.close()
+
+    def test_reading_a_song_is_not_a_change(self, temp_dir):
+        """Test that opening and reading a song yields no batch."""
+        pytest.importorskip("watchdog")
+        _write(temp_dir / "a.chopro", "a")
+        _write(temp_dir / "b.chopro", "b")
+        changes = Watch.eventChanges(str(temp_dir), debounce=0.2)
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            batch = pool.submit(next, changes)
+            time.sleep(0.5)
+            (temp_dir / "a.chopro").read_text(encoding="utf-8")
+            time.sleep(0.5)
+            _write(temp_dir / "b.chopro", "b1")
+            # Only the save arrives, not the read before it
+            assert batch.result(timeout=10) == [temp_dir / "b.chopro"]
+        changes.close()